@@ -1,10 +1,65 @@
 from django.contrib import admin
-from .models import Incident, Notification
+from .history import record_changes
+from .models import Incident, IncidentEvent, Notification
+from .utils import notify_reporters_status_change
 
-admin.site.register(Incident)
+
+def set_status_action(status, label):
+    """
+    Build an admin action that moves the selected incidents to `status`
+    and notifies all of their reporters in one batch.
+    """
+    def action(modeladmin, request, queryset):
+        changes = []
+        for incident in queryset.exclude(status=status):
+            old_status = incident.status
+            incident.status = status
+            incident.save(update_fields=['status'])
+            changes.append((incident, old_status, status))
+        record_changes([(incident, old_status, incident.assigned_to_id) for incident, old_status, _new in changes],
+                       actor=request.user)
+        notify_reporters_status_change(changes)
+        modeladmin.message_user(request, f"{len(changes)} incident(s) marked as {label}.")
+
+    action.__name__ = f'mark_{status}'
+    action.short_description = f'Mark selected incidents as {label}'
+    return action
+
+
+@admin.register(Incident)
+class IncidentAdmin(admin.ModelAdmin):
+    list_display = ['title', 'status', 'reporter', 'assigned_to', 'date']
+    list_filter = ['status']
+    search_fields = ['title']
+    actions = [set_status_action(status, label) for status, label in Incident.STATUS_CHOICES]
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change:
+            record_changes([(obj, form.initial.get('status'), form.initial.get('assigned_to'))], actor=request.user)
+
+
+@admin.register(IncidentEvent)
+class IncidentEventAdmin(admin.ModelAdmin):
+    """
+    Read only, the event log is append-only.
+    """
+    list_display = ['incident', 'previous_status', 'status', 'assigned_to', 'actor', 'timestamp']
+    list_filter = ['status']
+    list_select_related = ['incident', 'assigned_to', 'actor']
+    date_hierarchy = 'timestamp'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
     list_display = ['user', 'notification_type', 'message', 'is_read', 'created_at']
     list_filter = ['notification_type', 'is_read', 'created_at']
-    search_fields = ['user__username', 'message']
\ No newline at end of file
+    search_fields = ['user__username', 'message']
@@ -0,0 +1,136 @@
+from datetime import timedelta
+
+from django.db import connection
+
+from .models import Incident, IncidentEvent
+
+# Incident analytics from the event log (see history.py).
+#
+# Everything is worked out by the database in one statement per question:
+# window functions pair each event with the one before it (LAG) and rank the
+# durations (ROW_NUMBER / COUNT OVER), and the percentiles are picked out of
+# the ranking with conditional aggregates. Nothing is looped over in Python,
+# and the events are only ever read through their (incident, timestamp) and
+# (status, timestamp) indexes.
+#
+# Percentiles use the nearest-rank method: p90 is the smallest duration that
+# at least 90% of the durations are less than or equal to.
+
+PERCENTILES = (50, 90, 95)
+
+# seconds between two timestamp expressions, per database
+DURATION_SQL = {
+    'sqlite': '(julianday({later}) - julianday({earlier})) * 86400.0',
+    'postgresql': 'EXTRACT(EPOCH FROM ({later} - {earlier}))',
+    'mysql': 'TIMESTAMPDIFF(MICROSECOND, {earlier}, {later}) / 1000000.0',
+}
+
+
+def duration_sql(later, earlier):
+    try:
+        template = DURATION_SQL[connection.vendor]
+    except KeyError:
+        raise NotImplementedError(f"Incident analytics don't support {connection.vendor} yet")
+    return template.format(later=later, earlier=earlier)
+
+
+def summary_columns():
+    """
+    The aggregate columns every query below ends with, over a `ranked`
+    relation with `seconds`, `position` and `total` columns.
+    """
+    columns = ['COUNT(*)', 'AVG(seconds)']
+    columns += [f'MIN(CASE WHEN position >= {p / 100} * total THEN seconds END)' for p in PERCENTILES]
+    columns.append('MAX(seconds)')
+    return ', '.join(columns)
+
+
+def summary(row):
+    """
+    {'count': ..., 'mean': ..., 'p50': ..., ..., 'max': ...} with the durations as timedeltas.
+    """
+    count, *durations = row
+    keys = ['mean', *(f'p{p}' for p in PERCENTILES), 'max']
+    # rounded to the millisecond, julianday() arithmetic on SQLite is a few microseconds off
+    result = {'count': count}
+    for key, seconds in zip(keys, durations):
+        result[key] = None if seconds is None else timedelta(seconds=round(float(seconds), 3))
+    return result
+
+
+def tables():
+    qn = connection.ops.quote_name
+    return qn(IncidentEvent._meta.db_table), qn(Incident._meta.db_table), qn('timestamp')
+
+
+def time_in_state(since=None):
+    """
+    How long incidents stayed in each status before moving on, as
+    {status: summary}. Only incidents reported since `since` (all of them
+    without it) are counted, and the status an incident is in now isn't,
+    as it hasn't left it yet.
+    """
+    events, incidents, timestamp = tables()
+    # only status changes end a stay, events that just reassign the incident would split it
+    where, params = 'WHERE e.status <> e.previous_status', []
+    if since is not None:
+        where += f' AND e.incident_id IN (SELECT id FROM {incidents} WHERE date >= %s)'
+        params.append(connection.ops.adapt_datetimefield_value(since))
+
+    sql = f'''
+        WITH periods AS (
+            SELECT e.incident_id, e.previous_status AS status, e.{timestamp} AS left_at,
+                   LAG(e.{timestamp}) OVER (PARTITION BY e.incident_id ORDER BY e.{timestamp}, e.id) AS entered_at
+            FROM {events} e
+            {where}
+        ),
+        durations AS (
+            -- the first period of an incident started when it was reported
+            SELECT p.status, {duration_sql('p.left_at', 'COALESCE(p.entered_at, i.date)')} AS seconds
+            FROM periods p JOIN {incidents} i ON i.id = p.incident_id
+        ),
+        ranked AS (
+            SELECT status, seconds,
+                   ROW_NUMBER() OVER (PARTITION BY status ORDER BY seconds) AS position,
+                   COUNT(*) OVER (PARTITION BY status) AS total
+            FROM durations
+        )
+        SELECT status, {summary_columns()}
+        FROM ranked
+        GROUP BY status
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {status: summary(rest) for status, *rest in cursor.fetchall()}
+
+
+def resolution_times(since=None):
+    """
+    Time from being reported to first being resolved, over the incidents
+    resolved since `since` (all of them without it), as a summary.
+    """
+    events, incidents, timestamp = tables()
+    where, params = 'WHERE e.status = %s', ['resolved']
+    if since is not None:
+        where += f' AND e.{timestamp} >= %s'
+        params.append(connection.ops.adapt_datetimefield_value(since))
+
+    sql = f'''
+        WITH durations AS (
+            SELECT {duration_sql(f'MIN(e.{timestamp})', 'i.date')} AS seconds
+            FROM {events} e JOIN {incidents} i ON i.id = e.incident_id
+            {where}
+            GROUP BY i.id, i.date
+        ),
+        ranked AS (
+            SELECT seconds,
+                   ROW_NUMBER() OVER (ORDER BY seconds) AS position,
+                   COUNT(*) OVER () AS total
+            FROM durations
+        )
+        SELECT {summary_columns()}
+        FROM ranked
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return summary(cursor.fetchone())
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class IncidentReporterConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'incident_reporter'
+
+    def ready(self):
+        # registers the background job handlers (see jobs.py)
+        from . import images, utils  # noqa: F401
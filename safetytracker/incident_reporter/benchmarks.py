@@ -0,0 +1,234 @@
+import math
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import Profile
+
+from .management.commands.import_incidents import keep_given_dates
+from .models import Incident, Notification
+from .rollups import record_incidents_created
+from .slugs import BulkSlugAllocator
+
+# Benchmarks for the hot paths.
+#
+# seed_data() fills a database with made-up users, managers, incidents and
+# notifications (all with a "bench-" username, so they're easy to spot), and
+# run_scenario() replays one kind of request against it through Django's test
+# client, in process, timing each request and counting its queries. The
+# seed_benchmark_data and run_benchmarks commands wrap them, run_benchmarks
+# can save the results as a JSON baseline and compare later runs with it.
+#
+# Always point these at a scratch database (SAFETYTRACKER_DB_NAME=...).
+
+BENCH_PREFIX = 'bench-'
+
+HAZARDS = ['Slip', 'Spill', 'Trip', 'Fall', 'Cut', 'Burn', 'Forklift near miss', 'Chemical leak',
+           'Ladder collapse', 'Blocked exit', 'Electrical fault', 'Noise complaint']
+PLACES = ['warehouse', 'loading dock', 'office', 'canteen', 'car park', 'assembly line',
+          'stairwell', 'cold store', 'workshop', 'yard']
+STATUS_WEIGHTS = {'new': 2, 'in_progress': 2, 'resolved': 3, 'closed': 3}
+
+SCENARIOS = ['incident_new', 'incident_list', 'manager_dashboard', 'notifications_list', 'incident_update_status']
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of a sorted list.
+    """
+    if not values:
+        return None
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def seed_users(count, prefix, role):
+    users = User.objects.bulk_create([
+        User(username=f'{BENCH_PREFIX}{prefix}-{n}', password='!') for n in range(count)
+    ], batch_size=1000)
+    # bulk_create doesn't send post_save, which is what normally makes the profile
+    Profile.objects.bulk_create([Profile(user=user, role=role) for user in users], batch_size=1000)
+    return [user.pk for user in users]
+
+
+def seed_data(users, managers, incidents, notifications_per_incident=3, read_share=0.7, seed=0, batch_size=1000):
+    """
+    Create `users` employees, `managers` managers, `incidents` incidents
+    spread over the last year and `notifications_per_incident` notifications
+    to random managers for each, `read_share` of them already read.
+    The same `seed` always gives the same data. Returns what was created.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    statuses = list(STATUS_WEIGHTS)
+    weights = list(STATUS_WEIGHTS.values())
+
+    with transaction.atomic():
+        employee_ids = seed_users(users, 'user', 'employee')
+        manager_ids = seed_users(managers, 'manager', 'manager')
+
+    allocator = BulkSlugAllocator()
+    created_notifications = 0
+    with keep_given_dates():
+        for start in range(0, incidents, batch_size):
+            batch = []
+            for _ in range(min(batch_size, incidents - start)):
+                title = f'{rng.choice(HAZARDS)} in the {rng.choice(PLACES)}'
+                status = rng.choices(statuses, weights)[0]
+                batch.append(Incident(
+                    title = title,
+                    body = f'{title}, reported during the {rng.choice(["morning", "afternoon", "night"])} shift.',
+                    slug = allocator.allocate(title),
+                    status = status,
+                    date = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600)),
+                    reporter_id = rng.choice(employee_ids or manager_ids),
+                    assigned_to_id = rng.choice(manager_ids) if manager_ids and status != 'new' else None,
+                ))
+            with transaction.atomic():
+                Incident.objects.bulk_create(batch)
+                allocator.save_counters()
+                record_incidents_created(batch)
+                notifications = [
+                    Notification(
+                        user_id = rng.choice(manager_ids),
+                        incident = incident,
+                        message = f'New incident reported: {incident.title}',
+                        notification_type = 'new_incident',
+                        is_read = rng.random() < read_share,
+                    )
+                    for incident in batch if manager_ids
+                    for _ in range(notifications_per_incident)
+                ]
+                Notification.objects.bulk_create(notifications, batch_size=batch_size)
+                created_notifications += len(notifications)
+
+    # the notifications went in without bumping the unread counters, count them once at the end
+    unread = (
+        Notification.objects.filter(user_id=OuterRef('user_id'), is_read=False)
+        .order_by().values('user_id').annotate(unread=Count('id')).values('unread')
+    )
+    Profile.objects.filter(user_id__in=manager_ids).update(unread_notification_count=Coalesce(Subquery(unread), 0))
+
+    return {'users': len(employee_ids), 'managers': len(manager_ids), 'incidents': incidents,
+            'notifications': created_notifications}
+
+
+class ScenarioRunner:
+    """
+    Logged in test clients for a few of the seeded employees and managers,
+    and a request to make for each scenario.
+    """
+
+    clients_per_role = 5
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.employees = self.clients('employee')
+        self.managers = self.clients('manager')
+        if not self.employees or not self.managers:
+            raise ValueError('No benchmark users, run seed_benchmark_data first')
+        self.usernames = [client.username for client in self.employees]
+        self.incident_ids = list(Incident.objects.order_by('-date').values_list('id', flat=True)[:500])
+        if not self.incident_ids:
+            raise ValueError('No incidents, run seed_benchmark_data first')
+
+    def clients(self, role):
+        users = User.objects.filter(username__startswith=BENCH_PREFIX, profile__role=role).order_by('id')
+        clients = []
+        for user in users[:self.clients_per_role]:
+            client = Client()
+            client.force_login(user)
+            client.username = user.username
+            clients.append(client)
+        return clients
+
+    def incident_new(self):
+        title = f'{self.rng.choice(HAZARDS)} in the {self.rng.choice(PLACES)}'
+        data = {'title': title, 'body': f'{title}, benchmark report.'}
+        return self.rng.choice(self.employees), 'post', reverse('incident:new-incident'), data
+
+    def incident_list(self):
+        filters = self.rng.choice([
+            {},
+            {'status': self.rng.choice(list(STATUS_WEIGHTS))},
+            {'search': self.rng.choice(HAZARDS).split()[0].lower()},
+            {'reporter': self.rng.choice(self.usernames)},
+            {'status': 'resolved', 'search': self.rng.choice(PLACES).split()[0]},
+        ])
+        return self.rng.choice(self.managers + self.employees), 'get', reverse('incident:list'), filters
+
+    def manager_dashboard(self):
+        return self.rng.choice(self.managers), 'get', reverse('incident:manager-dashboard'), {}
+
+    def notifications_list(self):
+        return self.rng.choice(self.managers), 'get', reverse('incident:notifications'), {}
+
+    def incident_update_status(self):
+        incident = Incident.objects.values('slug', 'status', 'version').get(pk=self.rng.choice(self.incident_ids))
+        status = self.rng.choice([s for s in STATUS_WEIGHTS if s != incident['status']])
+        data = {'status': status, 'version': incident['version']}
+        return self.rng.choice(self.managers), 'post', reverse('incident:update-status', args=[incident['slug']]), data
+
+    def request(self, scenario):
+        return getattr(self, scenario)()
+
+
+def run_scenario(runner, scenario, requests):
+    """
+    Make `requests` requests for `scenario` one after the other. Returns
+    latency percentiles (ms), queries per request, throughput and errors,
+    just the counts when no requests were made.
+    """
+    if requests < 1:
+        return {'requests': 0, 'errors': 0}
+    latencies, queries, errors = [], [], 0
+    # the test client's host isn't in ALLOWED_HOSTS
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        started = time.perf_counter()
+        for _ in range(requests):
+            client, method, url, data = runner.request(scenario)
+            with CaptureQueriesContext(connection) as ctx:
+                request_started = time.perf_counter()
+                response = getattr(client, method)(url, data)
+                latencies.append(time.perf_counter() - request_started)
+            queries.append(len(ctx.captured_queries))
+            if response.status_code >= 400:
+                errors += 1
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'throughput': round(requests / elapsed, 1),
+        **{f'p{p}_ms': round(percentile(latencies, p) * 1000, 2) for p in PERCENTILES},
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Regressions of `results` against a `baseline` (both {scenario: metrics}):
+    p95 latency more than `tolerance` slower, or more queries per request.
+    Returns a list of messages, empty if nothing regressed.
+    """
+    regressions = []
+    for scenario, metrics in results.items():
+        before = baseline.get(scenario)
+        if before is None:
+            continue
+        if metrics['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{scenario}: p95 {metrics['p95_ms']}ms, was {before['p95_ms']}ms")
+        if metrics['queries_max'] > before['queries_max']:
+            regressions.append(f"{scenario}: up to {metrics['queries_max']} queries per request, was {before['queries_max']}")
+    return regressions
@@ -1,4 +1,8 @@
-from .models import Notification
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from safetytracker.static_build import vendored_static
+
+from .utils import get_unread_count
 
 # this file gets added into the TEMPLATES list in settings.py
 
@@ -6,8 +10,31 @@ from .models import Notification
 def unread_notifications(request):
     """
     Add unread notification count to all templates.
+
+    The count is read from the counter on the user's Profile, and only when a
+    template actually uses it (redirects and JSON responses never touch it).
+    """
+    def count():
+        if request.user.is_authenticated:
+            return get_unread_count(request.user)
+        return 0
+
+    return {
+        'unread_notifications_count': SimpleLazyObject(count),
+        # layout.html only opens the live notification stream when this is on
+        'live_notifications': settings.LIVE_NOTIFICATIONS,
+    }
+
+
+def fragment_cache(request):
+    """
+    Timeout for the {% cache %} blocks around incident cards and pages.
+    """
+    return {'fragment_cache_timeout': settings.INCIDENT_FRAGMENT_CACHE_TIMEOUT}
+
+
+def static_assets(request):
+    """
+    Whether layout.html can load Bootstrap from our own static files.
     """
-    if request.user.is_authenticated:
-        unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
-        return {'unread_notifications_count': unread_count}
-    return {'unread_notifications_count': 0}
\ No newline at end of file
+    return {'vendored_static': vendored_static()}
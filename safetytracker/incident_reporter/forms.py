@@ -1,6 +1,20 @@
 from django import forms
+from django.urls import reverse_lazy
 from . import models
+from .search import get_search_backend
 from django.contrib.auth.models import User
+from datetime import datetime
+from users.directory import manager_choices
+
+
+def use_manager_directory(field):
+    """
+    Point a ModelChoiceField at the managers: its dropdown is filled from the
+    cached directory (no query), submitted values are still checked against
+    the database.
+    """
+    field.queryset = User.objects.filter(profile__role='manager')
+    field.choices = [('', field.empty_label), *manager_choices()]
 
 class CreateIncident(forms.ModelForm):
     class Meta:
@@ -18,6 +32,10 @@ class CreateIncident(forms.ModelForm):
         }
 
 class UpdateIncidentStatus(forms.ModelForm):
+    # the version the manager was looking at, so save() can tell if somebody
+    # else updated the incident in the meantime
+    version = forms.IntegerField(widget=forms.HiddenInput)
+
     class Meta:
         model = models.Incident
         fields = ['status', 'assigned_to']
@@ -33,11 +51,20 @@ class UpdateIncidentStatus(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Only show users who are managers in the assigned_to dropdown
-        from users.models import Profile
-        manager_profiles = Profile.objects.filter(role='manager')
-        manager_users = [profile.user.id for profile in manager_profiles]
-        self.fields['assigned_to'].queryset = User.objects.filter(id__in=manager_users)
+        use_manager_directory(self.fields['assigned_to'])
         self.fields['assigned_to'].required = False
+        self.fields['version'].initial = self.instance.version
+
+    def save(self, commit=True):
+        """
+        Write only the fields that were changed, and only if the incident is
+        still at the submitted version (raises models.IncidentConflict if not).
+        """
+        incident = super().save(commit=False)
+        changed = [name for name in self.changed_data if name in self._meta.fields]
+        if commit and changed:
+            incident.save_if_unmodified(self.cleaned_data['version'], changed)
+        return incident
 
 
 class IncidentFilterForm(forms.Form):
@@ -61,12 +88,21 @@ class IncidentFilterForm(forms.Form):
         label='Status'
     )
     
+    # typed in, with suggestions from users:autocomplete (see main.js)
+    # rather than a <select> of every user
     reporter = forms.ModelChoiceField(
         required=False,
         queryset=User.objects.all(),
-        widget=forms.Select(attrs={'class': 'form-select'}),
+        to_field_name='username',
+        widget=forms.TextInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'All Reporters',
+            'autocomplete': 'off',
+            'list': 'reporter-options',
+            'data-autocomplete': reverse_lazy('users:autocomplete'),
+        }),
         label='Reporter',
-        empty_label='All Reporters'
+        error_messages={'invalid_choice': 'No user with that username.'},
     )
     
     assigned_to = forms.ModelChoiceField(
@@ -98,7 +134,44 @@ class IncidentFilterForm(forms.Form):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Filter assigned_to to only show managers
-        from users.models import Profile
-        manager_profiles = Profile.objects.filter(role='manager')
-        manager_users = [profile.user.id for profile in manager_profiles]
-        self.fields['assigned_to'].queryset = User.objects.filter(id__in=manager_users)
\ No newline at end of file
+        use_manager_directory(self.fields['assigned_to'])
+
+    def filter_queryset(self, incidents, ranked=False):
+        """
+        Apply the submitted filters to an Incident queryset.
+        Returns the queryset untouched if the form is not valid.
+        With `ranked`, a search orders the results best match first.
+        """
+        if not self.is_valid():
+            return incidents
+
+        search = self.cleaned_data.get('search')
+        status = self.cleaned_data.get('status')
+        reporter = self.cleaned_data.get('reporter')
+        assigned_to = self.cleaned_data.get('assigned_to')
+        date_from = self.cleaned_data.get('date_from')
+        date_to = self.cleaned_data.get('date_to')
+
+        if search:
+            # full text index lookup (see search.py), not a LIKE scan over every body
+            backend = get_search_backend()
+            incidents = backend.ranked(incidents, search) if ranked else backend.filter(incidents, search)
+
+        if status:
+            incidents = incidents.filter(status=status)
+
+        if reporter:
+            incidents = incidents.filter(reporter=reporter)
+
+        if assigned_to:
+            incidents = incidents.filter(assigned_to=assigned_to)
+
+        if date_from:
+            incidents = incidents.filter(date__gte=date_from)
+
+        if date_to:
+            # Add one day to include the entire end date
+            date_to_end = datetime.combine(date_to, datetime.max.time())
+            incidents = incidents.filter(date__lte=date_to_end)
+
+        return incidents
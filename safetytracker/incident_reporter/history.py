@@ -0,0 +1,37 @@
+from .models import IncidentEvent
+
+# The incident event log.
+#
+# Every change of an incident's status or assignee appends an IncidentEvent
+# with the status before and after, so analytics.py can work out how long
+# incidents spend in each state without parsing notification messages.
+# Incident.save() doesn't know who is saving, so the places that change
+# incidents call record_changes() themselves, in the same transaction.
+
+
+def incident_event(incident, old_status, old_assigned_to_id, actor=None):
+    """
+    An unsaved IncidentEvent for an incident that was just saved, or None if
+    neither its status nor its assignee changed.
+    """
+    if incident.status == old_status and incident.assigned_to_id == old_assigned_to_id:
+        return None
+    return IncidentEvent(
+        incident = incident,
+        previous_status = old_status,
+        status = incident.status,
+        assigned_to_id = incident.assigned_to_id,
+        actor = actor if actor is not None and actor.is_authenticated else None,
+    )
+
+
+def record_changes(changes, actor=None):
+    """
+    Log a batch of changes, given as (incident, old status, old assigned_to_id)
+    tuples, with one INSERT. Returns the events written.
+    """
+    events = [
+        incident_event(incident, old_status, old_assigned_to_id, actor)
+        for incident, old_status, old_assigned_to_id in changes
+    ]
+    return IncidentEvent.objects.bulk_create([event for event in events if event is not None])
@@ -0,0 +1,154 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .jobs import enqueue, job
+from .models import Incident
+
+# Banner photo processing.
+#
+# Uploads are usually straight off a phone: several megapixels, rotated by an
+# EXIF tag and carrying whatever else the camera wrote (GPS position included).
+# After an incident is saved the worker re-saves the photo without its EXIF
+# data, upright, and writes smaller WebP/JPEG copies at the widths in
+# settings.INCIDENT_BANNER_WIDTHS. They are recorded on Incident.banner_variants:
+#
+#     {'width': 1280, 'height': 960,
+#      'jpeg': {'320': 'banners/slip-320.jpg', ...},
+#      'webp': {'320': 'banners/slip-320.webp', ...}}
+#
+# and the {% banner_picture %} tag turns them into a <picture> with srcsets.
+
+# the shared placeholder every incident without a photo points at
+FALLBACK_BANNER = Incident._meta.get_field('banner').default
+
+BANNER_DIR = 'banners'
+
+FORMATS = {
+    'jpeg': ('JPEG', '.jpg'),
+    'webp': ('WEBP', '.webp'),
+}
+
+
+def output_formats():
+    # Pillow can be built without WebP support
+    return [name for name in FORMATS if name != 'webp' or features.check('webp')]
+
+
+def encode(image, format_name):
+    """
+    Encode an image without any metadata and return it as a ContentFile.
+    """
+    pil_format, _ext = FORMATS[format_name]
+    buffer = BytesIO()
+    # EXIF isn't copied unless passed in explicitly, so saving strips it
+    image.save(buffer, pil_format, quality=settings.INCIDENT_BANNER_QUALITY, optimize=True)
+    return ContentFile(buffer.getvalue())
+
+
+def open_upright(file):
+    """
+    Open an uploaded photo, rotated the way the camera meant it to be shown.
+    """
+    with Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        # JPEG has no alpha channel or palette
+        return image.convert('RGB')
+
+
+def resized(image, width):
+    height = round(image.height * width / image.width)
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def variant_widths(original_width):
+    """
+    The configured widths that are smaller than the photo itself (never upscale),
+    or just the photo's own width if it is smaller than all of them.
+    """
+    widths = [w for w in sorted(settings.INCIDENT_BANNER_WIDTHS) if w < original_width]
+    return widths or [original_width]
+
+
+def variant_files(variants):
+    return [name for format_name in FORMATS for name in variants.get(format_name, {}).values()]
+
+
+def process_banner(incident):
+    """
+    Clean up an incident's banner and generate its resized copies.
+    Returns the new banner_variants dict (empty for the fallback image).
+    """
+    original = incident.banner.name
+    if not original or original == FALLBACK_BANNER:
+        return {}
+
+    with default_storage.open(original, 'rb') as file:
+        image = open_upright(file)
+
+    stem = os.path.splitext(os.path.basename(original))[0]
+    # replace the upload with a copy that has no EXIF data left in it
+    cleaned = default_storage.save(f'{BANNER_DIR}/{stem}.jpg', encode(image, 'jpeg'))
+
+    variants = {'width': image.width, 'height': image.height}
+    for format_name in output_formats():
+        _pil_format, ext = FORMATS[format_name]
+        variants[format_name] = {
+            str(width): default_storage.save(
+                f'{BANNER_DIR}/{stem}-{width}{ext}', encode(resized(image, width), format_name)
+            )
+            for width in variant_widths(image.width)
+        }
+
+    # update() rather than save(): nothing else about the incident changed
+    # (updated is set by hand, update() skips auto_now and it keys the cached cards,
+    # and the version keys the page's ETag, pages pointing at the deleted upload go stale)
+    Incident.objects.filter(pk=incident.pk).update(
+        banner=cleaned, banner_variants=variants, updated=timezone.now(), version=F('version') + 1,
+    )
+    # the raw upload, and the copies from an earlier run if there was one
+    for name in [original, *variant_files(incident.banner_variants)]:
+        if name != cleaned and name not in variant_files(variants):
+            default_storage.delete(name)
+
+    incident.banner.name = cleaned
+    incident.banner_variants = variants
+    incident.version += 1
+    return variants
+
+
+@job('process_banner')
+def process_banner_job(incident_id, banner):
+    incident = Incident.objects.filter(pk=incident_id).first()
+    # skip if the incident is gone or its photo was replaced since the job was queued
+    if incident and incident.banner.name == banner:
+        process_banner(incident)
+
+
+def queue_banner_processing(incident):
+    """
+    Queue a freshly uploaded banner for processing by the worker.
+    """
+    banner = incident.banner.name
+    if banner and banner != FALLBACK_BANNER:
+        enqueue(
+            'process_banner', {'incident_id': incident.pk, 'banner': banner},
+            idempotency_key=f'banner:{incident.pk}:{banner}',
+        )
+
+
+def banner_srcset(incident, format_name):
+    """
+    A srcset attribute value ("url 320w, url 640w") for one of the formats.
+    """
+    variants = incident.banner_variants.get(format_name, {})
+    return ', '.join(
+        f'{default_storage.url(name)} {width}w'
+        for width, name in sorted(variants.items(), key=lambda item: int(item[0]))
+    )
@@ -0,0 +1,265 @@
+import json
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import HttpResponse, HttpResponseNotFound
+from django.template.backends.django import DjangoTemplates
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+# Per request profiling, off unless INSTRUMENTATION_ENABLED is set.
+#
+# InstrumentationMiddleware times every request and counts it by view for
+# the /metrics page. A sample of them (INSTRUMENTATION_SAMPLE_RATE) is
+# profiled in detail: every query goes through a connection.execute_wrapper
+# that adds up the database time and keeps the slowest statements, and the
+# InstrumentedDjangoTemplates backend adds up the time spent rendering.
+# Each profiled request is written as one JSON line to the
+# "safetytracker.requests" logger (a rotating file, see LOGGING).
+#
+# The totals on /metrics are kept in memory, so they are per process and
+# start again from zero when it restarts.
+
+logger = logging.getLogger('safetytracker.requests')
+
+# upper bounds (seconds) of the request duration histogram
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# statements longer than this are cut short in the log
+MAX_SQL_LENGTH = 500
+
+# the profile of the request being handled, None when it isn't sampled
+current_profile = ContextVar('current_profile', default=None)
+
+
+class RequestProfile:
+    """
+    Database and template time of one request.
+    """
+
+    def __init__(self, slowest):
+        self.slowest = slowest
+        self.db_time = 0.0
+        self.queries = 0
+        self.slow_queries = []   # (seconds, sql), slowest first
+        self.template_time = 0.0
+        self.rendering = 0       # templates being rendered, they can nest
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add_query(sql, time.perf_counter() - started)
+
+    def add_query(self, sql, duration):
+        self.db_time += duration
+        self.queries += 1
+        if len(self.slow_queries) < self.slowest or duration > self.slow_queries[-1][0]:
+            self.slow_queries.append((duration, sql))
+            self.slow_queries.sort(key=lambda query: query[0], reverse=True)
+            del self.slow_queries[self.slowest:]
+
+
+class TimedTemplate:
+    """
+    A template from InstrumentedDjangoTemplates, adds its render time to the
+    request's profile.
+    """
+
+    def __init__(self, template):
+        self.template = template
+
+    @property
+    def origin(self):
+        return self.template.origin
+
+    def render(self, context=None, request=None):
+        profile = current_profile.get()
+        if profile is None:
+            return self.template.render(context, request)
+        # a template tag may render another template, only count the outer one
+        profile.rendering += 1
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            profile.rendering -= 1
+            if not profile.rendering:
+                profile.template_time += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing renders for InstrumentationMiddleware.
+    Costs a context variable lookup per render when the request isn't profiled.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class Metrics:
+    """
+    Running totals per view, in the Prometheus text format for /metrics.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+    def view(self, name):
+        stats = self.views.get(name)
+        if stats is None:
+            stats = self.views[name] = {
+                'requests': 0, 'errors': 0, 'seconds': 0.0, 'buckets': [0] * len(DURATION_BUCKETS),
+                'sampled': 0, 'db_seconds': 0.0, 'queries': 0, 'template_seconds': 0.0,
+            }
+        return stats
+
+    def record(self, view, status, duration, profile=None):
+        with self.lock:
+            stats = self.view(view)
+            stats['requests'] += 1
+            stats['errors'] += status >= 500
+            stats['seconds'] += duration
+            bucket = bisect_left(DURATION_BUCKETS, duration)
+            if bucket < len(DURATION_BUCKETS):
+                stats['buckets'][bucket] += 1
+            if profile is not None:
+                stats['sampled'] += 1
+                stats['db_seconds'] += profile.db_time
+                stats['queries'] += profile.queries
+                stats['template_seconds'] += profile.template_time
+
+    def render(self):
+        with self.lock:
+            views = {name: {**stats, 'buckets': list(stats['buckets'])} for name, stats in self.views.items()}
+
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP safetytracker_{name} {help_text}')
+            lines.append(f'# TYPE safetytracker_{name} {kind}')
+            for suffix, labels, value in samples:
+                label_text = ','.join(f'{key}="{value}"' for key, value in labels.items())
+                lines.append(f'safetytracker_{name}{suffix}{{{label_text}}} {value}')
+
+        def per_view(key, suffix=''):
+            return [(suffix, {'view': view}, stats[key]) for view, stats in sorted(views.items())]
+
+        histogram = []
+        for view, stats in sorted(views.items()):
+            total = 0
+            for bound, count in zip(DURATION_BUCKETS, stats['buckets']):
+                total += count
+                histogram.append(('_bucket', {'view': view, 'le': bound}, total))
+            histogram.append(('_bucket', {'view': view, 'le': '+Inf'}, stats['requests']))
+            histogram.append(('_sum', {'view': view}, round(stats['seconds'], 6)))
+            histogram.append(('_count', {'view': view}, stats['requests']))
+
+        metric('request_duration_seconds', 'histogram', 'Time to handle a request.', histogram)
+        metric('request_errors_total', 'counter', 'Requests answered with a 5xx status.', per_view('errors'))
+        metric('sampled_requests_total', 'counter', 'Requests profiled in detail.', per_view('sampled'))
+        metric('sampled_db_seconds_total', 'counter', 'Database time of the profiled requests.',
+               [(s, l, round(v, 6)) for s, l, v in per_view('db_seconds')])
+        metric('sampled_queries_total', 'counter', 'Queries run by the profiled requests.', per_view('queries'))
+        metric('sampled_template_seconds_total', 'counter', 'Template render time of the profiled requests.',
+               [(s, l, round(v, 6)) for s, l, v in per_view('template_seconds')])
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match._func_path
+
+
+class InstrumentationMiddleware:
+    """
+    Times requests for /metrics and profiles a sample of them to the request log.
+
+    Goes first in MIDDLEWARE so the time of the other middleware is counted
+    too. Takes itself out of the stack when INSTRUMENTATION_ENABLED is off.
+    """
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.INSTRUMENTATION_SAMPLE_RATE
+        self.slowest = settings.INSTRUMENTATION_SLOWEST_QUERIES
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            started = time.perf_counter()
+            response = self.get_response(request)
+            metrics.record(view_name(request), response.status_code, time.perf_counter() - started)
+            return response
+
+        profile = RequestProfile(self.slowest)
+        token = current_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(profile):
+                response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        duration = time.perf_counter() - started
+
+        view = view_name(request)
+        metrics.record(view, response.status_code, duration, profile)
+        logger.info(json.dumps({
+            'time': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'wall_ms': round(duration * 1000, 2),
+            'db_ms': round(profile.db_time * 1000, 2),
+            'queries': profile.queries,
+            'template_ms': round(profile.template_time * 1000, 2),
+            # the statements only, parameters can hold personal details
+            'slow_queries': [
+                {'ms': round(seconds * 1000, 2), 'sql': sql[:MAX_SQL_LENGTH]}
+                for seconds, sql in profile.slow_queries
+            ],
+        }))
+        return response
+
+
+def metrics_view(request):
+    """
+    The request totals in the Prometheus text format. Scrapers send
+    INSTRUMENTATION_METRICS_TOKEN as a bearer token, staff can look in the
+    browser. A 404 while instrumentation is off.
+    """
+    if not settings.INSTRUMENTATION_ENABLED:
+        return HttpResponseNotFound()
+    token = settings.INSTRUMENTATION_METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    allowed = (
+        (token and constant_time_compare(authorization, f'Bearer {token}'))
+        or (request.user.is_authenticated and request.user.is_staff)
+    )
+    if not allowed:
+        return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
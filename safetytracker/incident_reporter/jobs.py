@@ -0,0 +1,138 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+# A small database backed job queue.
+#
+# Views call enqueue() and return straight away; `manage.py run_worker` picks
+# the jobs up and runs them. A job's handler and the "mark as done" update run
+# in the same transaction, so a job either has all of its effects or none of
+# them, and a crashed or failed job can simply be run again.
+#
+#     @job('notify_new_incident')
+#     def notify_new_incident_job(incident_id):
+#         ...
+#
+#     enqueue('notify_new_incident', {'incident_id': incident.pk},
+#             idempotency_key=f'new_incident:{incident.pk}')
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def job(name):
+    """
+    Decorator registering a function as the handler for jobs called `name`.
+    The job's payload is passed to it as keyword arguments.
+    """
+    def register(func):
+        registry[name] = func
+        return func
+    return register
+
+
+def enqueue(name, payload=None, idempotency_key=None, run_after=None):
+    """
+    Queue a job. If a job with the same idempotency key already exists it is
+    returned instead of queueing a second one.
+
+    With JOBS_RUN_EAGERLY the handler runs right away instead (handy for tests
+    and for setups without a worker).
+    """
+    payload = payload or {}
+    if name not in registry:
+        raise KeyError(f"No job handler registered for '{name}'")
+
+    if settings.JOBS_RUN_EAGERLY:
+        registry[name](**payload)
+        return None
+
+    try:
+        with transaction.atomic():
+            return Job.objects.create(
+                name = name,
+                payload = payload,
+                idempotency_key = idempotency_key,
+                max_attempts = settings.JOB_MAX_ATTEMPTS,
+                run_after = run_after or timezone.now(),
+            )
+    except IntegrityError:
+        if idempotency_key is None:
+            raise
+        return Job.objects.get(idempotency_key=idempotency_key)
+
+
+def runnable_jobs(now):
+    """
+    Jobs that are due, plus jobs stuck in 'running' whose worker has
+    presumably died (locked for longer than JOB_LOCK_TIMEOUT seconds).
+    """
+    stale = now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    return Job.objects.filter(
+        Q(status='pending', run_after__lte=now) | Q(status='running', locked_at__lt=stale)
+    )
+
+
+def claim_jobs(limit):
+    """
+    Lock up to `limit` due jobs for this worker and return them.
+
+    Each job is claimed with a conditional UPDATE, so when several workers
+    race for the same row only one of them gets it.
+    """
+    now = timezone.now()
+    candidates = list(runnable_jobs(now).order_by('run_after', 'id').values_list('id', flat=True)[:limit])
+
+    claimed = []
+    for job_id in candidates:
+        updated = runnable_jobs(now).filter(id=job_id).update(
+            status='running', locked_at=now, attempts=F('attempts') + 1
+        )
+        if updated:
+            claimed.append(job_id)
+    return list(Job.objects.filter(id__in=claimed).order_by('run_after', 'id'))
+
+
+def retry_delay(attempts):
+    """
+    Exponential backoff: JOB_RETRY_DELAY, then twice that, four times... capped at an hour.
+    """
+    return timedelta(seconds=min(settings.JOB_RETRY_DELAY * 2 ** (attempts - 1), 3600))
+
+
+def run_job(job):
+    """
+    Run a claimed job and record the outcome. Returns True on success.
+    """
+    handler = registry.get(job.name)
+    try:
+        if handler is None:
+            raise KeyError(f"No job handler registered for '{job.name}'")
+        with transaction.atomic():
+            handler(**job.payload)
+            Job.objects.filter(pk=job.pk).update(
+                status='done', finished_at=timezone.now(), locked_at=None, last_error=''
+            )
+        return True
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.error('Job %s failed for good after %s attempts:\n%s', job, job.attempts, error)
+            Job.objects.filter(pk=job.pk).update(
+                status='failed', finished_at=timezone.now(), locked_at=None, last_error=error
+            )
+        else:
+            logger.warning('Job %s failed (attempt %s), retrying:\n%s', job, job.attempts, error)
+            Job.objects.filter(pk=job.pk).update(
+                status='pending', run_after=timezone.now() + retry_delay(job.attempts),
+                locked_at=None, last_error=error,
+            )
+        return False
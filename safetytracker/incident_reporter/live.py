@@ -0,0 +1,208 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+# Live notifications.
+#
+# When notifications are created or read, an event is published for each user
+# it concerns. Browsers connected to the notification_stream view (Server-Sent
+# Events, needs the ASGI app in safetytracker/asgi.py) get them straight away
+# instead of reloading a page to see the new unread count:
+#
+#     notification   {"id": ..., "message": ..., "url": ...}   one more unread
+#     read           {"marked": 3}                              that many fewer
+#
+# The stream starts with the current unread count, so a client that
+# reconnects after missing some events is back in step.
+#
+# InProcessBroker only reaches clients connected to the same process. When the
+# notifications are sent by `manage.py run_worker` (a separate process), or the
+# site runs several ASGI processes, use RedisBroker.
+
+logger = logging.getLogger(__name__)
+
+
+class BaseBroker:
+    """
+    Interface every broker implements.
+    """
+
+    def publish(self, user_id, event):
+        """
+        Send `event` (a JSON serializable dict) to every stream `user_id` has open.
+        Called from ordinary sync code.
+        """
+        raise NotImplementedError
+
+    async def subscribe(self, user_id, heartbeat):
+        """
+        Async generator of events for `user_id`. Yields None once as soon as
+        it is listening, then None again after every `heartbeat` seconds
+        without an event so the caller can keep the connection alive.
+        """
+        raise NotImplementedError
+
+
+class InProcessBroker(BaseBroker):
+    """
+    Hands events to subscribers in this process through asyncio queues.
+    """
+
+    # events waiting for a slow client; after that they are dropped, and the
+    # client catches up from the unread count when it reconnects
+    queue_size = 100
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+
+    def publish(self, user_id, event):
+        with self.lock:
+            subscribers = list(self.subscribers.get(user_id, ()))
+        for loop, queue in subscribers:
+            # publish() runs on request / worker threads, the queue belongs to the event loop
+            loop.call_soon_threadsafe(self.offer, queue, event)
+
+    @staticmethod
+    def offer(queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning('Dropping live notification event, client is not keeping up')
+
+    async def subscribe(self, user_id, heartbeat):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.queue_size))
+        with self.lock:
+            self.subscribers[user_id].add(subscriber)
+        try:
+            yield None
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber[1].get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self.lock:
+                self.subscribers[user_id].discard(subscriber)
+                if not self.subscribers[user_id]:
+                    del self.subscribers[user_id]
+
+
+class RedisBroker(BaseBroker):
+    """
+    Redis pub/sub, one channel per user, for more than one process.
+    Needs the redis package and settings.NOTIFICATION_REDIS_URL.
+    """
+
+    channel_prefix = 'safetytracker:notifications:'
+
+    def __init__(self):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('RedisBroker needs the redis package (pip install redis)')
+        self.url = settings.NOTIFICATION_REDIS_URL
+        self.client = redis.Redis.from_url(self.url)
+
+    def channel(self, user_id):
+        return f'{self.channel_prefix}{user_id}'
+
+    def publish(self, user_id, event):
+        self.client.publish(self.channel(user_id), json.dumps(event))
+
+    async def subscribe(self, user_id, heartbeat):
+        import redis.asyncio
+
+        client = redis.asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(self.channel(user_id))
+        try:
+            yield None
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat)
+                yield json.loads(message['data']) if message else None
+        finally:
+            await pubsub.unsubscribe(self.channel(user_id))
+            await pubsub.aclose()
+            await client.aclose()
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    """
+    Return the configured broker (created once per process).
+    """
+    return import_string(settings.NOTIFICATION_BROKER)()
+
+
+def publish(user_id, event):
+    try:
+        get_broker().publish(user_id, event)
+    except Exception:
+        # live updates are a nicety, never fail the request / job over them
+        logger.exception('Could not publish live notification event')
+
+
+def notification_event(notification):
+    return {
+        'type': 'notification',
+        'id': notification.pk,
+        'message': notification.message,
+        'notification_type': notification.notification_type,
+        'url': reverse('incident:mark-notification-read', args=[notification.pk]),
+    }
+
+
+def publish_notifications(notifications):
+    """
+    Publish newly created notifications once the transaction that saved them commits.
+    """
+    if not settings.LIVE_NOTIFICATIONS:
+        return
+    events = [(n.user_id, notification_event(n)) for n in notifications]
+
+    def send():
+        for user_id, event in events:
+            publish(user_id, event)
+
+    transaction.on_commit(send)
+
+
+def publish_read(user_id, marked):
+    """
+    Publish that `marked` of a user's notifications were read, once committed.
+    """
+    if not settings.LIVE_NOTIFICATIONS or not marked:
+        return
+    transaction.on_commit(lambda: publish(user_id, {'type': 'read', 'marked': marked}))
+
+
+def sse_message(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def event_stream(user_id, unread_count):
+    """
+    The body of a user's notification stream. `unread_count` is a coroutine
+    function returning the user's current unread count.
+    """
+    listening = False
+    async for event in get_broker().subscribe(user_id, settings.NOTIFICATION_STREAM_HEARTBEAT):
+        if not listening:
+            # only read the count once we're subscribed, so nothing published
+            # in between gets lost
+            listening = True
+            yield 'retry: 5000\n' + sse_message({'type': 'unread', 'count': await unread_count()})
+        elif event is None:
+            yield ': keepalive\n\n'
+        else:
+            yield sse_message(event)
@@ -0,0 +1,102 @@
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+
+from incident_reporter.benchmarks import percentile
+from incident_reporter.models import Incident, SlugCounter
+from incident_reporter.utils import create_notifications
+
+# everything the benchmark creates is owned by these users, deleting them
+# at the end takes the incidents and notifications with them
+BENCH_USERNAME = 'bench-writes-{}'
+BENCH_TITLE = 'Bench write'
+
+
+def describe_database():
+    """
+    One line about the connection settings that matter for write throughput.
+    """
+    settings = connection.settings_dict
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            pragmas = {}
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout'):
+                cursor.execute(f'PRAGMA {pragma}')
+                pragmas[pragma] = cursor.fetchone()[0]
+        mode = settings['OPTIONS'].get('transaction_mode', 'DEFERRED')
+        return f"SQLite {settings['NAME']}: " + ', '.join(f'{k}={v}' for k, v in pragmas.items()) + f', {mode} transactions'
+    pool = settings['OPTIONS'].get('pool')
+    return f"{connection.vendor} {settings['NAME']}: CONN_MAX_AGE={settings['CONN_MAX_AGE']}, pool={pool or 'off'}"
+
+
+class Command(BaseCommand):
+    help = ('Measure how many incident reports (with their notification fan-out) per second '
+            'the configured database sustains with several concurrent writers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent writers.')
+        parser.add_argument('--seconds', type=float, default=10, help='How long to run.')
+        parser.add_argument('--fanout', type=int, default=5, help='Notifications written with each incident.')
+        parser.add_argument('--reconnect', action='store_true',
+                            help='Close the connection after every write, like requests without CONN_MAX_AGE.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(describe_database())
+        users = self.create_users(max(1, options['fanout']))
+        try:
+            results = self.run(users, options)
+        finally:
+            self.clean_up(users)
+
+        writes = sorted(latency for thread in results for latency in thread['latencies'])
+        errors = sum(thread['errors'] for thread in results)
+        elapsed = options['seconds']
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(writes)} writes in {elapsed:.1f}s with {options['threads']} threads: "
+            f"{len(writes) / elapsed:.1f} writes/s, {errors} failed (database locked)"
+        ))
+        if writes:
+            self.stdout.write('latency ms: ' + ', '.join(
+                f'p{p}={percentile(writes, p) * 1000:.1f}' for p in (50, 95, 99)
+            ))
+
+    def create_users(self, count):
+        return [User.objects.create_user(BENCH_USERNAME.format(n)) for n in range(count)]
+
+    def clean_up(self, users):
+        User.objects.filter(pk__in=[user.pk for user in users]).delete()
+        SlugCounter.objects.filter(base__startswith='bench-write').delete()
+
+    def run(self, users, options):
+        reporter = users[0]
+        user_ids = [user.pk for user in users][:options['fanout']]
+        deadline = time.monotonic() + options['seconds']
+        results = [{'latencies': [], 'errors': 0} for _ in range(options['threads'])]
+
+        def writer(result):
+            try:
+                while time.monotonic() < deadline:
+                    started = time.monotonic()
+                    try:
+                        # what incident_new + the notification job do
+                        with transaction.atomic():
+                            incident = Incident.objects.create(title=BENCH_TITLE, body='Benchmark', reporter=reporter)
+                            create_notifications(user_ids, incident, f'New incident reported: {incident.title}', 'new_incident')
+                    except OperationalError:
+                        result['errors'] += 1
+                    else:
+                        result['latencies'].append(time.monotonic() - started)
+                    if options['reconnect']:
+                        connection.close()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer, args=(result,)) for result in results]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
@@ -0,0 +1,27 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+
+from incident_reporter.images import FORMATS, encode, open_upright, output_formats, resized
+
+
+class Command(BaseCommand):
+    help = ('Save resized WebP/JPEG copies of the static images in STATIC_IMAGE_VARIANTS next to '
+            'them (e.g. images/hero.jpg -> images/hero-640.webp), for srcsets.')
+
+    def handle(self, *args, **options):
+        for name, widths in settings.STATIC_IMAGE_VARIANTS.items():
+            source = finders.find(name)
+            if source is None:
+                raise CommandError(f'{name} is not in the static files')
+            source = Path(source)
+            image = open_upright(source)
+            for width in widths:
+                # never upscale
+                copy = resized(image, width) if width < image.width else image
+                for format_name in output_formats():
+                    path = source.with_name(f'{source.stem}-{width}{FORMATS[format_name][1]}')
+                    path.write_bytes(encode(copy, format_name).read())
+                    self.stdout.write(f'{path.name}: {path.stat().st_size // 1024} KB')
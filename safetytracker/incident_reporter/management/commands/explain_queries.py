@@ -0,0 +1,106 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from incident_reporter.jobs import runnable_jobs
+from incident_reporter.models import Incident, IncidentEvent, IncidentRollup, Notification
+
+# plan lines that mean "read the whole table": SQLite prints "SCAN <table>"
+# (with "USING INDEX" when it walks an index instead), Postgres "Seq Scan on <table>"
+SQLITE_FULL_SCAN = re.compile(r'\bSCAN (\w+)(?!.*\bUSING\b)')
+POSTGRES_FULL_SCAN = re.compile(r'\bSeq Scan on (\w+)')
+
+
+def query_shapes(user_id, page_size=25):
+    """
+    The queries the views (and analytics.py) run against the incident,
+    notification, event and job tables, as (label, queryset) pairs. Keep in
+    step with views.py.
+    """
+    incidents = Incident.objects.select_related('reporter', 'assigned_to')
+    newest = ('-date', '-id')
+    rows = page_size + 1
+    now = timezone.now()
+
+    return [
+        ('incident_list', incidents.order_by(*newest)[:rows]),
+        ('incident_list, older page', incidents.filter(
+            Q(date__lt=now) | Q(date=now, id__lt=1)
+        ).order_by(*newest)[:rows]),
+        ('incident_list ?status=', incidents.filter(status='new').order_by(*newest)[:rows]),
+        ('incident_list ?reporter=', incidents.filter(reporter_id=user_id).order_by(*newest)[:rows]),
+        ('incident_list ?assigned_to=', incidents.filter(assigned_to_id=user_id).order_by(*newest)[:rows]),
+        ('incident_page', incidents.filter(slug='example')),
+        ('my_incidents', Incident.objects.filter(reporter_id=user_id).select_related('assigned_to').order_by(*newest)[:rows]),
+        ('manager_dashboard, new', incidents.filter(status='new').order_by('-date')[:5]),
+        ('manager_dashboard, in progress', incidents.filter(status='in_progress').order_by('-date')[:5]),
+        ('manager_dashboard, my assigned', incidents.filter(assigned_to_id=user_id).exclude(status='closed')),
+        ('incident_trends', IncidentRollup.objects.filter(day__gte=now.date(), day__lt=now.date())),
+        ('incident_trends, without rollups', Incident.objects.filter(date__gte=now, date__lt=now)),
+        ('notifications_list', Notification.objects.filter(user_id=user_id)),
+        ('mark_all_notifications_read', Notification.objects.filter(user_id=user_id, is_read=False)),
+        ('notifications_api', Notification.objects.filter(user_id=user_id, id__gt=0).order_by('id')[:rows]),
+        ('analytics, incident history', IncidentEvent.objects.filter(incident_id=1).order_by('timestamp', 'id')),
+        ('analytics, resolved since', IncidentEvent.objects.filter(status='resolved', timestamp__gte=now)),
+        ('user_autocomplete', User.objects.filter(username__gte='a', username__lt='a\U0010ffff').order_by('username')[:rows]),
+        ('run_worker, claim_jobs', runnable_jobs(now).order_by('run_after', 'id')[:8]),
+    ]
+
+
+def full_scans(plan, vendor):
+    """
+    Tables read with a full sequential scan according to an EXPLAIN plan.
+    """
+    pattern = {'sqlite': SQLITE_FULL_SCAN, 'postgresql': POSTGRES_FULL_SCAN}.get(vendor)
+    if pattern is None:
+        return []
+    return [match.group(1) for line in plan.splitlines() for match in pattern.finditer(line)]
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN on the queries behind each view and flag sequential scans.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to plug into per-user queries (default: the first user).')
+        parser.add_argument('--fail', action='store_true', help='Exit with an error if any query scans a whole table.')
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user called '{options['user']}'")
+        else:
+            user = User.objects.order_by('id').first()
+        user_id = user.pk if user else 0
+
+        vendor = connection.vendor
+        if vendor not in ('sqlite', 'postgresql'):
+            self.stdout.write(self.style.WARNING(f"Don't know how to read {vendor} plans, printing them as is."))
+        elif vendor == 'postgresql':
+            # with only a few rows Postgres prefers a seq scan no matter what, run
+            # this against a realistically sized database (and ANALYZE it first)
+            self.stdout.write('Note: Postgres picks plans by table size, small tables will always show Seq Scans.')
+
+        flagged = []
+        for label, queryset in query_shapes(user_id):
+            plan = queryset.explain()
+            scans = full_scans(plan, vendor)
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            for line in plan.splitlines():
+                self.stdout.write(f'    {line}')
+            if scans:
+                flagged.append(label)
+                self.stdout.write(self.style.WARNING(f"    -> sequential scan of {', '.join(scans)}"))
+
+        if not flagged:
+            self.stdout.write(self.style.SUCCESS('No sequential scans.'))
+            return
+
+        message = f"{len(flagged)} query shape(s) scan a whole table: {'; '.join(flagged)}"
+        if options['fail']:
+            raise CommandError(message)
+        self.stdout.write(self.style.WARNING(message))
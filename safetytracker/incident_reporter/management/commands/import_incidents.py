@@ -0,0 +1,220 @@
+import csv
+import json
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_slug
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from incident_reporter.models import Incident
+from incident_reporter.rollups import record_incidents_created
+from incident_reporter.slugs import BulkSlugAllocator
+
+STATUSES = {status for status, _label in Incident.STATUS_CHOICES}
+TITLE_LENGTH = Incident._meta.get_field('title').max_length
+SLUG_LENGTH = Incident._meta.get_field('slug').max_length
+
+# how many bad rows are printed before just counting them
+MAX_REPORTED_ERRORS = 20
+
+
+def read_records(file, input_format):
+    """
+    Yield (line number, dict) for each record in a CSV (with a header row)
+    or JSON Lines file, one at a time.
+    """
+    if input_format == 'csv':
+        reader = csv.DictReader(file)
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for line_number, line in enumerate(file, start=1):
+        if line.strip():
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as error:
+                yield line_number, error
+
+
+def text(record, column):
+    """
+    A text column of a record, '' when it is missing. JSON can hold anything
+    in it, numbers, lists and objects are a ValueError like any other bad value.
+    """
+    value = record.get(column)
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise ValueError(f'{column} is not text')
+    return value
+
+
+def parse_when(value):
+    """
+    Legacy dates come as '2019-03-04 13:05' or just '2019-03-04'.
+    """
+    if not value:
+        return None
+    value = str(value).strip()
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"can't read date '{value}'")
+        parsed = datetime.combine(day, datetime.min.time())
+    if timezone.is_aware(parsed):
+        parsed = timezone.make_naive(parsed)
+    return parsed
+
+
+@contextmanager
+def keep_given_dates():
+    """
+    Incident.date is auto_now_add, which would stamp every imported record
+    with today's date. Switch that off while importing.
+    """
+    field = Incident._meta.get_field('date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = 'Bulk load incidents from a CSV or JSON Lines file (columns: title, body, status, date, reporter, assigned_to, slug).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, or '-' for stdin.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Incidents inserted per transaction.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        batch_size = max(1, options['batch_size'])
+
+        self.users = {}
+        self.errors = 0
+        self.allocator = BulkSlugAllocator()
+
+        started = time.monotonic()
+        imported = 0
+        file = None
+        try:
+            file = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+            records = read_records(file, input_format)
+            with keep_given_dates():
+                while batch := list(islice(records, batch_size)):
+                    imported += self.import_batch(batch)
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(f'{imported} imported, {self.errors} skipped ({imported / elapsed:.0f} rows/s)')
+        except OSError as error:
+            raise CommandError(error)
+        except UnicodeDecodeError:
+            # the batches before it are in already
+            raise CommandError(f'{path} is not UTF-8 text, stopped after {imported} incidents')
+        finally:
+            if file is not None and file is not sys.stdin:
+                file.close()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} incidents in {elapsed:.1f}s ({imported / max(elapsed, 0.001):.0f} rows/s), '
+            f'skipped {self.errors}.'
+        ))
+
+    def import_batch(self, batch):
+        """
+        Insert one batch of records in a single transaction. Returns how many were inserted.
+        """
+        self.load_users(
+            record.get(column) for _line, record in batch if isinstance(record, dict)
+            for column in ('reporter', 'assigned_to')
+        )
+
+        with transaction.atomic():
+            incidents = []
+            for line, record in batch:
+                try:
+                    incidents.append(self.build_incident(record))
+                except ValueError as error:
+                    self.skip(line, error)
+
+            Incident.objects.bulk_create(incidents, batch_size=len(incidents) or 1)
+            self.allocator.save_counters()
+            # bulk_create doesn't send post_save, so do the dashboard rollups here
+            record_incidents_created(incidents)
+        return len(incidents)
+
+    def load_users(self, usernames):
+        """
+        Look up every username in the batch that hasn't been seen yet, in one query.
+        """
+        # anything that isn't a username is reported by build_incident()
+        missing = {name for name in usernames if isinstance(name, str) and name and name not in self.users}
+        if missing:
+            found = User.objects.filter(username__in=missing).in_bulk(field_name='username')
+            for name in missing:
+                self.users[name] = found.get(name)
+
+    def user(self, record, column):
+        username = text(record, column)
+        if not username:
+            return None
+        if self.users.get(username) is None:
+            raise ValueError(f"no user called '{username}' ({column})")
+        return self.users[username]
+
+    def build_incident(self, record):
+        if isinstance(record, ValueError):
+            # a line that isn't valid JSON
+            raise record
+        if not isinstance(record, dict):
+            raise ValueError('not a JSON object')
+
+        title = text(record, 'title').strip()
+        if not title:
+            raise ValueError('title is missing')
+        if len(title) > TITLE_LENGTH:
+            raise ValueError(f'title is longer than {TITLE_LENGTH} characters')
+
+        status = text(record, 'status') or 'new'
+        if status not in STATUSES:
+            raise ValueError(f"unknown status '{status}'")
+
+        # a slug the URLs can't take would break every page linking to the incident
+        slug = text(record, 'slug')
+        if slug:
+            try:
+                validate_slug(slug)
+            except ValidationError:
+                raise ValueError(f"slug '{slug}' may only have letters, numbers, underscores and hyphens")
+            if len(slug) > SLUG_LENGTH:
+                raise ValueError(f'slug is longer than {SLUG_LENGTH} characters')
+
+        return Incident(
+            title = title,
+            body = text(record, 'body'),
+            status = status,
+            date = parse_when(text(record, 'date')) or timezone.now(),
+            reporter = self.user(record, 'reporter'),
+            assigned_to = self.user(record, 'assigned_to'),
+            slug = self.allocator.allocate(title, slug or None),
+        )
+
+    def skip(self, line, error):
+        self.errors += 1
+        if self.errors <= MAX_REPORTED_ERRORS:
+            self.stderr.write(f'line {line}: {error}, skipped')
+        elif self.errors == MAX_REPORTED_ERRORS + 1:
+            self.stderr.write('more rows skipped, only counting them from here on')
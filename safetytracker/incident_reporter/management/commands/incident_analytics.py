@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from incident_reporter.analytics import PERCENTILES, resolution_times, time_in_state
+from incident_reporter.models import Incident
+
+
+def format_duration(duration):
+    if duration is None:
+        return '-'
+    hours = duration / timedelta(hours=1)
+    return f'{hours / 24:.1f}d' if hours >= 48 else f'{hours:.1f}h'
+
+
+class Command(BaseCommand):
+    help = 'Print time spent in each status and time to resolution, from the incident event log.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Only look at the last N days (default: everything).')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days']) if options['days'] else None
+        columns = ['mean', *(f'p{p}' for p in PERCENTILES), 'max']
+        header = f"{'':<14}{'count':>7}" + ''.join(f'{column:>9}' for column in columns)
+
+        def line(label, summary):
+            return f"{label:<14}{summary['count']:>7}" + ''.join(
+                f'{format_duration(summary[column]):>9}' for column in columns
+            )
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Time in status'))
+        self.stdout.write(header)
+        states = time_in_state(since)
+        for status, label in Incident.STATUS_CHOICES:
+            if status in states:
+                self.stdout.write(line(label, states[status]))
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Time to resolution'))
+        self.stdout.write(header)
+        self.stdout.write(line('Resolved', resolution_times(since)))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from incident_reporter.images import FALLBACK_BANNER, process_banner, queue_banner_processing
+from incident_reporter.models import Incident
+
+
+class Command(BaseCommand):
+    help = 'Strip EXIF data from incident photos and make their resized copies (for photos uploaded before the worker did this).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Redo photos that already have resized copies too.')
+        parser.add_argument('--queue', action='store_true', help='Queue the work for run_worker instead of doing it here.')
+
+    def handle(self, *args, **options):
+        incidents = Incident.objects.exclude(banner='').exclude(banner=FALLBACK_BANNER).order_by('id')
+        if not options['all']:
+            incidents = incidents.filter(banner_variants={})
+
+        done = 0
+        for incident in incidents.iterator():
+            if options['queue']:
+                queue_banner_processing(incident)
+            else:
+                process_banner(incident)
+            done += 1
+
+        verb = 'Queued' if options['queue'] else 'Processed'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {done} banner(s).'))
@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from incident_reporter.retention import compact_notifications, database_size, purge_notifications
+
+
+def megabytes(size):
+    return f'{size / 1024 / 1024:.1f} MB'
+
+
+class Command(BaseCommand):
+    help = 'Delete (and optionally archive) notifications older than their time to live, in small batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--read-days', type=int, default=settings.NOTIFICATION_READ_TTL_DAYS,
+                            help='Delete read notifications older than this many days.')
+        parser.add_argument('--unread-days', type=int, default=settings.NOTIFICATION_UNREAD_TTL_DAYS,
+                            help='Also delete unread notifications older than this many days.')
+        parser.add_argument('--batch-size', type=int, default=settings.NOTIFICATION_PURGE_BATCH_SIZE,
+                            help='Rows deleted per transaction.')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between batches.')
+        parser.add_argument('--archive', metavar='PATH', help='Append the deleted rows to this .jsonl.gz file first.')
+        parser.add_argument('--vacuum', action='store_true', help='Compact the database afterwards (VACUUM).')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be deleted.')
+
+    def handle(self, *args, **options):
+        size_before = database_size()
+        metrics = purge_notifications(
+            read_days = options['read_days'],
+            unread_days = options['unread_days'],
+            batch_size = max(1, options['batch_size']),
+            archive_path = options['archive'],
+            pause = options['pause'],
+            dry_run = options['dry_run'],
+        )
+
+        if options['dry_run']:
+            self.stdout.write(
+                f"Would delete {metrics['deleted']} notifications ({metrics['unread_deleted']} of them unread)."
+            )
+            return
+
+        rate = metrics['deleted'] / metrics['seconds'] if metrics['seconds'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {metrics['deleted']} notifications ({metrics['unread_deleted']} unread) in "
+            f"{metrics['batches']} batches, {metrics['seconds']:.1f}s ({rate:.0f} rows/s)."
+        ))
+        if options['archive']:
+            self.stdout.write(f"Archived {metrics['archived']} to {options['archive']}.")
+
+        if options['vacuum']:
+            compact_notifications()
+        size_after = database_size()
+        if size_before and size_after:
+            self.stdout.write(
+                f"Database: {megabytes(size_before['bytes'])} before, {megabytes(size_after['bytes'])} after, "
+                f"{megabytes(size_after['free_bytes'])} free for reuse."
+            )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from incident_reporter.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recount the manager dashboard rollups from the incident table.'
+
+    def handle(self, *args, **options):
+        rows = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} rollup rows.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from incident_reporter.search import create_search_index, get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Create or repair the incident full text search index and reindex every incident.'
+
+    def handle(self, *args, **options):
+        with connection.schema_editor(atomic=False) as schema_editor:
+            if not create_search_index(schema_editor):
+                raise CommandError(
+                    f'{connection.vendor} has no supported full text index, searches will use LIKE scans.'
+                )
+        backend = get_search_backend()
+        self.stdout.write(self.style.SUCCESS(f'Search index ready ({backend.__class__.__name__}).'))
@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from incident_reporter.benchmarks import PERCENTILES, SCENARIOS, ScenarioRunner, compare, run_scenario
+from incident_reporter.models import Incident
+
+
+class Command(BaseCommand):
+    help = ('Time the hot paths against a database filled by seed_benchmark_data: latency '
+            'percentiles, queries per request and throughput, optionally compared with a saved baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                            help='Scenario to run, can be repeated (default: all of them).')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=10, help='Untimed requests per scenario first.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--save', metavar='PATH', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', metavar='PATH', help='Fail if slower than the results saved in this file.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='How much slower p95 may get before it counts as a regression (0.2 = 20%%).')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1.')
+        if options['warmup'] < 0:
+            raise CommandError('--warmup must not be negative.')
+        try:
+            runner = ScenarioRunner(seed=options['seed'])
+        except ValueError as error:
+            raise CommandError(error)
+
+        columns = ['requests', 'errors', 'throughput', *(f'p{p}_ms' for p in PERCENTILES), 'queries_mean', 'queries_max']
+        self.stdout.write(f"{'scenario':<24}" + ''.join(f'{column:>14}' for column in columns))
+
+        results = {}
+        for scenario in options['scenario'] or SCENARIOS:
+            # fill caches and compile templates before timing anything
+            if options['warmup']:
+                run_scenario(runner, scenario, options['warmup'])
+            results[scenario] = metrics = run_scenario(runner, scenario, options['requests'])
+            self.stdout.write(f'{scenario:<24}' + ''.join(f'{metrics[column]:>14}' for column in columns))
+
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump({
+                    'created': timezone.now().isoformat(),
+                    'database': connection.vendor,
+                    'incidents': Incident.objects.count(),
+                    'scenarios': results,
+                }, file, indent=2)
+            self.stdout.write(f"Saved to {options['save']}")
+
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+            regressions = compare(results, baseline['scenarios'], options['tolerance'])
+            if regressions:
+                raise CommandError('Slower than the baseline:\n  ' + '\n  '.join(regressions))
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['compare']}."))
@@ -0,0 +1,53 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from incident_reporter.jobs import claim_jobs, run_job
+
+
+def run_in_thread(job):
+    """
+    Run one job on a pool thread. Each thread gets its own database
+    connection, which is closed again once the job is finished.
+    """
+    try:
+        return run_job(job)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (notifications etc.) until stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Jobs to run in parallel.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit as soon as the queue is empty.')
+
+    def handle(self, *args, **options):
+        threads = max(1, options['threads'])
+        succeeded = failed = 0
+
+        self.stdout.write(f'Worker started with {threads} thread(s).')
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            try:
+                while True:
+                    close_old_connections()
+                    jobs = claim_jobs(limit=threads * 2)
+                    if not jobs:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll_interval'])
+                        continue
+
+                    for ok in pool.map(run_in_thread, jobs):
+                        if ok:
+                            succeeded += 1
+                        else:
+                            failed += 1
+            except KeyboardInterrupt:
+                self.stdout.write('Stopping worker...')
+
+        self.stdout.write(self.style.SUCCESS(f'Worker finished: {succeeded} succeeded, {failed} failed.'))
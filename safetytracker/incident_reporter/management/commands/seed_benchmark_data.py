@@ -0,0 +1,32 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from incident_reporter.benchmarks import BENCH_PREFIX, seed_data
+
+
+class Command(BaseCommand):
+    help = 'Fill a scratch database with made-up users, incidents and notifications for run_benchmarks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Employees.')
+        parser.add_argument('--managers', type=int, default=20)
+        parser.add_argument('--incidents', type=int, default=20000)
+        parser.add_argument('--notifications', type=int, default=3, help='Notifications per incident.')
+        parser.add_argument('--seed', type=int, default=0, help='Same seed, same data.')
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=BENCH_PREFIX).exists():
+            raise CommandError('This database has already been seeded, start from an empty one.')
+
+        started = time.monotonic()
+        created = seed_data(
+            users=options['users'],
+            managers=options['managers'],
+            incidents=options['incidents'],
+            notifications_per_incident=options['notifications'],
+            seed=options['seed'],
+        )
+        summary = ', '.join(f'{count} {name}' for name, count in created.items())
+        self.stdout.write(self.style.SUCCESS(f'Created {summary} in {time.monotonic() - started:.1f}s.'))
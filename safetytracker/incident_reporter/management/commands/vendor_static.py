@@ -0,0 +1,41 @@
+import re
+from pathlib import Path
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# The front-end libraries layout.html uses, pinned, saved under static/vendor/
+# so the site works without reaching the CDN. Run once on a machine with
+# internet access and commit the files; collectstatic then hashes, purges
+# and compresses them like everything else (see safetytracker/static_build.py).
+CDN = 'https://cdn.jsdelivr.net/npm/'
+VENDOR_FILES = {
+    'vendor/bootstrap/bootstrap.min.css': 'bootstrap@5.3.2/dist/css/bootstrap.min.css',
+    'vendor/bootstrap/bootstrap.bundle.min.js': 'bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js',
+    'vendor/bootstrap-icons/bootstrap-icons.min.css': 'bootstrap-icons@1.11.1/font/bootstrap-icons.min.css',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff2': 'bootstrap-icons@1.11.1/font/fonts/bootstrap-icons.woff2',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff': 'bootstrap-icons@1.11.1/font/fonts/bootstrap-icons.woff',
+}
+# the .map files aren't vendored, and collectstatic fails on references to missing files
+SOURCE_MAP = re.compile(rb'\n?/[*/]# sourceMappingURL=\S+(?: \*/)?')
+
+
+class Command(BaseCommand):
+    help = 'Download the pinned Bootstrap and Bootstrap Icons files into static/vendor/.'
+
+    def handle(self, *args, **options):
+        target = Path(settings.BASE_DIR) / 'static'
+        for name, package_path in VENDOR_FILES.items():
+            try:
+                with urlopen(CDN + package_path, timeout=30) as response:
+                    content = response.read()
+            except OSError as e:
+                raise CommandError(f'Could not download {package_path}: {e}')
+            if name.endswith(('.css', '.js')):
+                content = SOURCE_MAP.sub(b'', content)
+            path = target / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(content)
+            self.stdout.write(f'{name}: {len(content) // 1024} KB')
+        self.stdout.write(self.style.SUCCESS('Vendored. Commit static/vendor/ and layout.html will use it.'))
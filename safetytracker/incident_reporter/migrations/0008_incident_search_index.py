@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    from incident_reporter.search import create_search_index
+    create_search_index(schema_editor)
+
+
+def drop_index(apps, schema_editor):
+    from incident_reporter.search import drop_search_index
+    drop_search_index(schema_editor)
+
+
+# Full text search index for Incident.title/body (see incident_reporter/search.py).
+# SQLite gets an FTS5 table kept in sync by triggers, Postgres a generated
+# tsvector column with a GIN index. Other databases are left alone.
+
+class Migration(migrations.Migration):
+
+    # not atomic: if SQLite lacks FTS5 the failed statement must not abort the
+    # rest of the migration run, we just fall back to LIKE searches
+    atomic = False
+
+    dependencies = [
+        ('incident_reporter', '0007_notification'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
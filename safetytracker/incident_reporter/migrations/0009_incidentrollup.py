@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def fill_rollups(apps, schema_editor):
+    """
+    Count the incidents that already exist into the new rollup table.
+    """
+    Incident = apps.get_model('incident_reporter', 'Incident')
+    IncidentRollup = apps.get_model('incident_reporter', 'IncidentRollup')
+    grouped = (
+        Incident.objects.order_by()
+        .annotate(day=TruncDate('date'))
+        .values('day', 'status', 'reporter_id')
+        .annotate(incidents=Count('id'))
+    )
+    IncidentRollup.objects.bulk_create([
+        IncidentRollup(day=row['day'], status=row['status'], reporter_id=row['reporter_id'], incident_count=row['incidents'])
+        for row in grouped
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('incident_reporter', '0008_incident_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IncidentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('new', 'New'), ('in_progress', 'In Progress'), ('resolved', 'Resolved'), ('closed', 'Closed')], max_length=20)),
+                ('incident_count', models.IntegerField(default=0)),
+                ('reporter', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'status'], name='rollup_day_status_idx')],
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
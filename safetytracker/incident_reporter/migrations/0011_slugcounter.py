@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('incident_reporter', '0010_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlugCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base', models.CharField(max_length=50, unique=True)),
+                ('last_suffix', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:21
+
+from django.db import migrations, models
+
+
+def repair_search_index(apps, schema_editor):
+    # SQLite adds the column by rebuilding the incident table, which drops the
+    # full text search triggers, so put them back
+    from incident_reporter.search import create_search_index
+    create_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('incident_reporter', '0012_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='incident',
+            name='banner_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(repair_search_index, migrations.RunPython.noop),
+    ]
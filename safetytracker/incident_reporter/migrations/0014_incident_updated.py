@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:33
+
+from django.db import migrations, models
+
+
+def repair_search_index(apps, schema_editor):
+    # adding the column rebuilds the incident table on SQLite, which drops the
+    # full text search triggers (see 0013)
+    from incident_reporter.search import create_search_index
+    create_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('incident_reporter', '0013_incident_banner_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='incident',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(repair_search_index, migrations.RunPython.noop),
+    ]
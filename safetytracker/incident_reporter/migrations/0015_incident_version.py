@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+def repair_search_index(apps, schema_editor):
+    # adding the column rebuilds the incident table on SQLite, which drops the
+    # full text search triggers (see 0013)
+    from incident_reporter.search import create_search_index
+    create_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('incident_reporter', '0014_incident_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='incident',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.RunPython(repair_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:19
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_rollups(apps, schema_editor):
+    # racing creates could leave several rows for one key, fold them into the oldest
+    IncidentRollup = apps.get_model('incident_reporter', 'IncidentRollup')
+    duplicates = (
+        IncidentRollup.objects.values('day', 'status', 'reporter_id')
+        .annotate(rows=Count('id'), first=Min('id'), total=Sum('incident_count'))
+        .filter(rows__gt=1)
+    )
+    for key in duplicates:
+        rows = IncidentRollup.objects.filter(day=key['day'], status=key['status'], reporter_id=key['reporter_id'])
+        rows.exclude(pk=key['first']).delete()
+        rows.update(incident_count=key['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('incident_reporter', '0016_incident_event'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_rollups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='incidentrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('reporter__isnull', False)), fields=('day', 'status', 'reporter'), name='rollup_unique_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='incidentrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('reporter__isnull', True)), fields=('day', 'status'), name='rollup_unique_key_no_reporter'),
+        ),
+    ]
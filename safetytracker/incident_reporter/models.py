@@ -1,6 +1,19 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
-from django.utils.text import slugify
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+# how many slugs Incident.save() tries before giving up on a unique one
+SLUG_ATTEMPTS = 5
+
+
+class IncidentConflict(Exception):
+    """
+    Raised by Incident.save_if_unmodified() when somebody else saved the
+    incident after it was loaded.
+    """
+
 
 class Incident(models.Model):
     """
@@ -18,27 +31,93 @@ class Incident(models.Model):
     body = models.TextField()
     slug = models.SlugField(unique=True)
     date = models.DateTimeField(auto_now_add=True)
+    # bumped on every save(), part of the cache key of the incident's cached fragments
+    updated = models.DateTimeField(auto_now=True)
+    # goes up by one on every save(), see save_if_unmodified()
+    version = models.PositiveIntegerField(default=1, editable=False)
     banner = models.ImageField(default='fallback.jpg', blank=True)
+    # resized copies of the banner made by the worker, see images.py
+    banner_variants = models.JSONField(default=dict, blank=True, editable=False)
     reporter = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='reported_incidents')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='new')
     assigned_to = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_incidents')
 
     def __str__(self):
         return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember what was loaded so the post_save hooks can tell what changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
     
     def save(self, *args, **kwargs):
-        if not self.slug:
-            base_slug = slugify(self.title)
-            slug = base_slug
-            counter = 1
-            while Incident.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
-        super().save(*args, **kwargs)
+        if not self._state.adding:
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version', 'updated'}
+            try:
+                super().save(*args, **kwargs)
+            except BaseException:
+                self.version -= 1
+                raise
+            return
+
+        if self.slug:
+            super().save(*args, **kwargs)
+            return
+
+        # the slug counter hands out base, base-1, base-2... without probing
+        # every candidate, but a slug typed in by hand (e.g. in the admin) can
+        # still collide, so retry with the next number if the insert fails
+        from .slugs import allocate_slug
+        for attempt in range(SLUG_ATTEMPTS):
+            self.slug = allocate_slug(self.title)
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                if attempt == SLUG_ATTEMPTS - 1 or not Incident.objects.filter(slug=self.slug).exists():
+                    self.slug = ''
+                    raise
+
+    def save_if_unmodified(self, version, update_fields):
+        """
+        Write `update_fields` with a single UPDATE ... WHERE version = `version`,
+        so it only goes through if nobody else has saved the incident since
+        it was at that version. Raises IncidentConflict if somebody has.
+        """
+        self._expected_version = version
+        try:
+            # a savepoint, so a conflict doesn't break the caller's transaction
+            with transaction.atomic():
+                self.save(update_fields=update_fields)
+        finally:
+            del self._expected_version
+
+    def _do_update(self, base_qs, *args, **kwargs):
+        expected_version = getattr(self, '_expected_version', None)
+        if expected_version is None:
+            return super()._do_update(base_qs, *args, **kwargs)
+        if not super()._do_update(base_qs.filter(version=expected_version), *args, **kwargs):
+            raise IncidentConflict(f'{self} was changed by somebody else (expected version {expected_version})')
+        return True
     
     class Meta:
         ordering = ['-date']
+        # one index per query shape in views.py, check them with `manage.py explain_queries`
+        indexes = [
+            # incident_list: newest first, paged on (date, id)
+            models.Index(fields=['date', 'id'], name='incident_date_id_idx'),
+            # status filter on the list + the dashboard's newest "new"/"in progress" slices
+            models.Index(fields=['status', 'date', 'id'], name='incident_status_date_idx'),
+            # my_incidents and the list's reporter filter
+            models.Index(fields=['reporter', 'date', 'id'], name='incident_reporter_date_idx'),
+            # dashboard "my assigned incidents" (assigned_to = me, status != closed)
+            models.Index(fields=['assigned_to', 'status'], name='incident_assigned_status_idx'),
+        ]
 
 
 class Notification(models.Model):
@@ -61,6 +140,154 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # notifications_list: a user's notifications, newest first
+            models.Index(fields=['user', 'created_at'], name='notif_user_created_idx'),
+            # unread notifications only (mark all read, unread counts), a small partial index
+            models.Index(
+                fields=['user', 'created_at'], condition=models.Q(is_read=False), name='notif_user_unread_idx',
+            ),
+        ]
     
     def __str__(self):
-        return f"{self.user.username} - {self.message}"
\ No newline at end of file
+        return f"{self.user.username} - {self.message}"
+
+
+class SlugCounter(models.Model):
+    """
+    The highest numeric suffix handed out so far for each base slug,
+    e.g. base "slip-in-warehouse" with last_suffix 3 means "slip-in-warehouse-3"
+    is taken and the next incident gets "slip-in-warehouse-4". 0 means only the
+    bare base slug has been used.
+    """
+
+    base = models.CharField(max_length=50, unique=True)
+    last_suffix = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.base} ({self.last_suffix})"
+
+
+class IncidentRollup(models.Model):
+    """
+    Pre-computed incident counts per day, status and reporter.
+
+    Kept up to date by the signal handlers below, so the manager dashboard can
+    read a handful of small rows instead of counting the incident table.
+    Rebuild from scratch with `manage.py rebuild_incident_rollups`.
+    """
+
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Incident.STATUS_CHOICES)
+    reporter = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    incident_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['day', 'status'], name='rollup_day_status_idx'),
+        ]
+        # one row per key, NULLs never clash in a unique index so incidents
+        # without a reporter get a constraint of their own
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'status', 'reporter'], condition=models.Q(reporter__isnull=False),
+                name='rollup_unique_key',
+            ),
+            models.UniqueConstraint(
+                fields=['day', 'status'], condition=models.Q(reporter__isnull=True),
+                name='rollup_unique_key_no_reporter',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.status} {self.reporter_id}: {self.incident_count}"
+
+
+class IncidentEvent(models.Model):
+    """
+    One row per change of an incident's status or assignee, written next to
+    the change by incident_update_status and the admin and never updated
+    afterwards. The first state of an incident is implied by Incident.date
+    and the `previous_status` of its first event. See analytics.py.
+    """
+
+    incident = models.ForeignKey(Incident, on_delete=models.CASCADE, related_name='events')
+    previous_status = models.CharField(max_length=20, choices=Incident.STATUS_CHOICES)
+    status = models.CharField(max_length=20, choices=Incident.STATUS_CHOICES)
+    assigned_to = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # who made the change (None for scripts)
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # an incident's history in order, and the window functions in analytics.py
+            models.Index(fields=['incident', 'timestamp'], name='event_incident_time_idx'),
+            # "everything resolved since ..."
+            models.Index(fields=['status', 'timestamp'], name='event_status_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.incident_id}: {self.previous_status} -> {self.status} at {self.timestamp}"
+
+
+class Job(models.Model):
+    """
+    A piece of background work (e.g. sending notifications), queued by the
+    views and run by `manage.py run_worker`. See jobs.py.
+    """
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    # enqueueing twice with the same key only ever creates one job
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+@receiver(post_save, sender=Incident)
+def incident_saved(sender, instance, created, raw=False, **kwargs):
+    """
+    Keep the rollup counts in step with incidents as they are created or change status.
+    """
+    if raw:
+        return
+    from .rollups import record_incident_saved
+    record_incident_saved(instance, created)
+
+
+@receiver(post_delete, sender=Incident)
+def incident_deleted(sender, instance, **kwargs):
+    from .rollups import record_incident_deleted
+    record_incident_deleted(instance)
+
+
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, **kwargs):
+    """
+    Deleting an unread notification (e.g. when its incident is deleted) takes it off the counter.
+    """
+    if not instance.is_read:
+        from .utils import adjust_unread_count
+        adjust_unread_count([instance.user_id], -1)
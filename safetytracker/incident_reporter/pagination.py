@@ -0,0 +1,193 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+# Keyset (cursor) pagination for incident listings.
+#
+# Instead of OFFSET/LIMIT (which gets slower the deeper you page) we remember
+# the (date, id) of the last row on the page and ask the database for rows
+# that sort after it. The cost of a page stays the same no matter how many
+# incidents are in the table.
+#
+# Search results are the exception: they come best match first, and a rank
+# isn't something a cursor can point past, so RankedPaginator pages them by
+# offset. A search narrows the rows down far enough for that to stay cheap.
+
+
+def encode_cursor(incident, reverse=False):
+    """
+    Build an opaque, URL safe cursor token pointing at an incident.
+    """
+    payload = {'d': incident.date.isoformat(), 'i': incident.pk, 'r': reverse}
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Turn a cursor token back into (date, id, reverse).
+    Returns None if the token is missing or has been tampered with.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload['d']), int(payload['i']), bool(payload.get('r'))
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        return None
+
+
+def encode_offset(offset):
+    """
+    Cursor token for RankedPaginator, pointing `offset` rows into the results.
+    """
+    raw = json.dumps({'o': offset}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_offset(token):
+    """
+    Turn a RankedPaginator cursor token back into an offset, 0 for the first
+    page if the token is missing or isn't one.
+    """
+    if not token:
+        return 0
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        return max(int(json.loads(base64.urlsafe_b64decode(padded.encode()))['o']), 0)
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        return 0
+
+
+def get_page_size(request):
+    """
+    Read the page size from ?page_size=, clamped to the configured maximum.
+    """
+    default = getattr(settings, 'INCIDENT_PAGE_SIZE', 25)
+    maximum = getattr(settings, 'INCIDENT_MAX_PAGE_SIZE', 100)
+    try:
+        size = int(request.GET.get('page_size', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
+
+
+class KeysetPage:
+    """
+    One page of results plus the cursors needed to move forwards/backwards.
+    """
+
+    def __init__(self, object_list, next_cursor, prev_cursor, count, count_is_approximate, page_size, ranked=False):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.count = count
+        self.count_is_approximate = count_is_approximate
+        self.page_size = page_size
+        # best match first rather than newest first
+        self.ranked = ranked
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Paginate an Incident queryset newest first, keyed on (date, id).
+
+    count_mode can be:
+        'exact'       - run a full COUNT(*) over the filtered queryset
+        'approximate' - count at most INCIDENT_APPROXIMATE_COUNT_LIMIT rows
+        'none'        - skip counting entirely
+    """
+
+    def __init__(self, queryset, page_size=25, count_mode=None):
+        self.queryset = queryset
+        self.page_size = page_size
+        self.count_mode = count_mode or getattr(settings, 'INCIDENT_COUNT_MODE', 'exact')
+
+    def get_page(self, token=None):
+        cursor = decode_cursor(token)
+
+        if cursor is None:
+            rows = list(self.queryset.order_by('-date', '-id')[:self.page_size + 1])
+            has_more = len(rows) > self.page_size
+            rows = rows[:self.page_size]
+            has_next, has_previous = has_more, False
+        else:
+            date, pk, reverse = cursor
+            if reverse:
+                # walking backwards: grab the rows just *newer* than the cursor
+                # in ascending order, then flip them back to newest first
+                rows = list(
+                    self.queryset
+                    .filter(Q(date__gt=date) | Q(date=date, id__gt=pk))
+                    .order_by('date', 'id')[:self.page_size + 1]
+                )
+                has_more = len(rows) > self.page_size
+                rows = rows[:self.page_size]
+                rows.reverse()
+                has_next, has_previous = True, has_more
+            else:
+                rows = list(
+                    self.queryset
+                    .filter(Q(date__lt=date) | Q(date=date, id__lt=pk))
+                    .order_by('-date', '-id')[:self.page_size + 1]
+                )
+                has_more = len(rows) > self.page_size
+                rows = rows[:self.page_size]
+                has_next, has_previous = has_more, True
+
+        next_cursor = encode_cursor(rows[-1]) if rows and has_next else None
+        prev_cursor = encode_cursor(rows[0], reverse=True) if rows and has_previous else None
+        count, approximate = self.get_count()
+
+        return KeysetPage(rows, next_cursor, prev_cursor, count, approximate, self.page_size)
+
+    def get_count(self):
+        """
+        Returns (count, is_approximate).
+        """
+        if self.count_mode == 'none':
+            return None, False
+        if self.count_mode == 'approximate':
+            # COUNT over a LIMIT subquery stops scanning once the cap is hit
+            limit = getattr(settings, 'INCIDENT_APPROXIMATE_COUNT_LIMIT', 1000)
+            count = self.queryset.order_by()[:limit].count()
+            return count, count >= limit
+        return self.queryset.count(), False
+
+
+class RankedPaginator(KeysetPaginator):
+    """
+    Paginate search results in the order a search backend's ranked() put
+    them in, best match first. Cursors hold an offset into the results.
+    """
+
+    def get_page(self, token=None):
+        offset = decode_offset(token)
+        rows = list(self.queryset[offset:offset + self.page_size + 1])
+        has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        next_cursor = encode_offset(offset + self.page_size) if has_next else None
+        prev_cursor = encode_offset(max(offset - self.page_size, 0)) if offset else None
+        count, approximate = self.get_count()
+
+        return KeysetPage(rows, next_cursor, prev_cursor, count, approximate, self.page_size, ranked=True)
@@ -0,0 +1,78 @@
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# Query budgets for the views, used by the tests to catch N+1 regressions.
+#
+# Each number is the most queries a view may run for a logged in user,
+# *regardless of how many rows are on the page*. That covers the session,
+# the user (its profile is joined in, see users/backends.py) and everything
+# the view + layout.html need. If a template starts touching a relation that
+# the view didn't select_related, the count grows with the page size and the
+# budget test fails.
+
+QUERY_BUDGETS = {
+    'incident:list': 6,
+    'incident:my-incidents': 4,
+    'incident:page': 4,
+    'incident:update-status': 4,
+    'incident:manager-dashboard': 7,
+    'incident:notifications': 4,
+    'incident:mark-notification-read': 7,
+    'incident:notifications-api': 3,
+    'users:login': 9,
+    'users:register': 12,
+}
+
+
+@contextmanager
+def assert_max_queries(testcase, budget, label=''):
+    """
+    Fail `testcase` if the block runs more than `budget` queries.
+    The executed SQL is included in the failure message.
+    """
+    with CaptureQueriesContext(connection) as ctx:
+        yield ctx
+    executed = len(ctx.captured_queries)
+    if executed > budget:
+        statements = '\n'.join(f'{n}. {q["sql"]}' for n, q in enumerate(ctx.captured_queries, start=1))
+        testcase.fail(f'{label or "block"} ran {executed} queries, budget is {budget}:\n{statements}')
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin for pinning the number of queries a view runs.
+    The cache is emptied before each request, so budgets are for a cold cache.
+    """
+
+    def count_queries(self, method, url, data=None):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data or {})
+        return response, len(ctx.captured_queries)
+
+    def assertViewWithinBudget(self, view_name, url, method='get', data=None, budget=None):
+        """
+        Request `url` and check it stays within the budget for `view_name`.
+        """
+        budget = QUERY_BUDGETS[view_name] if budget is None else budget
+        cache.clear()
+        with assert_max_queries(self, budget, label=view_name):
+            response = getattr(self.client, method)(url, data or {})
+        self.assertLess(response.status_code, 400, f'{view_name} returned {response.status_code}')
+        return response
+
+    def assertQueriesIndependentOfPageSize(self, view_name, url, page_sizes=(1, 50), data=None):
+        """
+        Render `url` at several page sizes and check the query count is the
+        same for all of them (and within budget).
+        """
+        counts = {}
+        for size in page_sizes:
+            params = dict(data or {}, page_size=size)
+            response, counts[size] = self.count_queries('get', url, params)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(set(counts.values())), 1, f'{view_name} query count varies with page size: {counts}')
+        self.assertLessEqual(max(counts.values()), QUERY_BUDGETS[view_name], f'{view_name}: {counts}')
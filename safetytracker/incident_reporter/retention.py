@@ -0,0 +1,131 @@
+import gzip
+import json
+import time
+from datetime import timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Notification
+
+# Notification retention.
+#
+# Notifications pile up much faster than incidents (one per manager per
+# incident, plus one per status change / assignment) and are rarely looked at
+# again once read. purge_notifications deletes the ones older than
+# NOTIFICATION_READ_TTL_DAYS (and, if set, unread ones older than
+# NOTIFICATION_UNREAD_TTL_DAYS), a small batch per transaction so the table is
+# never locked for long, optionally writing them to a gzipped JSON Lines
+# archive first.
+
+ARCHIVE_FIELDS = ['id', 'user_id', 'user__username', 'incident_id', 'incident__slug',
+                  'message', 'notification_type', 'is_read', 'created_at']
+
+
+def expired_notifications(read_days, unread_days=None, now=None):
+    """
+    Notifications past their time to live. `unread_days=None` keeps unread ones forever.
+    """
+    now = now or timezone.now()
+    expired = Q(is_read=True, created_at__lt=now - timedelta(days=read_days))
+    if unread_days is not None:
+        expired |= Q(is_read=False, created_at__lt=now - timedelta(days=unread_days))
+    return Notification.objects.filter(expired)
+
+
+def archive_batch(archive, ids):
+    """
+    Append the notifications with these ids to an open archive file. Returns how many were written.
+    """
+    rows = Notification.objects.filter(id__in=ids).order_by('id').values(*ARCHIVE_FIELDS)
+    written = 0
+    for row in rows:
+        archive.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+        written += 1
+    return written
+
+
+def purge_notifications(read_days, unread_days=None, batch_size=500, archive_path=None, pause=0, dry_run=False):
+    """
+    Delete expired notifications in batches of `batch_size`, each batch in its
+    own transaction, sleeping `pause` seconds in between so other writers get
+    a turn. With `archive_path` the rows are appended to that gzipped JSONL
+    file before they're deleted.
+
+    Returns a dict of metrics: deleted, archived, unread_deleted, batches, seconds.
+    """
+    expired = expired_notifications(read_days, unread_days)
+    metrics = {'deleted': 0, 'archived': 0, 'unread_deleted': 0, 'batches': 0, 'seconds': 0.0}
+    started = time.monotonic()
+
+    if dry_run:
+        metrics['deleted'] = expired.count()
+        metrics['unread_deleted'] = expired.filter(is_read=False).count()
+        return metrics
+
+    # gzip files can be appended to, each run adds another member
+    archive = gzip.open(archive_path, 'at', encoding='utf-8') if archive_path else None
+    last_id = 0
+    try:
+        while True:
+            # expired rows are the oldest, so walking the primary key finds them
+            # quickly; carrying on from the last id means no batch rescans the rows before it
+            ids = list(expired.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            with transaction.atomic():
+                if archive:
+                    metrics['archived'] += archive_batch(archive, ids)
+                batch = Notification.objects.filter(id__in=ids)
+                if unread_days is not None:
+                    metrics['unread_deleted'] += batch.filter(is_read=False).count()
+                # delete() sends post_delete, which takes unread ones off the user's counter
+                deleted, _per_model = batch.delete()
+            if archive:
+                # on disk before the next batch, so a crash loses at most the deletes, not the archive
+                archive.flush()
+
+            metrics['deleted'] += deleted
+            metrics['batches'] += 1
+            if pause and len(ids) == batch_size:
+                time.sleep(pause)
+    finally:
+        if archive:
+            archive.close()
+
+    metrics['seconds'] = time.monotonic() - started
+    return metrics
+
+
+def database_size():
+    """
+    Size in bytes of the database file and how much of it is free pages
+    (SQLite only, None elsewhere).
+    """
+    if connection.vendor != 'sqlite':
+        return None
+    values = {}
+    with connection.cursor() as cursor:
+        for pragma in ('page_size', 'page_count', 'freelist_count'):
+            cursor.execute(f'PRAGMA {pragma}')
+            values[pragma] = cursor.fetchone()[0]
+    return {
+        'bytes': values['page_count'] * values['page_size'],
+        'free_bytes': values['freelist_count'] * values['page_size'],
+    }
+
+
+def compact_notifications():
+    """
+    Give the space freed by a purge back: VACUUM on SQLite (rewrites the
+    whole file, so run it off-hours), VACUUM ANALYZE of the table on Postgres.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('VACUUM')
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'VACUUM ANALYZE {Notification._meta.db_table}')
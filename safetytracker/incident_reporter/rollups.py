@@ -0,0 +1,162 @@
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Incident, IncidentRollup
+from .trends import forget_all, forget_day
+
+# Incremental incident counters for the manager dashboard.
+#
+# Every incident contributes 1 to the IncidentRollup row for its
+# (day reported, current status, reporter). Creating an incident adds to a row,
+# changing its status moves the 1 from one row to another, deleting it takes
+# it away. The dashboard then only sums a few small rows.
+
+
+def rollup_key(incident):
+    return (incident.date.date(), incident.status, incident.reporter_id)
+
+
+def loaded_rollup_key(incident):
+    """
+    The key the incident had when it was loaded from the database,
+    or None if we don't know (e.g. some fields were deferred).
+    """
+    loaded = getattr(incident, '_loaded_values', {})
+    if not all(name in loaded for name in ('date', 'status', 'reporter_id')):
+        return None
+    return (loaded['date'].date(), loaded['status'], loaded['reporter_id'])
+
+
+def adjust_rollup(key, delta):
+    day, status, reporter_id = key
+    rows = IncidentRollup.objects.filter(day=day, status=status, reporter_id=reporter_id)
+    # the unique constraints keep it to one row per key
+    updated = rows.update(incident_count=F('incident_count') + delta)
+    if not updated and delta > 0:
+        try:
+            # savepoint, so losing the race doesn't break the caller's transaction
+            with transaction.atomic():
+                IncidentRollup.objects.create(day=day, status=status, reporter_id=reporter_id, incident_count=delta)
+        except IntegrityError:
+            # another request created the row first, add to it instead
+            rows.update(incident_count=F('incident_count') + delta)
+    # the cached trend buckets for that day are out of date now
+    forget_day(day)
+
+
+def record_incident_saved(incident, created):
+    """
+    Called from post_save on Incident.
+    """
+    new_key = rollup_key(incident)
+    old_key = None if created else loaded_rollup_key(incident)
+
+    with transaction.atomic():
+        if created:
+            adjust_rollup(new_key, 1)
+        elif old_key is not None and old_key != new_key:
+            adjust_rollup(old_key, -1)
+            adjust_rollup(new_key, 1)
+
+    # the instance now matches the row, so a second save() doesn't count twice
+    incident._loaded_values = {
+        **getattr(incident, '_loaded_values', {}),
+        'date': incident.date,
+        'status': incident.status,
+        'reporter_id': incident.reporter_id,
+    }
+
+
+def record_incidents_created(incidents):
+    """
+    For incidents inserted with bulk_create(), which doesn't send post_save.
+    One update per distinct rollup key rather than one per incident.
+    """
+    for key, count in Counter(rollup_key(incident) for incident in incidents).items():
+        adjust_rollup(key, count)
+
+
+def record_incident_deleted(incident):
+    """
+    Called from post_delete on Incident.
+    """
+    key = loaded_rollup_key(incident) or rollup_key(incident)
+    adjust_rollup(key, -1)
+
+
+def rebuild_rollups():
+    """
+    Throw away the rollups and recount them from the incident table.
+    Returns the number of rollup rows written.
+    """
+    grouped = (
+        Incident.objects.order_by()
+        .annotate(day=TruncDate('date'))
+        .values('day', 'status', 'reporter_id')
+        .annotate(incidents=Count('id'))
+    )
+    rows = [
+        IncidentRollup(day=row['day'], status=row['status'], reporter_id=row['reporter_id'], incident_count=row['incidents'])
+        for row in grouped
+    ]
+    with transaction.atomic():
+        IncidentRollup.objects.all().delete()
+        IncidentRollup.objects.bulk_create(rows, batch_size=1000)
+        forget_all()
+    return len(rows)
+
+
+def recent_since(days):
+    """
+    First day counted as "recent" on the dashboard: today is the last of `days` calendar days.
+    """
+    return timezone.now().date() - timedelta(days=days - 1)
+
+
+def dashboard_stats(days=7):
+    """
+    Counts for the dashboard cards in one query against the rollups:
+    total, one per status, and incidents reported in the last `days` days.
+    The rollups are per day, so that is calendar days: today and the
+    `days - 1` days before it.
+    """
+    since = recent_since(days)
+    aggregates = {
+        'total': Coalesce(Sum('incident_count'), 0),
+        'recent': Coalesce(Sum('incident_count', filter=Q(day__gte=since)), 0),
+    }
+    for status, _label in Incident.STATUS_CHOICES:
+        aggregates[status] = Coalesce(Sum('incident_count', filter=Q(status=status)), 0)
+    return IncidentRollup.objects.aggregate(**aggregates)
+
+
+def top_reporters(limit=5):
+    """
+    Reporters with the most incidents, as dicts with reporter__username / count.
+    """
+    return (
+        IncidentRollup.objects.values('reporter__username')
+        .annotate(count=Sum('incident_count'))
+        .filter(count__gt=0)
+        .order_by('-count')[:limit]
+    )
+
+
+def live_dashboard_stats(queryset, days=7):
+    """
+    Same numbers as dashboard_stats(), computed straight from the incident
+    table with one conditional aggregate query (used when rollups are off).
+    """
+    since = datetime.combine(recent_since(days), time.min)
+    aggregates = {
+        'total': Count('id'),
+        'recent': Count('id', filter=Q(date__gte=since)),
+    }
+    for status, _label in Incident.STATUS_CHOICES:
+        aggregates[status] = Count('id', filter=Q(status=status))
+    return queryset.order_by().aggregate(**aggregates)
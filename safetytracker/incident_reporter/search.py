@@ -0,0 +1,286 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+# Full text search over Incident.title / Incident.body.
+#
+# The backend is picked from settings.INCIDENT_SEARCH_BACKEND (a dotted path),
+# or from the database vendor when that isn't set. The search index itself is
+# created by migration 0008 and kept in sync by the database (triggers on
+# SQLite, a generated column on Postgres), so Incident.save()/delete(),
+# queryset.update() and bulk_create() all keep it current.
+
+FTS_TABLE = 'incident_reporter_incident_fts'
+
+# private use characters mark the highlighted words in snippets, so the rest of
+# the text can be HTML escaped before they are swapped for <mark> tags
+HIGHLIGHT_START = '\ue000'
+HIGHLIGHT_END = '\ue001'
+
+
+def search_terms(query):
+    """
+    Split a search box string into plain word tokens.
+    """
+    return re.findall(r'\w+', query or '')
+
+
+def highlight(text):
+    """
+    Escape a snippet and turn the highlight markers into <mark> tags.
+    """
+    text = escape(text)
+    text = text.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+    return mark_safe(text)
+
+
+class BaseSearchBackend:
+    """
+    Interface every search backend implements.
+    """
+
+    def filter(self, queryset, query):
+        """
+        Restrict an Incident queryset to rows matching `query`.
+        """
+        raise NotImplementedError
+
+    def ranked(self, queryset, query):
+        """
+        Like filter(), but annotated with `rank` and ordered best match first.
+        """
+        raise NotImplementedError
+
+    def snippets(self, incident_ids, query):
+        """
+        Returns {incident id: highlighted HTML snippet} for the given ids.
+        """
+        return {}
+
+
+class IContainsSearchBackend(BaseSearchBackend):
+    """
+    The original LIKE '%term%' scan. Works everywhere, but reads every row.
+    """
+
+    def filter(self, queryset, query):
+        # find all incidents where the title ** OR ** the body cotains the search term
+        return queryset.filter(Q(title__icontains=query) | Q(body__icontains=query))
+
+    def ranked(self, queryset, query):
+        return self.filter(queryset, query).annotate(rank=RawSQL('0', [])).order_by('-date', '-id')
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    """
+    SQLite FTS5 external content table, ranked with bm25().
+    Every word in the query is matched as a prefix, so "slip ware" finds
+    "Slipped in the warehouse".
+    """
+
+    # bm25 column weights: a hit in the title counts more than one in the body
+    title_weight = 10.0
+    body_weight = 1.0
+
+    def match_expression(self, query):
+        return ' '.join(f'"{term}"*' for term in search_terms(query))
+
+    def filter(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return IContainsSearchBackend().filter(queryset, query)
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+        )
+
+    def ranked(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return IContainsSearchBackend().ranked(queryset, query)
+        # bm25() is negative, lower is better
+        rank = RawSQL(
+            f'SELECT bm25({FTS_TABLE}, %s, %s) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = incident_reporter_incident.id',
+            [self.title_weight, self.body_weight, match],
+        )
+        return self.filter(queryset, query).annotate(rank=rank).order_by('rank', '-date', '-id')
+
+    def snippets(self, incident_ids, query):
+        match = self.match_expression(query)
+        if not match or not incident_ids:
+            return {}
+        placeholders = ', '.join(['%s'] * len(incident_ids))
+        sql = (
+            f'SELECT rowid, snippet({FTS_TABLE}, -1, %s, %s, %s, 16) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid IN ({placeholders})'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [HIGHLIGHT_START, HIGHLIGHT_END, '…', match, *incident_ids])
+            return {row_id: highlight(snippet) for row_id, snippet in cursor.fetchall()}
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Postgres tsvector column (title weighted A, body weighted B) with a GIN index.
+    """
+
+    config = 'english'
+
+    def tsquery(self, query):
+        return ' & '.join(f'{term}:*' for term in search_terms(query))
+
+    def filter(self, queryset, query):
+        tsquery = self.tsquery(query)
+        if not tsquery:
+            return IContainsSearchBackend().filter(queryset, query)
+        return queryset.filter(
+            id__in=RawSQL(
+                'SELECT id FROM incident_reporter_incident WHERE search_vector @@ to_tsquery(%s, %s)',
+                [self.config, tsquery],
+            )
+        )
+
+    def ranked(self, queryset, query):
+        tsquery = self.tsquery(query)
+        if not tsquery:
+            return IContainsSearchBackend().ranked(queryset, query)
+        rank = RawSQL(
+            'ts_rank_cd(incident_reporter_incident.search_vector, to_tsquery(%s, %s))',
+            [self.config, tsquery],
+        )
+        return self.filter(queryset, query).annotate(rank=rank).order_by('-rank', '-date', '-id')
+
+    def snippets(self, incident_ids, query):
+        tsquery = self.tsquery(query)
+        if not tsquery or not incident_ids:
+            return {}
+        options = f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxWords=20, MinWords=8'
+        sql = (
+            'SELECT id, ts_headline(%s, body, to_tsquery(%s, %s), %s) '
+            'FROM incident_reporter_incident WHERE id = ANY(%s)'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.config, self.config, tsquery, options, list(incident_ids)])
+            return {row_id: highlight(snippet) for row_id, snippet in cursor.fetchall()}
+
+
+# The statements below are used by migration 0008 and by the
+# rebuild_search_index command. Everything is IF NOT EXISTS so they can be
+# re-run safely, e.g. after a migration that rebuilds the incident table on
+# SQLite (which drops the triggers along with the old table).
+
+SQLITE_INDEX_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, body,
+        content='incident_reporter_incident', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON incident_reporter_incident BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON incident_reporter_incident BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF title, body ON incident_reporter_incident BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_DROP_SQL = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+POSTGRES_INDEX_SQL = [
+    """
+    ALTER TABLE incident_reporter_incident ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(body, '')), 'B')
+    ) STORED
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS incident_reporter_incident_search_gin
+    ON incident_reporter_incident USING GIN (search_vector)
+    """,
+]
+
+POSTGRES_DROP_SQL = [
+    'DROP INDEX IF EXISTS incident_reporter_incident_search_gin',
+    'ALTER TABLE incident_reporter_incident DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def create_search_index(schema_editor):
+    """
+    Create (or repair) the full text index for the current database.
+    Returns False if the database can't host one, in which case searches
+    fall back to LIKE scans.
+    """
+    from django.db import DatabaseError
+
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = SQLITE_INDEX_SQL
+    elif vendor == 'postgresql':
+        statements = POSTGRES_INDEX_SQL
+    else:
+        return False
+
+    try:
+        for statement in statements:
+            schema_editor.execute(statement)
+    except DatabaseError:
+        # e.g. "no such module: fts5"
+        return False
+    finally:
+        get_search_backend.cache_clear()
+    return True
+
+
+def drop_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_DROP_SQL, 'postgresql': POSTGRES_DROP_SQL}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+    get_search_backend.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """
+    Return the configured search backend (created once per process).
+    """
+    path = getattr(settings, 'INCIDENT_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+
+    # pick one from the database, falling back to LIKE scans if the
+    # index couldn't be created (e.g. SQLite built without FTS5)
+    if connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+        return SQLiteFTSSearchBackend()
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            columns = [c.name for c in connection.introspection.get_table_description(cursor, 'incident_reporter_incident')]
+        if 'search_vector' in columns:
+            return PostgresSearchBackend()
+    return IContainsSearchBackend()
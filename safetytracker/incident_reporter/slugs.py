@@ -0,0 +1,106 @@
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils.text import slugify
+
+from .models import Incident, SlugCounter
+
+# Unique slug allocation for incidents.
+#
+# Titles like "Slip in warehouse" get reported over and over, so instead of
+# trying slip-in-warehouse, slip-in-warehouse-1, slip-in-warehouse-2... one
+# query at a time, SlugCounter remembers the last number used for each base
+# and hands out the next one with a single atomic UPDATE.
+
+# SlugField defaults to 50 characters, leave room for a "-123456" suffix
+BASE_SLUG_LENGTH = 40
+
+
+def base_slug(title):
+    return slugify(title)[:BASE_SLUG_LENGTH].strip('-') or 'incident'
+
+
+def slug_with_suffix(base, suffix):
+    return base if suffix == 0 else f"{base}-{suffix}"
+
+
+def highest_existing_suffix(base):
+    """
+    Highest suffix already used by an incident slug for `base` (0 for the bare
+    base, -1 if unused). One query; only needed the first time a base is seen.
+    """
+    pattern = re.compile(rf'^{re.escape(base)}(?:-(\d+))?$')
+    highest = -1
+    slugs = Incident.objects.filter(Q(slug=base) | Q(slug__startswith=f'{base}-')).values_list('slug', flat=True)
+    for slug in slugs.iterator():
+        match = pattern.match(slug)
+        if match:
+            highest = max(highest, int(match.group(1) or 0))
+    return highest
+
+
+def allocate_slug(title):
+    """
+    Reserve and return the next free slug for an incident title.
+    """
+    base = base_slug(title)
+
+    with transaction.atomic():
+        if SlugCounter.objects.filter(base=base).update(last_suffix=F('last_suffix') + 1):
+            suffix = SlugCounter.objects.filter(base=base).values_list('last_suffix', flat=True).get()
+            return slug_with_suffix(base, suffix)
+
+    # first incident with this base since the counter table was added
+    suffix = highest_existing_suffix(base) + 1
+    try:
+        with transaction.atomic():
+            SlugCounter.objects.create(base=base, last_suffix=suffix)
+    except IntegrityError:
+        # someone else created the counter in the meantime, just take the next number
+        return allocate_slug(title)
+    return slug_with_suffix(base, suffix)
+
+
+class BulkSlugAllocator:
+    """
+    Hands out slugs for many new incidents at once (import_incidents) without
+    a query per slug: every existing slug and counter is loaded up front and
+    the numbering is worked out in memory.
+
+    Call save_counters() in the same transaction as the bulk insert, so the
+    counters move past the numbers used and Incident.save() carries on from there.
+    """
+
+    def __init__(self):
+        self.taken = set(Incident.objects.values_list('slug', flat=True).iterator(chunk_size=10000))
+        self.next_suffix = {
+            base: last_suffix + 1 for base, last_suffix in SlugCounter.objects.values_list('base', 'last_suffix')
+        }
+        self.touched = set()
+
+    def allocate(self, title, slug=None):
+        """
+        A free slug for `title`, or `slug` itself if one was given and is still free.
+        """
+        if slug and slug not in self.taken:
+            self.taken.add(slug)
+            return slug
+
+        base = base_slug(title)
+        suffix = self.next_suffix.get(base, 0)
+        while slug_with_suffix(base, suffix) in self.taken:
+            suffix += 1
+        slug = slug_with_suffix(base, suffix)
+
+        self.taken.add(slug)
+        self.next_suffix[base] = suffix + 1
+        self.touched.add(base)
+        return slug
+
+    def save_counters(self):
+        counters = [SlugCounter(base=base, last_suffix=self.next_suffix[base] - 1) for base in self.touched]
+        SlugCounter.objects.bulk_create(
+            counters, batch_size=1000, update_conflicts=True, unique_fields=['base'], update_fields=['last_suffix'],
+        )
+        self.touched.clear()
@@ -0,0 +1,34 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from ..images import banner_srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def banner_picture(incident, sizes='100vw', css_class='', lazy=False):
+    """
+    Render an incident's banner as a <picture> with WebP and JPEG srcsets, so
+    the browser downloads the smallest copy that fills `sizes`. Falls back to
+    a plain <img> of the original until the worker has made the copies.
+
+        {% banner_picture incident sizes="(min-width: 768px) 160px, 100vw" css_class="rounded" lazy=True %}
+    """
+    variants = incident.banner_variants
+    loading = 'lazy' if lazy else 'eager'
+    if not variants.get('jpeg'):
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}">',
+            incident.banner.url, incident.title, css_class, loading,
+        )
+
+    largest = max(variants['jpeg'], key=int)
+    webp = banner_srcset(incident, 'webp')
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" loading="{}" decoding="async"></picture>',
+        format_html('<source type="image/webp" srcset="{}" sizes="{}">', webp, sizes) if webp else '',
+        default_storage.url(variants['jpeg'][largest]), banner_srcset(incident, 'jpeg'), sizes,
+        variants['width'], variants['height'], incident.title, css_class, loading,
+    )
@@ -1,3 +1,1426 @@
-from django.test import TestCase
+import gzip
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.admin.sites import site as admin_site
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import QuerySet
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from safetytracker.static_build import purge_css, serve_static
+from users.models import Profile
+
+from .images import process_banner
+from .instrumentation import metrics
+from .jobs import claim_jobs, enqueue, job, run_job
+from .live import InProcessBroker, get_broker
+from .management.commands.explain_queries import full_scans
+from .analytics import resolution_times, time_in_state
+from .benchmarks import SCENARIOS, ScenarioRunner, compare, run_scenario, seed_data
+from .models import Incident, IncidentConflict, IncidentEvent, IncidentRollup, Job, Notification, SlugCounter
+from .pagination import KeysetPaginator, decode_cursor, encode_cursor
+from .query_budget import QUERY_BUDGETS, QueryBudgetMixin, assert_max_queries
+from .rollups import adjust_rollup, dashboard_stats, live_dashboard_stats, rebuild_rollups, top_reporters
+from .search import SQLiteFTSSearchBackend, get_search_backend
+from . import trends
+from .trends import trend_series
+from .utils import (
+    create_notification, create_notifications, mark_notifications_read, notify_managers_assignment,
+    notify_managers_new_incident, notify_reporters_status_change, queue_status_change_notification,
+)
+
+
+def make_incidents(count, reporter=None, title='Slip in warehouse', **fields):
+    """
+    Create `count` incidents with distinct, decreasing dates.
+    """
+    incidents = []
+    start = datetime(2025, 1, 1, 12, 0)
+    for n in range(count):
+        incident = Incident.objects.create(title=title, body='Wet floor near dock', reporter=reporter, **fields)
+        # auto_now_add ignores the value on create, so set the date afterwards
+        Incident.objects.filter(pk=incident.pk).update(date=start - timedelta(hours=n))
+        incidents.append(incident)
+    return incidents
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('worker', password='pw')
+        make_incidents(7, reporter=cls.user)
+
+    def test_walks_forward_and_back_without_gaps(self):
+        paginator = KeysetPaginator(Incident.objects.all(), page_size=3)
+        expected = list(Incident.objects.order_by('-date', '-id').values_list('id', flat=True))
+
+        first = paginator.get_page()
+        second = paginator.get_page(first.next_cursor)
+        third = paginator.get_page(second.next_cursor)
+        seen = [i.id for page in (first, second, third) for i in page]
+
+        self.assertEqual(seen, expected)
+        self.assertFalse(first.has_previous)
+        self.assertFalse(third.has_next)
+
+        back = paginator.get_page(third.prev_cursor)
+        self.assertEqual([i.id for i in back], [i.id for i in second])
+        self.assertTrue(back.has_previous)
+
+    def test_ties_on_date_are_broken_by_id(self):
+        Incident.objects.update(date=datetime(2025, 1, 1))
+        paginator = KeysetPaginator(Incident.objects.all(), page_size=2)
+        ids, token = [], None
+        while True:
+            page = paginator.get_page(token)
+            ids.extend(i.id for i in page)
+            if not page.has_next:
+                break
+            token = page.next_cursor
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(ids), 7)
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        page = KeysetPaginator(Incident.objects.all(), page_size=3).get_page('not-a-cursor')
+        self.assertEqual(len(page), 3)
+
+    def test_cursor_round_trip(self):
+        incident = Incident.objects.first()
+        self.assertEqual(decode_cursor(encode_cursor(incident, reverse=True)), (incident.date, incident.id, True))
+
+    @override_settings(INCIDENT_APPROXIMATE_COUNT_LIMIT=5)
+    def test_approximate_count_is_capped(self):
+        page = KeysetPaginator(Incident.objects.all(), page_size=3, count_mode='approximate').get_page()
+        self.assertEqual(page.count, 5)
+        self.assertTrue(page.count_is_approximate)
+
+    def test_list_view_keeps_filters_in_cursor_links(self):
+        response = self.client.get(reverse('incident:list'), {'status': 'new', 'page_size': 3})
+        page = response.context['page']
+        self.assertEqual(len(page), 3)
+        self.assertContains(response, 'status=new')
+        self.assertContains(response, f'cursor={page.next_cursor}')
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Pin the number of queries per view so N+1 patterns can't creep back in.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('boss', password='pw')
+        cls.manager.profile.role = 'manager'
+        cls.manager.profile.save()
+        cls.reporters = [User.objects.create_user(f'worker{n}', password='pw') for n in range(3)]
+        for reporter in cls.reporters:
+            make_incidents(4, reporter=reporter, assigned_to=cls.manager)
+            make_incidents(2, reporter=reporter, status='in_progress', assigned_to=cls.manager)
+        for incident in Incident.objects.all():
+            Notification.objects.create(user=cls.manager, incident=incident, message='hi', notification_type='new_incident')
+
+    def setUp(self):
+        self.client.force_login(self.manager)
+        # the backend is picked (with one introspection query) on first use
+        get_search_backend()
+
+    def test_incident_list(self):
+        self.assertQueriesIndependentOfPageSize('incident:list', reverse('incident:list'))
+
+    def test_incident_list_with_filters(self):
+        self.assertQueriesIndependentOfPageSize(
+            'incident:list', reverse('incident:list'), data={'status': 'new', 'search': 'slip'}
+        )
+
+    def test_my_incidents(self):
+        self.client.force_login(self.reporters[0])
+        self.assertQueriesIndependentOfPageSize('incident:my-incidents', reverse('incident:my-incidents'))
+
+    def test_incident_page(self):
+        incident = Incident.objects.first()
+        self.assertViewWithinBudget('incident:page', reverse('incident:page', args=[incident.slug]))
+
+    def test_update_status_form(self):
+        incident = Incident.objects.first()
+        self.assertViewWithinBudget('incident:update-status', reverse('incident:update-status', args=[incident.slug]))
+
+    def test_manager_dashboard(self):
+        self.assertViewWithinBudget('incident:manager-dashboard', reverse('incident:manager-dashboard'))
+
+    def test_notifications(self):
+        self.assertViewWithinBudget('incident:notifications', reverse('incident:notifications'))
+
+    def test_mark_notification_read(self):
+        notification = Notification.objects.filter(user=self.manager).first()
+        self.assertViewWithinBudget(
+            'incident:mark-notification-read',
+            reverse('incident:mark-notification-read', args=[notification.id]),
+        )
+
+
+class SearchBackendTests(TestCase):
+
+    def setUp(self):
+        self.backend = get_search_backend()
+        self.forklift = Incident.objects.create(title='Forklift collision', body='Forklift hit a <rack> in aisle 4')
+        self.spill = Incident.objects.create(title='Oil spill', body='Spill near the forklift charging bay')
+
+    def test_uses_fts_on_sqlite(self):
+        self.assertIsInstance(self.backend, SQLiteFTSSearchBackend)
+
+    def test_prefix_matching(self):
+        found = self.backend.filter(Incident.objects.all(), 'fork')
+        self.assertEqual(set(found), {self.forklift, self.spill})
+        self.assertEqual(list(self.backend.filter(Incident.objects.all(), 'fork spi')), [self.spill])
+
+    def test_title_hits_rank_first(self):
+        ranked = list(self.backend.ranked(Incident.objects.all(), 'forklift'))
+        self.assertEqual(ranked[0], self.forklift)
+
+    def test_index_follows_updates_and_deletes(self):
+        self.spill.title = 'Chemical leak'
+        self.spill.body = 'Drum leaking'
+        self.spill.save()
+        self.assertFalse(self.backend.filter(Incident.objects.all(), 'spill').exists())
+        self.assertTrue(self.backend.filter(Incident.objects.all(), 'leak').exists())
+
+        self.forklift.delete()
+        self.assertFalse(self.backend.filter(Incident.objects.all(), 'forklift').exists())
+
+    def test_snippets_are_escaped_and_highlighted(self):
+        snippet = self.backend.snippets([self.forklift.id], 'rack')[self.forklift.id]
+        self.assertIn('&lt;<mark>rack</mark>&gt;', snippet)
+
+    def test_punctuation_only_search_falls_back_to_like(self):
+        self.assertEqual(self.backend.filter(Incident.objects.all(), '<').get(), self.forklift)
+
+    def test_list_view_shows_snippets(self):
+        response = self.client.get(reverse('incident:list'), {'search': 'charging'})
+        self.assertContains(response, '<mark>charging</mark>')
+        self.assertNotContains(response, 'Forklift collision')
+
+    def test_list_view_shows_best_matches_first(self):
+        # the spill is newer, but only mentions a forklift in its body
+        def page(cursor=None):
+            response = self.client.get(reverse('incident:list'), {'search': 'forklift', 'page_size': 1, 'cursor': cursor or ''})
+            return response, response.context['page']
+
+        response, first = page()
+        self.assertEqual(list(first), [self.forklift])
+        self.assertContains(response, 'More matches')
+        _response, second = page(first.next_cursor)
+        self.assertEqual(list(second), [self.spill])
+        self.assertFalse(second.has_next)
+        self.assertEqual(list(page(second.prev_cursor)[1]), [self.forklift])
+
+
+class RollupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', password='pw')
+        cls.bob = User.objects.create_user('bob', password='pw')
+
+    def rollup_snapshot(self):
+        return sorted(
+            (r.day, r.status, r.reporter_id, r.incident_count)
+            for r in IncidentRollup.objects.all() if r.incident_count
+        )
+
+    def assertMatchesRebuild(self):
+        incremental = self.rollup_snapshot()
+        rebuild_rollups()
+        self.assertEqual(incremental, self.rollup_snapshot())
+
+    def test_incremental_counts_match_a_full_rebuild(self):
+        first = Incident.objects.create(title='Cut', body='x', reporter=self.alice)
+        Incident.objects.create(title='Burn', body='x', reporter=self.alice)
+        Incident.objects.create(title='Trip', body='x', reporter=self.bob)
+
+        # status changes on a freshly loaded instance and on the same instance twice
+        loaded = Incident.objects.get(pk=first.pk)
+        loaded.status = 'in_progress'
+        loaded.save()
+        loaded.status = 'resolved'
+        loaded.save()
+        # saving without a change must not move anything
+        loaded.save()
+        Incident.objects.filter(title='Trip').get().delete()
+
+        self.assertMatchesRebuild()
+
+    def test_dashboard_stats(self):
+        Incident.objects.create(title='Cut', body='x', reporter=self.alice)
+        burn = Incident.objects.create(title='Burn', body='x', reporter=self.bob)
+        burn.status = 'closed'
+        burn.save()
+
+        stats = dashboard_stats(days=7)
+        self.assertEqual(stats, {'total': 2, 'recent': 2, 'new': 1, 'in_progress': 0, 'resolved': 0, 'closed': 1})
+        self.assertEqual(stats, live_dashboard_stats(Incident.objects.all(), days=7))
+        self.assertEqual({r['reporter__username']: r['count'] for r in top_reporters()}, {'alice': 1, 'bob': 1})
+
+    def test_one_row_per_key(self):
+        day = timezone.now().date()
+        adjust_rollup((day, 'new', None), 1)
+        adjust_rollup((day, 'new', self.alice.pk), 1)
+        for reporter in (None, self.alice):
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                IncidentRollup.objects.create(day=day, status='new', reporter=reporter, incident_count=1)
+
+        # a request that loses the race to create the row adds to the winner's
+        real_update = QuerySet.update
+        calls = []
+
+        def update(queryset, **kwargs):
+            calls.append(kwargs)
+            # the first update runs before the other request has created the row
+            return 0 if len(calls) == 1 else real_update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', update):
+            adjust_rollup((day, 'new', None), 1)
+        self.assertEqual(IncidentRollup.objects.filter(reporter=None).get().incident_count, 2)
+
+    def test_recent_is_calendar_days_either_way(self):
+        today = datetime.combine(timezone.now().date(), datetime.min.time())
+        for date in (today - timedelta(days=6), today - timedelta(days=6, minutes=1)):
+            incident = Incident.objects.create(title='Cut', body='x', reporter=self.alice)
+            Incident.objects.filter(pk=incident.pk).update(date=date)
+        rebuild_rollups()
+        self.assertEqual(dashboard_stats(days=7)['recent'], 1)
+        self.assertEqual(live_dashboard_stats(Incident.objects.all(), days=7)['recent'], 1)
+
+    def test_rebuild_command(self):
+        Incident.objects.create(title='Cut', body='x', reporter=self.alice)
+        IncidentRollup.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_incident_rollups', stdout=out)
+        self.assertIn('Rebuilt 1 rollup rows', out.getvalue())
+        self.assertEqual(dashboard_stats()['new'], 1)
+
+
+class UnreadCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('worker', password='pw')
+        cls.incident = Incident.objects.create(title='Cut', body='x', reporter=cls.user)
+
+    def unread(self):
+        self.user.profile.refresh_from_db()
+        return self.user.profile.unread_notification_count
+
+    def notify(self, times=1):
+        for _ in range(times):
+            create_notification(self.user, self.incident, 'hello', 'status_change')
+
+    def test_counter_follows_create_and_read(self):
+        self.notify(3)
+        self.assertEqual(self.unread(), 3)
+
+        self.client.force_login(self.user)
+        first = Notification.objects.filter(user=self.user).first()
+        self.client.get(reverse('incident:mark-notification-read', args=[first.id]))
+        # reading the same notification twice only counts once
+        self.client.get(reverse('incident:mark-notification-read', args=[first.id]))
+        self.assertEqual(self.unread(), 2)
+
+        self.client.post(reverse('incident:mark-all-read'))
+        self.assertEqual(self.unread(), 0)
+
+    def test_deleting_unread_notifications_decrements(self):
+        self.notify(2)
+        self.incident.delete()
+        self.assertEqual(self.unread(), 0)
+
+    def test_stale_saves_keep_the_counter(self):
+        stale = User.objects.get(pk=self.user.pk)
+        stale.profile
+        self.notify(2)
+        stale.save()
+        stale.profile.role = 'manager'
+        stale.profile.save()
+        self.assertEqual(self.unread(), 2)
+        self.assertEqual(self.user.profile.role, 'manager')
+
+    def test_context_processor_is_lazy(self):
+        self.notify(2)
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('incident:mark-all-read'))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(any('COUNT' in q['sql'] for q in ctx.captured_queries))
+
+        response = self.client.get(reverse('incident:my-incidents'))
+        self.assertEqual(response.context['unread_notifications_count'], 0)
+
+
+class NotificationFanOutTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.managers = [User.objects.create_user(f'manager{n}', password='pw') for n in range(7)]
+        Profile.objects.filter(user__in=cls.managers).update(role='manager')
+        cls.reporter = User.objects.create_user('worker', password='pw')
+
+    @override_settings(NOTIFICATION_BATCH_SIZE=3)
+    def test_new_incident_fan_out_is_batched(self):
+        incident = Incident.objects.create(title='Cut', body='x', reporter=self.reporter)
+        with CaptureQueriesContext(connection) as ctx:
+            notify_managers_new_incident(incident)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+
+        # 7 managers in batches of 3
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(Notification.objects.filter(notification_type='new_incident').count(), 7)
+        self.assertEqual(
+            set(Profile.objects.filter(role='manager').values_list('unread_notification_count', flat=True)), {1}
+        )
+
+    def test_bulk_status_change_counts_each_notification(self):
+        incidents = [Incident.objects.create(title=f'Cut {n}', body='x', reporter=self.reporter) for n in range(3)]
+        notify_reporters_status_change([(incident, 'new', 'resolved') for incident in incidents])
+
+        self.reporter.profile.refresh_from_db()
+        self.assertEqual(self.reporter.profile.unread_notification_count, 3)
+        self.assertEqual(
+            Notification.objects.filter(user=self.reporter).first().message,
+            "Your incident 'Cut 2' status changed from New to Resolved",
+        )
+
+    def test_bulk_assignment_skips_unassigned(self):
+        assigned = Incident.objects.create(title='Cut', body='x', assigned_to=self.managers[0])
+        unassigned = Incident.objects.create(title='Burn', body='x')
+        notify_managers_assignment([assigned, unassigned])
+        self.assertEqual(list(Notification.objects.values_list('user', 'incident')), [(self.managers[0].pk, assigned.pk)])
+
+
+@job('test_flaky')
+def flaky_job(fail_times, marker):
+    """
+    Fails the first `fail_times` attempts, then records `marker` as an incident title.
+    """
+    attempts = Job.objects.get(name='test_flaky', payload__marker=marker).attempts
+    Incident.objects.create(title=f'{marker} attempt {attempts}', body='x')
+    if attempts <= fail_times:
+        raise RuntimeError('boom')
+
+
+class JobQueueTests(TestCase):
+
+    def run_due_jobs(self):
+        return [run_job(j) for j in claim_jobs(limit=10)]
+
+    def test_idempotency_key_queues_once(self):
+        first = enqueue('test_flaky', {'fail_times': 0, 'marker': 'a'}, idempotency_key='k1')
+        second = enqueue('test_flaky', {'fail_times': 0, 'marker': 'a'}, idempotency_key='k1')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_failed_attempts_roll_back_and_retry_with_backoff(self):
+        queued = enqueue('test_flaky', {'fail_times': 1, 'marker': 'b'})
+        with self.assertLogs('incident_reporter.jobs', 'WARNING'):
+            self.assertEqual(self.run_due_jobs(), [False])
+
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'pending')
+        self.assertIn('RuntimeError: boom', queued.last_error)
+        self.assertGreater(queued.run_after, timezone.now())
+        # the failed attempt's writes were rolled back with it
+        self.assertFalse(Incident.objects.exists())
+        # not due yet
+        self.assertEqual(self.run_due_jobs(), [])
+
+        Job.objects.update(run_after=timezone.now())
+        self.assertEqual(self.run_due_jobs(), [True])
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'done')
+        self.assertEqual(list(Incident.objects.values_list('title', flat=True)), ['b attempt 2'])
+
+    @override_settings(JOB_MAX_ATTEMPTS=2, JOB_RETRY_DELAY=0)
+    def test_gives_up_after_max_attempts(self):
+        queued = enqueue('test_flaky', {'fail_times': 5, 'marker': 'c'})
+        with self.assertLogs('incident_reporter.jobs', 'WARNING') as logs:
+            self.run_due_jobs()
+            self.run_due_jobs()
+        self.assertIn('failed for good', logs.output[-1])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('failed', 2))
+
+    def test_stale_running_jobs_are_reclaimed(self):
+        queued = enqueue('test_flaky', {'fail_times': 0, 'marker': 'd'})
+        Job.objects.filter(pk=queued.pk).update(status='running', locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.run_due_jobs(), [True])
+
+    @override_settings(JOBS_RUN_EAGERLY=True)
+    def test_eager_mode_runs_inline(self):
+        incident = Incident.objects.create(title='Cut', body='x', reporter=User.objects.create_user('w', password='pw'))
+        queue_status_change_notification(incident, 'new', 'closed')
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(Notification.objects.get().notification_type, 'status_change')
+
+
+class WorkerCommandTests(TransactionTestCase):
+    """
+    The worker runs jobs on pool threads with their own connections, so the
+    data has to be committed for them to see it.
+    """
+
+    def test_reporting_an_incident_queues_notifications(self):
+        manager = User.objects.create_user('boss', password='pw')
+        Profile.objects.filter(user=manager).update(role='manager')
+        reporter = User.objects.create_user('worker', password='pw')
+        self.client.force_login(reporter)
+
+        self.client.post(reverse('incident:new-incident'), {'title': 'Cut', 'body': 'Finger'})
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(Job.objects.get().name, 'notify_new_incident')
+
+        call_command('run_worker', once=True, threads=1, stdout=StringIO())
+        self.assertEqual(Notification.objects.get().user, manager)
+
+
+class SlugAllocationTests(TestCase):
+
+    def test_same_title_gets_numbered_slugs_in_constant_queries(self):
+        make_incidents(3)
+        with CaptureQueriesContext(connection) as ctx:
+            incident = Incident.objects.create(title='Slip in warehouse', body='x')
+        self.assertEqual(incident.slug, 'slip-in-warehouse-3')
+        self.assertFalse(any('"slug" =' in q['sql'] and 'SELECT' in q['sql'] for q in ctx.captured_queries))
+
+    def test_counter_picks_up_existing_slugs(self):
+        # slugs created before the counter existed
+        for slug in ['trip', 'trip-1', 'trip-7', 'trip-hazard']:
+            Incident.objects.create(title='Trip', body='x', slug=slug)
+        self.assertEqual(Incident.objects.create(title='Trip', body='x').slug, 'trip-8')
+        self.assertEqual(Incident.objects.create(title='Trip', body='x').slug, 'trip-9')
+
+    def test_collision_with_hand_made_slug_is_retried(self):
+        Incident.objects.create(title='Burn', body='x')
+        Incident.objects.create(title='Other', body='x', slug='burn-1')
+        self.assertEqual(Incident.objects.create(title='Burn', body='x').slug, 'burn-2')
+
+    def test_long_and_symbol_only_titles(self):
+        long_title = 'Worker slipped on an oily patch next to the north loading bay door'
+        self.assertLessEqual(len(Incident.objects.create(title=long_title, body='x').slug), 50)
+        self.assertEqual(Incident.objects.create(title='!!!', body='x').slug, 'incident')
+
+
+class SlugConcurrencyTests(TransactionTestCase):
+
+    def test_parallel_reports_with_the_same_title_get_unique_slugs(self):
+        def report(n):
+            try:
+                # SQLite's shared in-memory test database reports "table is
+                # locked" instead of waiting, so retry like busy_timeout would
+                for _ in range(200):
+                    try:
+                        return Incident.objects.create(title='Slip in warehouse', body=str(n)).slug
+                    except OperationalError:
+                        time.sleep(0.01)
+                raise AssertionError('database stayed locked')
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            slugs = list(pool.map(report, range(40)))
+
+        self.assertEqual(len(set(slugs)), 40)
+        self.assertEqual(Incident.objects.count(), 40)
+        # numbers can be skipped when an insert fails and is retried, never reused
+        self.assertGreaterEqual(SlugCounter.objects.get(base='slip-in-warehouse').last_suffix, 39)
+
+
+class ExplainQueriesTests(TestCase):
+
+    def test_view_queries_use_indexes(self):
+        # --fail turns any sequential scan into a CommandError
+        out = StringIO()
+        call_command('explain_queries', fail=True, stdout=out)
+        self.assertIn('No sequential scans.', out.getvalue())
+
+    def test_unindexed_query_is_flagged(self):
+        plan = Incident.objects.filter(body='Finger').order_by().explain()
+        self.assertEqual(full_scans(plan, connection.vendor), ['incident_reporter_incident'])
+
+
+def photo_upload(name='photo.jpg', size=(200, 100), orientation=6):
+    """
+    A JPEG like a phone would send: EXIF says rotate 90 degrees and names the camera.
+    """
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    exif[0x010F] = 'PhoneCam'
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(JOBS_RUN_EAGERLY=True, INCIDENT_BANNER_WIDTHS=[32, 64, 128])
+class BannerProcessingTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.user = User.objects.create_user('worker', password='pw')
+        self.client.force_login(self.user)
+
+    def test_upload_is_cleaned_and_resized(self):
+        self.client.post(reverse('incident:new-incident'), {'title': 'Cut', 'body': 'Finger', 'banner': photo_upload()})
+        incident = Incident.objects.get()
+
+        self.assertEqual(incident.banner.name, 'banners/photo.jpg')
+        self.assertFalse(default_storage.exists('photo.jpg'))
+        with default_storage.open(incident.banner.name) as file, Image.open(file) as image:
+            # rotated upright, and the EXIF data is gone
+            self.assertEqual(image.size, (100, 200))
+            self.assertEqual(len(image.getexif()), 0)
+
+        # no upscaling past the photo's own width
+        self.assertEqual(sorted(incident.banner_variants['jpeg'], key=int), ['32', '64'])
+        self.assertEqual(sorted(incident.banner_variants['webp'], key=int), ['32', '64'])
+        with default_storage.open(incident.banner_variants['webp']['32']) as file, Image.open(file) as image:
+            self.assertEqual(image.size, (32, 64))
+
+    def test_list_serves_thumbnails(self):
+        self.client.post(reverse('incident:new-incident'), {'title': 'Cut', 'body': 'Finger', 'banner': photo_upload()})
+        response = self.client.get(reverse('incident:list'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, 'banners/photo-32.webp 32w')
+
+    def test_fallback_banner_is_left_alone(self):
+        self.client.post(reverse('incident:new-incident'), {'title': 'Cut', 'body': 'Finger'})
+        incident = Incident.objects.get()
+        self.assertEqual(incident.banner.name, 'fallback.jpg')
+        self.assertEqual(incident.banner_variants, {})
+        self.assertEqual(process_banner(incident), {})
+
+    def test_processing_changes_the_page_etag(self):
+        self.client.post(reverse('incident:new-incident'), {'title': 'Cut', 'body': 'Finger', 'banner': photo_upload()})
+        incident = Incident.objects.get()
+        url = reverse('incident:page', args=[incident.slug])
+        etag = self.client.get(url)['ETag']
+
+        version = incident.version
+        process_banner(incident)
+        self.assertEqual(incident.version, version + 1)
+        self.assertEqual(Incident.objects.get().version, version + 1)
+        response = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, incident.banner_variants['jpeg']['32'])
+
+    def test_reprocessing_replaces_old_copies(self):
+        self.client.post(reverse('incident:new-incident'), {'title': 'Cut', 'body': 'Finger', 'banner': photo_upload()})
+        incident = Incident.objects.get()
+        old_files = [incident.banner.name, *incident.banner_variants['jpeg'].values()]
+
+        call_command('process_banners', all=True, stdout=StringIO())
+        incident.refresh_from_db()
+        for name in old_files:
+            self.assertFalse(default_storage.exists(name))
+        self.assertTrue(default_storage.exists(incident.banner_variants['jpeg']['64']))
+
+
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('boss', password='pw')
+        Profile.objects.filter(user=cls.manager).update(role='manager')
+        cls.reporter = User.objects.create_user('worker', password='pw')
+        make_incidents(3, reporter=cls.reporter)
+        make_incidents(2, reporter=cls.reporter, title='Cut finger', status='closed', assigned_to=cls.manager)
+
+    def setUp(self):
+        self.client.force_login(self.manager)
+
+    def export(self, **params):
+        response = self.client.get(reverse('incident:export'), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_uses_list_filters(self):
+        lines = self.export(status='closed').splitlines()
+        self.assertEqual(lines[0], 'id,slug,title,status,date,reporter,assigned_to,body')
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(all(',Cut finger,closed,' in line and ',worker,boss,' in line for line in lines[1:]))
+
+    def test_jsonl(self):
+        rows = [json.loads(line) for line in self.export(format='jsonl').splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['reporter'], 'worker')
+        # newest first, like the list
+        self.assertEqual(rows, sorted(rows, key=lambda row: (row['date'], row['id']), reverse=True))
+
+    def test_query_count_does_not_grow_with_rows(self):
+        # the rows are only read while the response streams, in a single query
+        response = self.client.get(reverse('incident:export'))
+        with self.assertNumQueries(1):
+            b''.join(response.streaming_content)
+
+    def test_employees_cannot_export(self):
+        self.client.force_login(self.reporter)
+        self.assertEqual(self.client.get(reverse('incident:export')).status_code, 302)
+
+
+class ImportIncidentsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('boss', password='pw')
+        Incident.objects.create(title='Slip in warehouse', body='Already here')
+
+    def run_import(self, content, extension='.csv', **options):
+        with tempfile.NamedTemporaryFile('w', suffix=extension, delete=False) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        out, err = StringIO(), StringIO()
+        call_command('import_incidents', file.name, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import(self):
+        out, err = self.run_import(
+            'title,body,status,date,reporter,assigned_to\n'
+            'Slip in warehouse,Wet floor,closed,2019-03-04 13:05,boss,boss\n'
+            'Slip in warehouse,Wet floor again,,2019-03-05,,\n'
+            'Bad,x,weird,2019-03-05,,\n'
+        )
+        self.assertIn('Imported 2 incidents', out)
+        self.assertIn("line 4: unknown status 'weird', skipped", err)
+
+        closed = Incident.objects.get(slug='slip-in-warehouse-1')
+        self.assertEqual((closed.status, closed.reporter, closed.assigned_to), ('closed', self.manager, self.manager))
+        # the legacy date is kept, not replaced by auto_now_add
+        self.assertEqual(closed.date, datetime(2019, 3, 4, 13, 5))
+        self.assertEqual(Incident.objects.get(slug='slip-in-warehouse-2').status, 'new')
+
+        # the slug counter carries on after the imported numbers
+        self.assertEqual(Incident.objects.create(title='Slip in warehouse', body='x').slug, 'slip-in-warehouse-3')
+        self.assertTrue(Incident._meta.get_field('date').auto_now_add)
+
+    def test_jsonl_import_skips_bad_records(self):
+        out, err = self.run_import(
+            '{"title": "Cut finger", "body": "Knife", "reporter": "boss", "date": "2020-01-01"}\n'
+            '{"title": "Cut finger", "reporter": "nobody"}\n'
+            'not json\n'
+            '{"title": "Cut finger", "slug": "custom-slug"}\n',
+            extension='.jsonl',
+        )
+        self.assertIn('Imported 2 incidents', out)
+        self.assertIn("line 2: no user called 'nobody' (reporter), skipped", err)
+        self.assertIn('line 3:', err)
+        self.assertEqual(
+            sorted(Incident.objects.filter(title='Cut finger').values_list('slug', flat=True)),
+            ['custom-slug', 'cut-finger'],
+        )
+
+    def test_jsonl_import_skips_records_with_fields_that_arent_text(self):
+        out, err = self.run_import(
+            '{"title": 5}\n'
+            '{"title": "Slip", "status": ["new"]}\n'
+            '{"title": "Slip", "reporter": {}}\n'
+            '{"title": "Slip", "date": 2020}\n'
+            '{"title": "Slip", "reporter": "boss"}\n',
+            extension='.jsonl',
+        )
+        self.assertIn('Imported 1 incidents', out)
+        self.assertIn('line 1: title is not text, skipped', err)
+        self.assertIn('line 2: status is not text, skipped', err)
+        self.assertIn('line 3: reporter is not text, skipped', err)
+        self.assertIn('line 4: date is not text, skipped', err)
+
+    def test_bad_slugs_are_skipped(self):
+        out, err = self.run_import(
+            '{"title": "Slip", "slug": "has spaces"}\n'
+            '{"title": "Slip", "slug": "%s"}\n'
+            '{"title": "Slip", "slug": "slip-in-hall"}\n' % ('x' * 51),
+            extension='.jsonl',
+        )
+        self.assertIn('Imported 1 incidents', out)
+        self.assertIn("line 1: slug 'has spaces' may only have letters, numbers, underscores and hyphens, skipped", err)
+        self.assertIn('line 2: slug is longer than 50 characters, skipped', err)
+        self.assertEqual(list(Incident.objects.filter(title='Slip').values_list('slug', flat=True)), ['slip-in-hall'])
+
+    def test_unreadable_files_are_command_errors(self):
+        with self.assertRaisesMessage(CommandError, 'No such file'):
+            call_command('import_incidents', '/nonexistent/incidents.csv', stdout=StringIO())
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as file:
+            file.write(b'title,body\nCaf\xe9 spill,x\n')
+        self.addCleanup(os.remove, file.name)
+        with self.assertRaisesMessage(CommandError, 'is not UTF-8 text'):
+            call_command('import_incidents', file.name, stdout=StringIO(), stderr=StringIO())
+
+    def test_rollups_are_updated(self):
+        rows = ''.join(f'Fall {n},x,{status},2021-06-0{n % 5 + 1},boss,\n' for n, status in enumerate(['new', 'closed'] * 10))
+        self.run_import('title,body,status,date,reporter,assigned_to\n' + rows, batch_size=7)
+        live = live_dashboard_stats(Incident.objects.all())
+        rolled_up = dashboard_stats()
+        for key in ('total', 'new', 'closed'):
+            self.assertEqual(rolled_up[key], live[key])
+
+    def test_queries_per_batch_do_not_grow_with_rows(self):
+        header = 'title,body,status,date,reporter,assigned_to\n'
+        counts = []
+        for day, rows in ((1, 5), (2, 50)):
+            content = header + ''.join(f'Trip {rows}-{n},x,new,2022-01-0{day},boss,boss\n' for n in range(rows))
+            with CaptureQueriesContext(connection) as ctx:
+                self.run_import(content, batch_size=100)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class LiveNotificationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('worker', password='pw')
+        cls.incident = Incident.objects.create(title='Cut', body='Finger', reporter=cls.user)
+
+    def test_broker_delivers_events_published_on_other_threads(self):
+        broker = InProcessBroker()
+
+        async def listen():
+            events = broker.subscribe(self.user.pk, heartbeat=5)
+            self.assertIsNone(await anext(events))  # listening now
+            threading.Thread(target=broker.publish, args=(self.user.pk, {'type': 'read', 'marked': 1})).start()
+            event = await anext(events)
+            await events.aclose()
+            return event
+
+        self.assertEqual(async_to_sync(listen)(), {'type': 'read', 'marked': 1})
+        self.assertEqual(broker.subscribers, {})
+
+    def test_broker_heartbeat(self):
+        async def listen():
+            events = InProcessBroker().subscribe(self.user.pk, heartbeat=0.01)
+            received = [await anext(events), await anext(events)]
+            await events.aclose()
+            return received
+
+        self.assertEqual(async_to_sync(listen)(), [None, None])
+
+    @override_settings(LIVE_NOTIFICATIONS=True)
+    def test_events_are_published_after_commit(self):
+        with mock.patch('incident_reporter.live.publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                notification, = create_notifications([self.user.pk], self.incident, 'hi', 'new_incident')
+                publish.assert_not_called()
+            publish.assert_called_once_with(self.user.pk, {
+                'type': 'notification', 'id': notification.pk, 'message': 'hi', 'notification_type': 'new_incident',
+                'url': reverse('incident:mark-notification-read', args=[notification.pk]),
+            })
+
+            publish.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                mark_notifications_read(self.user, Notification.objects.filter(user=self.user))
+            publish.assert_called_once_with(self.user.pk, {'type': 'read', 'marked': 1})
+
+    def test_nothing_is_published_when_turned_off(self):
+        with mock.patch('incident_reporter.live.publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                create_notifications([self.user.pk], self.incident, 'hi', 'new_incident')
+        publish.assert_not_called()
+
+    @override_settings(LIVE_NOTIFICATIONS=True)
+    def test_stream_is_not_served_over_wsgi(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('incident:notification-stream')).status_code, 204)
+
+    @override_settings(LIVE_NOTIFICATIONS=True)
+    async def test_stream(self):
+        await sync_to_async(create_notification)(self.user, self.incident, 'hi', 'new_incident')
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('incident:notification-stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        content = response.streaming_content
+        first = (await anext(content)).decode()
+        self.assertIn('event: unread\ndata: {"type": "unread", "count": 1}\n\n', first)
+
+        get_broker().publish(self.user.pk, {'type': 'read', 'marked': 1})
+        self.assertEqual((await anext(content)).decode(), 'event: read\ndata: {"type": "read", "marked": 1}\n\n')
+        await content.aclose()
+
+    @override_settings(LIVE_NOTIFICATIONS=True)
+    async def test_stream_counts_notifications_from_before_it_listens(self):
+        await self.async_client.aforce_login(self.user)
+        subscribe = InProcessBroker.subscribe
+
+        async def subscribe_late(broker, user_id, heartbeat):
+            # arrives after the user was loaded, before the stream is listening
+            await sync_to_async(create_notification)(self.user, self.incident, 'hi', 'new_incident')
+            async for event in subscribe(broker, user_id, heartbeat):
+                yield event
+
+        with mock.patch.object(InProcessBroker, 'subscribe', subscribe_late):
+            response = await self.async_client.get(reverse('incident:notification-stream'))
+            content = response.streaming_content
+            first = (await anext(content)).decode()
+            await content.aclose()
+        self.assertIn('"count": 1', first)
+
+
+class NotificationsApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('boss', password='pw')
+        cls.incident = Incident.objects.create(title='Cut', body='Finger', reporter=cls.user)
+        create_notifications([cls.user.pk], cls.incident, 'first', 'new_incident')
+        create_notifications([cls.user.pk], cls.incident, 'second', 'new_incident')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('incident:notifications-api')
+
+    def test_lists_notifications_oldest_first(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual([n['message'] for n in data['notifications']], ['first', 'second'])
+        self.assertEqual(data['unread_count'], 2)
+        self.assertEqual(data['cursor'], data['notifications'][-1]['id'])
+        self.assertEqual(data['notifications'][0]['incident'], self.incident.slug)
+
+    def test_unchanged_poll_is_not_modified(self):
+        cursor = self.client.get(self.url).json()['cursor']
+        first = self.client.get(self.url, {'after': cursor})
+        self.assertEqual(first.json()['notifications'], [])
+        self.assertIn('no-cache', first['Cache-Control'])
+
+        with assert_max_queries(self, QUERY_BUDGETS['incident:notifications-api']):
+            response = self.client.get(self.url, {'after': cursor}, headers={'if-none-match': first['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_new_notification_changes_etag(self):
+        first = self.client.get(self.url)
+        create_notifications([self.user.pk], self.incident, 'third', 'status_change')
+
+        response = self.client.get(self.url, {'after': first.json()['cursor']}, headers={'if-none-match': first['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([n['message'] for n in response.json()['notifications']], ['third'])
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+    def test_reading_changes_etag(self):
+        first = self.client.get(self.url)
+        mark_notifications_read(self.user, Notification.objects.filter(user=self.user))
+
+        response = self.client.get(self.url, {'after': first.json()['cursor']}, headers={'if-none-match': first['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['unread_count'], 0)
+
+    @override_settings(NOTIFICATION_API_PAGE_SIZE=1)
+    def test_has_more(self):
+        data = self.client.get(self.url).json()
+        self.assertTrue(data['has_more'])
+        data = self.client.get(self.url, {'after': data['cursor']}).json()
+        self.assertEqual([n['message'] for n in data['notifications']], ['second'])
+        self.assertFalse(data['has_more'])
+
+    @override_settings(NOTIFICATION_API_PAGE_SIZE=1)
+    def test_next_page_is_not_answered_with_the_first_pages_etag(self):
+        first = self.client.get(self.url)
+        response = self.client.get(self.url, {'after': first.json()['cursor']}, headers={'if-none-match': first['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([n['message'] for n in response.json()['notifications']], ['second'])
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(self.url, {'after': 'x'}).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class NotificationRetentionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('boss', password='pw')
+        cls.incident = Incident.objects.create(title='Cut', body='Finger', reporter=cls.user)
+        old = timezone.now() - timedelta(days=100)
+        create_notifications([cls.user.pk], cls.incident, 'old read', 'new_incident')
+        create_notifications([cls.user.pk], cls.incident, 'old unread', 'new_incident')
+        create_notifications([cls.user.pk], cls.incident, 'recent read', 'new_incident')
+        Notification.objects.filter(message__startswith='old').update(created_at=old)
+        mark_notifications_read(cls.user, Notification.objects.filter(message__endswith=' read'))
+
+    def purge(self, **options):
+        out = StringIO()
+        call_command('purge_notifications', stdout=out, **options)
+        return out.getvalue()
+
+    def messages(self):
+        return sorted(Notification.objects.values_list('message', flat=True))
+
+    def test_only_old_read_notifications_are_deleted(self):
+        out = self.purge(read_days=90, batch_size=1)
+        self.assertIn('Deleted 1 notifications (0 unread) in 1 batches', out)
+        self.assertEqual(self.messages(), ['old unread', 'recent read'])
+
+    def test_dry_run(self):
+        self.assertIn('Would delete 1 notifications', self.purge(read_days=90, dry_run=True))
+        self.assertEqual(Notification.objects.count(), 3)
+
+    def test_unread_ttl_keeps_counter_in_step(self):
+        self.purge(read_days=0, unread_days=90, batch_size=2)
+        self.assertEqual(self.messages(), [])
+        self.assertEqual(Profile.objects.get(user=self.user).unread_notification_count, 0)
+
+    def test_archive(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'notifications.jsonl.gz')
+            self.purge(read_days=90, archive=path)
+            # a second run appends to the same file
+            self.purge(read_days=0, archive=path)
+            with gzip.open(path, 'rt') as archive:
+                rows = [json.loads(line) for line in archive]
+        self.assertEqual([row['message'] for row in rows], ['old read', 'recent read'])
+        self.assertEqual(rows[0]['incident__slug'], self.incident.slug)
+        self.assertEqual(rows[0]['user__username'], 'boss')
+
+
+class FragmentCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('boss', password='pw')
+        Profile.objects.filter(user=cls.manager).update(role='manager')
+        cls.incident = Incident.objects.create(title='Spill', body='Aisle 3', reporter=cls.manager)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.manager)
+
+    def rename_behind_the_cache(self, title):
+        # a queryset update doesn't bump `updated`, so the cached copies stay current
+        Incident.objects.filter(pk=self.incident.pk).update(title=title)
+
+    def test_cached_until_the_incident_is_saved(self):
+        page = reverse('incident:page', args=[self.incident.slug])
+        self.assertContains(self.client.get(page), 'Spill')
+        self.assertContains(self.client.get(reverse('incident:list')), 'Spill')
+        self.rename_behind_the_cache('Flood')
+        self.assertContains(self.client.get(page), 'Spill')
+        self.assertContains(self.client.get(reverse('incident:list')), 'Spill')
+
+        Incident.objects.get(pk=self.incident.pk).save()
+        self.assertContains(self.client.get(page), 'Flood')
+        self.assertContains(self.client.get(reverse('incident:list')), 'Flood')
+
+    def test_status_update_invalidates(self):
+        self.assertContains(self.client.get(reverse('incident:manager-dashboard')), 'Spill')
+        self.rename_behind_the_cache('Flood')
+        self.client.post(reverse('incident:update-status', args=[self.incident.slug]), {'status': 'in_progress', 'version': 1})
+        response = self.client.get(reverse('incident:manager-dashboard'))
+        self.assertContains(response, 'Flood')
+        self.assertNotContains(response, 'Spill')
+
+    def test_admin_action_invalidates(self):
+        page = reverse('incident:page', args=[self.incident.slug])
+        self.assertContains(self.client.get(page), 'New')
+        admin = admin_site._registry[Incident]
+        mark_closed = next(action for action in admin.actions if action.__name__ == 'mark_closed')
+        with mock.patch.object(admin, 'message_user'):
+            mark_closed(admin, mock.Mock(user=self.manager), Incident.objects.all())
+        self.assertContains(self.client.get(page), 'Closed')
+
+    def test_role_is_part_of_the_page_key(self):
+        page = reverse('incident:page', args=[self.incident.slug])
+        self.assertContains(self.client.get(page), 'Update Status')
+        self.client.force_login(User.objects.create_user('worker', password='pw'))
+        self.assertNotContains(self.client.get(page), 'Update Status')
+
+
+@override_settings(JOBS_RUN_EAGERLY=False)
+class OptimisticConcurrencyTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('boss', password='pw')
+        cls.other = User.objects.create_user('other', password='pw')
+        Profile.objects.filter(user__in=[cls.manager, cls.other]).update(role='manager')
+        cls.incident = Incident.objects.create(title='Spill', body='Aisle 3', reporter=cls.manager)
+
+    def setUp(self):
+        self.client.force_login(self.manager)
+        self.url = reverse('incident:update-status', args=[self.incident.slug])
+
+    def test_every_save_bumps_the_version(self):
+        incident = Incident.objects.get(pk=self.incident.pk)
+        self.assertEqual(incident.version, 1)
+        incident.status = 'closed'
+        incident.save(update_fields=['status'])
+        self.assertEqual(Incident.objects.get(pk=incident.pk).version, 2)
+
+    def test_stale_version_conflicts(self):
+        first, second = Incident.objects.get(pk=self.incident.pk), Incident.objects.get(pk=self.incident.pk)
+        first.status = 'in_progress'
+        first.save_if_unmodified(1, ['status'])
+        second.status = 'closed'
+        with self.assertRaises(IncidentConflict):
+            second.save_if_unmodified(1, ['status'])
+        self.assertEqual(second.version, 1)
+        self.assertEqual(Incident.objects.get(pk=self.incident.pk).status, 'in_progress')
+
+    def test_only_changed_fields_are_written(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, {'status': 'in_progress', 'version': 1})
+        update = next(q['sql'] for q in queries if q['sql'].startswith('UPDATE "incident_reporter_incident"'))
+        self.assertIn('"status"', update)
+        self.assertNotIn('"title"', update)
+        self.assertNotIn('"assigned_to_id"', update)
+        self.assertIn('"version" = 1', update.split('WHERE')[1])
+
+    def test_second_manager_gets_a_conflict(self):
+        self.client.post(self.url, {'status': 'in_progress', 'version': 1})
+        self.client.force_login(self.other)
+        response = self.client.post(self.url, {'status': 'closed', 'version': 1})
+        self.assertContains(response, 'Somebody else updated this incident', status_code=409)
+        self.assertContains(response, 'name="version" value="2"', status_code=409)
+        self.assertEqual(Incident.objects.get(pk=self.incident.pk).status, 'in_progress')
+        # only the update that went through queued a notification
+        self.assertEqual(Job.objects.filter(name='notify_status_change').count(), 1)
+
+    def test_incident_page_conditional_get(self):
+        page = reverse('incident:page', args=[self.incident.slug])
+        response = self.client.get(page)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(page, headers={'if-none-match': etag}).status_code, 304)
+
+        self.client.post(self.url, {'status': 'in_progress', 'version': 1})
+        self.assertEqual(self.client.get(page, headers={'if-none-match': etag}).status_code, 200)
+
+    def test_etag_depends_on_the_viewer(self):
+        page = reverse('incident:page', args=[self.incident.slug])
+        etag = self.client.get(page)['ETag']
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(page, headers={'if-none-match': etag}).status_code, 200)
+
+
+class IncidentEventTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('boss', password='pw')
+        Profile.objects.filter(user=cls.manager).update(role='manager')
+        cls.incident = Incident.objects.create(title='Spill', body='Aisle 3', reporter=cls.manager)
+
+    def test_status_update_logs_an_event(self):
+        self.client.force_login(self.manager)
+        url = reverse('incident:update-status', args=[self.incident.slug])
+        self.client.post(url, {'status': 'in_progress', 'assigned_to': self.manager.pk, 'version': 1})
+        # nothing changed, nothing logged
+        self.client.post(url, {'status': 'in_progress', 'assigned_to': self.manager.pk, 'version': 2})
+        event = IncidentEvent.objects.get()
+        self.assertEqual((event.previous_status, event.status), ('new', 'in_progress'))
+        self.assertEqual(event.assigned_to, self.manager)
+        self.assertEqual(event.actor, self.manager)
+
+    def test_admin_action_logs_events(self):
+        admin = admin_site._registry[Incident]
+        mark_resolved = next(action for action in admin.actions if action.__name__ == 'mark_resolved')
+        with mock.patch.object(admin, 'message_user'):
+            mark_resolved(admin, mock.Mock(user=self.manager), Incident.objects.all())
+        self.assertEqual(list(IncidentEvent.objects.values_list('previous_status', 'status')), [('new', 'resolved')])
+
+    def event(self, incident, previous_status, status, hours):
+        IncidentEvent.objects.create(
+            incident=incident, previous_status=previous_status, status=status,
+            timestamp=incident.date + timedelta(hours=hours),
+        )
+
+    def test_analytics(self):
+        other = Incident.objects.create(title='Trip', body='Cable', reporter=self.manager)
+        self.event(self.incident, 'new', 'in_progress', 1)
+        self.event(self.incident, 'in_progress', 'resolved', 5)
+        self.event(other, 'new', 'in_progress', 3)
+        self.event(other, 'in_progress', 'resolved', 13)
+
+        states = time_in_state()
+        self.assertEqual(set(states), {'new', 'in_progress'})
+        self.assertEqual(states['new']['count'], 2)
+        self.assertEqual(states['new']['p50'], timedelta(hours=1))
+        self.assertEqual(states['new']['max'], timedelta(hours=3))
+        self.assertEqual(states['in_progress']['mean'], timedelta(hours=7))
+
+        resolved = resolution_times()
+        self.assertEqual(resolved['count'], 2)
+        self.assertEqual(resolved['p50'], timedelta(hours=5))
+        self.assertEqual(resolved['p95'], timedelta(hours=13))
+        self.assertEqual(resolution_times(since=timezone.now() + timedelta(hours=6))['count'], 1)
+
+    def test_reassignment_doesnt_split_a_stay(self):
+        self.event(self.incident, 'new', 'new', 1)
+        self.event(self.incident, 'new', 'in_progress', 10)
+        states = time_in_state()
+        self.assertEqual(states['new']['count'], 1)
+        self.assertEqual(states['new']['p50'], timedelta(hours=10))
+
+
+class BenchWritesTests(TransactionTestCase):
+
+    def test_runs_and_cleans_up(self):
+        out = StringIO()
+        call_command('bench_writes', threads=1, seconds=0.2, fanout=2, stdout=out)
+        self.assertIn('writes/s', out.getvalue())
+        self.assertFalse(Incident.objects.exists())
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(User.objects.filter(username__startswith='bench-writes-').exists())
+
+
+class BenchmarkTests(TestCase):
+
+    def test_seed_and_run_every_scenario(self):
+        created = seed_data(users=4, managers=2, incidents=30, notifications_per_incident=2, seed=1)
+        self.assertEqual(created, {'users': 4, 'managers': 2, 'incidents': 30, 'notifications': 60})
+        # the unread counters match the seeded notifications
+        for profile in Profile.objects.filter(role='manager'):
+            self.assertEqual(
+                profile.unread_notification_count,
+                Notification.objects.filter(user_id=profile.user_id, is_read=False).count(),
+            )
+
+        runner = ScenarioRunner(seed=1)
+        for scenario in SCENARIOS:
+            metrics = run_scenario(runner, scenario, 3)
+            self.assertEqual(metrics['errors'], 0, scenario)
+            self.assertLessEqual(metrics['p50_ms'], metrics['p99_ms'])
+        self.assertEqual(run_scenario(runner, 'incident_list', 0), {'requests': 0, 'errors': 0})
+
+        with self.assertRaisesMessage(CommandError, '--requests must be at least 1.'):
+            call_command('run_benchmarks', requests=0, stdout=StringIO())
+        out = StringIO()
+        call_command('run_benchmarks', scenario=['incident_list'], requests=1, warmup=0, stdout=out)
+        self.assertIn('incident_list', out.getvalue())
+
+    def test_compare(self):
+        baseline = {'incident_list': {'p95_ms': 10.0, 'queries_max': 5}}
+        self.assertEqual(compare({'incident_list': {'p95_ms': 11.0, 'queries_max': 5}}, baseline), [])
+        regressions = compare({'incident_list': {'p95_ms': 13.0, 'queries_max': 6}}, baseline)
+        self.assertEqual(len(regressions), 2)
+
+
+@override_settings(INSTRUMENTATION_ENABLED=True, INSTRUMENTATION_SAMPLE_RATE=1.0, INSTRUMENTATION_METRICS_TOKEN='secret')
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        # keep the profiled requests out of the real request log
+        handlers = mock.patch.object(logging.getLogger('safetytracker.requests'), 'handlers', [logging.NullHandler()])
+        handlers.start()
+        self.addCleanup(handlers.stop)
+        self.manager = User.objects.create_user('boss', password='pw')
+        self.manager.profile.role = 'manager'
+        self.manager.profile.save()
+        self.incident = make_incidents(1, reporter=self.manager)[0]
+        self.client.force_login(self.manager)
+
+    def test_profiled_request_is_logged(self):
+        with self.assertLogs('safetytracker.requests') as logs:
+            self.client.get(reverse('incident:page', args=[self.incident.slug]))
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['view'], 'incident:page')
+        self.assertEqual(entry['status'], 200)
+        self.assertGreater(entry['queries'], 0)
+        self.assertGreater(entry['template_ms'], 0)
+        self.assertLessEqual(entry['db_ms'], entry['wall_ms'])
+        self.assertLessEqual(len(entry['slow_queries']), min(entry['queries'], 5))
+        self.assertTrue(entry['slow_queries'][0]['sql'].startswith('SELECT'))
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_are_only_counted(self):
+        with self.assertNoLogs('safetytracker.requests'):
+            self.client.get(reverse('incident:list'))
+        text = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer secret'}).content.decode()
+        self.assertIn('safetytracker_request_duration_seconds_count{view="incident:list"} 1', text)
+        self.assertIn('safetytracker_sampled_requests_total{view="incident:list"} 0', text)
+
+    def test_metrics_access(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+        self.manager.is_staff = True
+        self.manager.save()
+        self.client.force_login(self.manager)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+        with override_settings(INSTRUMENTATION_ENABLED=False):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+
+class IncidentTrendTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.manager = User.objects.create_user('boss', password='pw')
+        self.manager.profile.role = 'manager'
+        self.manager.profile.save()
+        self.reporter = User.objects.create_user('ann', password='pw')
+        days = [(date(2025, 1, 2), 'new'), (date(2025, 1, 2), 'new'), (date(2025, 1, 3), 'resolved'),
+                (date(2025, 1, 8), 'in_progress'), (date(2025, 1, 20), 'resolved')]
+        self.incidents = []
+        for day, status in days:
+            incident = Incident.objects.create(title='Slip', body='Wet floor', reporter=self.reporter, status=status)
+            Incident.objects.filter(pk=incident.pk).update(date=datetime.combine(day, datetime.min.time()))
+            self.incidents.append(incident)
+        rebuild_rollups()
+        self.today = date(2025, 1, 21)
+
+    def test_weekly_by_status(self):
+        trend = trend_series('week', 'status', since=date(2025, 1, 1), today=self.today)
+        self.assertEqual(trend['buckets'], ['2024-12-30', '2025-01-06', '2025-01-13', '2025-01-20'])
+        self.assertEqual(trend['series']['new'], [2, 0, 0, 0])
+        self.assertEqual(trend['series']['resolved'], [1, 0, 0, 1])
+        self.assertEqual(trend['series']['in_progress'], [0, 1, 0, 0])
+
+    def test_same_counts_without_rollups(self):
+        for period in ('day', 'week', 'month'):
+            for group_by in ('', 'status', 'reporter'):
+                expected = trend_series(period, group_by, since=date(2024, 12, 1), today=self.today)
+                cache.clear()
+                with self.settings(INCIDENT_DASHBOARD_ROLLUPS=False):
+                    self.assertEqual(trend_series(period, group_by, since=date(2024, 12, 1), today=self.today), expected)
+        self.assertEqual(expected['series'], {'ann': [0, 5]})
+
+    def test_only_the_open_bucket_is_recounted(self):
+        trend_series('day', since=date(2025, 1, 1), today=self.today)
+        with CaptureQueriesContext(connection) as queries:
+            trend = trend_series('day', since=date(2025, 1, 1), today=self.today)
+        self.assertEqual(len(queries), 1)
+        self.assertIn("'2025-01-21'", queries[0]['sql'])
+        self.assertEqual(sum(trend['series']['total']), 5)
+
+        # an old incident changing status drops its cached buckets
+        self.assertEqual(trend_series('day', 'status', since=date(2025, 1, 1), today=self.today)['series']['new'][1], 2)
+        incident = Incident.objects.get(pk=self.incidents[0].pk)
+        incident.status = 'closed'
+        with self.captureOnCommitCallbacks(execute=True):
+            incident.save()
+        trend = trend_series('day', 'status', since=date(2025, 1, 1), today=self.today)
+        self.assertEqual(trend['series']['new'][1], 1)
+        self.assertEqual(trend['series']['closed'][1], 1)
+
+    def test_change_keeps_the_other_buckets_cached(self):
+        trend_series('day', since=date(2025, 1, 1), today=self.today)
+        incident = Incident.objects.get(pk=self.incidents[4].pk)
+        incident.status = 'closed'
+        with self.captureOnCommitCallbacks(execute=True):
+            incident.save()
+        with CaptureQueriesContext(connection) as queries:
+            trend = trend_series('day', since=date(2025, 1, 1), today=self.today)
+        # just the changed day and the open one
+        self.assertEqual(len(queries), 1)
+        self.assertIn("'2025-01-20'", queries[0]['sql'])
+        self.assertEqual(sum(trend['series']['total']), 5)
+
+    def test_rebuilding_the_rollups_drops_cached_buckets(self):
+        self.assertEqual(trend_series('day', 'status', since=date(2025, 1, 1), today=self.today)['series']['new'][1], 2)
+        Incident.objects.filter(pk=self.incidents[0].pk).update(status='closed')
+        with self.captureOnCommitCallbacks(execute=True):
+            rebuild_rollups()
+        trend = trend_series('day', 'status', since=date(2025, 1, 1), today=self.today)
+        self.assertEqual(trend['series']['new'][1], 1)
+
+    def test_change_while_counting_isnt_cached(self):
+        count_buckets = trends.count_buckets
+
+        def count_then_change(*args):
+            counts = count_buckets(*args)
+            # another request commits a change before these counts are cached
+            incident = Incident.objects.get(pk=self.incidents[0].pk)
+            incident.status = 'closed'
+            with self.captureOnCommitCallbacks(execute=True):
+                incident.save()
+            return counts
+
+        with mock.patch.object(trends, 'count_buckets', count_then_change):
+            stale = trend_series('day', 'status', since=date(2025, 1, 1), today=self.today)
+        self.assertEqual(stale['series']['new'][1], 2)
+        trend = trend_series('day', 'status', since=date(2025, 1, 1), today=self.today)
+        self.assertEqual(trend['series']['new'][1], 1)
+
+    def test_top_reporters(self):
+        other = User.objects.create_user('bob')
+        Incident.objects.filter(pk=self.incidents[0].pk).update(reporter=other)
+        rebuild_rollups()
+        trend = trend_series('month', 'reporter', since=date(2025, 1, 1), today=self.today, top=1)
+        self.assertEqual(trend['series'], {'ann': [4], 'other': [1]})
+
+    def test_view(self):
+        url = reverse('incident:trends')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(self.reporter)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.manager)
+        response = self.client.get(url, {'period': 'month', 'group_by': 'status'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['buckets']), 24)
+        for params in ({'period': 'year'}, {'group_by': 'title'}, {'since': 'yesterday'}, {'since': '1990-01-01'}):
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+
+
+class StaticBuildTests(TestCase):
+
+    def test_purge_css(self):
+        css = (
+            '@charset "UTF-8";:root{--bs-blue:#0d6efd}.btn,.carousel{color:red}.carousel .btn{margin:0}'
+            '@media (min-width:768px){.carousel{display:none}.card{padding:1rem}}'
+            '@keyframes spin{to{transform:rotate(1turn)}}.bi-bell::before{content:"\\f18a"}.bi-x::before{content:"}"}'
+        )
+        self.assertEqual(purge_css(css, {'btn', 'card', 'bi-bell'}), (
+            '@charset "UTF-8";:root{--bs-blue:#0d6efd}.btn{color:red}'
+            '@media (min-width:768px){.card{padding:1rem}}'
+            '@keyframes spin{to{transform:rotate(1turn)}}.bi-bell::before{content:"\\f18a"}'
+        ))
+
+    def test_collectstatic(self):
+        with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as extra:
+            os.makedirs(os.path.join(extra, 'vendor', 'bootstrap'))
+            with open(os.path.join(extra, 'vendor', 'bootstrap', 'bootstrap.min.css'), 'w') as file:
+                file.write('.btn{color:red}' * 50 + '.carousel{display:block}')
+
+            with override_settings(STATIC_ROOT=root, STATICFILES_DIRS=[*settings.STATICFILES_DIRS, extra]):
+                call_command('collectstatic', interactive=False, verbosity=0)
+                with open(os.path.join(root, 'staticfiles.json')) as file:
+                    manifest = json.load(file)['paths']
+
+                # purged, hashed and compressed
+                hashed = manifest['vendor/bootstrap/bootstrap.min.css']
+                with open(os.path.join(root, hashed)) as file:
+                    css = file.read()
+                self.assertIn('.btn{', css)
+                self.assertNotIn('carousel', css)
+                with gzip.open(os.path.join(root, hashed + '.gz'), 'rt') as file:
+                    self.assertEqual(file.read(), css)
+                self.assertEqual(staticfiles_storage.url('css/homepage.css'), '/static/' + manifest['css/homepage.css'])
+
+                request = RequestFactory().get('/', headers={'accept-encoding': 'gzip'})
+                response = serve_static(request, hashed)
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+                self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+                self.assertEqual(response['Content-Type'], 'text/css')
+                self.assertIn('Accept-Encoding', response['Vary'])
+                response = serve_static(RequestFactory().get('/'), 'css/homepage.css')
+                self.assertEqual(response['Cache-Control'], 'public, no-cache')
+                self.assertFalse(response.has_header('Content-Encoding'))
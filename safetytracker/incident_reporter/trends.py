@@ -0,0 +1,206 @@
+import time as clock
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from .models import Incident, IncidentRollup
+
+# Incident counts per day, week or month for the trend charts.
+#
+# The database does the grouping (Trunc* on the rollup day, or on
+# Incident.date with INCIDENT_DASHBOARD_ROLLUPS off), so years of data come
+# back as one row per bucket and series. Past buckets are kept in the cache
+# one per key and only counted again when adjust_rollup() reports a change to
+# an incident on a past day (an old incident changing status, a deletion, an
+# import) or the rollups are rebuilt. The bucket today is in is always counted
+# afresh, and a request normally only queries that one.
+#
+# Every bucket has a version in the cache, part of the keys its counts are
+# stored under, and a change drops the versions of the buckets its day is in
+# rather than the counts: a request that counted before the change committed
+# then stores its counts under a version nobody looks for any more, instead
+# of putting them back for a day. Rebuilding the rollups drops the
+# generation, which is part of every key.
+
+PERIODS = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+GROUPS = {'': None, 'status': 'status', 'reporter': 'reporter_id'}
+# what a request asks for without ?since=
+DEFAULT_BUCKETS = {'day': 90, 'week': 52, 'month': 24}
+OTHER_REPORTERS = 'other'
+# most buckets one request may ask for (about 5 years of days)
+MAX_BUCKETS = 2000
+
+
+def bucket_start(day, period):
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, period):
+    if period == 'week':
+        return start + timedelta(weeks=1)
+    if period == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def default_since(period, today):
+    start = bucket_start(today, period)
+    for _ in range(DEFAULT_BUCKETS[period] - 1):
+        start = bucket_start(start - timedelta(days=1), period)
+    return start
+
+
+GENERATION_KEY = 'incident:trends:generation'
+
+
+def version_key(period, start):
+    return f'incident:trends:version:{period}:{start.isoformat()}'
+
+
+def bucket_key(version, period, group_by, start):
+    return f'incident:trends:{version}:{period}:{group_by or "total"}:{start.isoformat()}'
+
+
+def stamp(key):
+    # from the clock, so a version dropped from the cache is never used again
+    cache.add(key, clock.time_ns(), None)
+    return cache.get(key)
+
+
+def bucket_versions(period, starts):
+    """
+    {bucket start: version} for the buckets starting at `starts`, new ones
+    for those without a version yet.
+    """
+    keys = {start: version_key(period, start) for start in starts}
+    found = cache.get_many([GENERATION_KEY, *keys.values()])
+    generation = found.get(GENERATION_KEY) or stamp(GENERATION_KEY)
+    return {start: f'{generation}.{found.get(key) or stamp(key)}' for start, key in keys.items()}
+
+
+def forget_day(day):
+    """
+    Stop using the cached buckets that `day` is in once the transaction
+    commits. Called by rollups.adjust_rollup() whenever a count changes.
+    """
+    keys = [version_key(period, bucket_start(day, period)) for period in PERIODS]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def forget_all():
+    """
+    Stop using any cached bucket once the transaction commits.
+    Called by rollups.rebuild_rollups().
+    """
+    transaction.on_commit(lambda: cache.delete(GENERATION_KEY))
+
+
+def count_buckets(period, group_by, start, end):
+    """
+    {bucket start: {series: count}} for the buckets from `start` up to (not
+    including) `end`, in one grouped query. Empty buckets are left out.
+    """
+    field = GROUPS[group_by]
+    if settings.INCIDENT_DASHBOARD_ROLLUPS:
+        rows = (
+            IncidentRollup.objects.filter(day__gte=start, day__lt=end)
+            .annotate(bucket=PERIODS[period]('day', output_field=DateField()))
+            .values('bucket', *filter(None, [field]))
+            .annotate(count=Sum('incident_count'))
+        )
+    else:
+        rows = (
+            Incident.objects.filter(date__gte=datetime.combine(start, time.min), date__lt=datetime.combine(end, time.min))
+            .annotate(bucket=PERIODS[period]('date', output_field=DateField()))
+            .values('bucket', *filter(None, [field]))
+            .annotate(count=Count('id'))
+        )
+
+    counts = {}
+    for row in rows.order_by():
+        if row['count']:
+            series = counts.setdefault(row['bucket'], {})
+            name = row[field] if field else 'total'
+            series[name] = series.get(name, 0) + row['count']
+    return counts
+
+
+def trend_buckets(period, group_by, since, today=None):
+    """
+    [(bucket start, {series: count}), ...] from the bucket `since` is in to
+    the one `today` is in, oldest first.
+    """
+    today = today or date.today()
+    starts = []
+    start, current = bucket_start(since, period), bucket_start(today, period)
+    while start <= current:
+        starts.append(start)
+        start = next_bucket(start, period)
+    if not starts:
+        return []
+
+    # read before counting, so a change committing meanwhile outdates what is stored below
+    versions = bucket_versions(period, starts[:-1])
+    keys = {start: bucket_key(versions[start], period, group_by, start) for start in starts[:-1]}
+    cached = cache.get_many(list(keys.values()))
+    buckets = {start: cached[key] for start, key in keys.items() if key in cached}
+    missing = [start for start in starts if start not in buckets]
+
+    # one query from the oldest missing bucket to the open one, usually just the open one
+    counts = count_buckets(period, group_by, missing[0], next_bucket(current, period))
+    fresh = {start: counts.get(start, {}) for start in missing}
+    buckets.update(fresh)
+    fresh.pop(current)
+    if fresh:
+        cache.set_many({keys[start]: series for start, series in fresh.items()}, settings.INCIDENT_TREND_CACHE_TIMEOUT)
+    return [(start, buckets[start]) for start in starts]
+
+
+def trend_series(period, group_by='', since=None, today=None, top=10):
+    """
+    Compact series for a chart: the bucket start dates and one list of
+    counts per series, aligned with them. Series are 'total', one per status,
+    or the `top` reporters by username with everybody else as 'other'.
+    """
+    today = today or date.today()
+    buckets = trend_buckets(period, group_by, since or default_since(period, today), today)
+
+    if group_by == 'status':
+        names = [status for status, _label in Incident.STATUS_CHOICES]
+    elif group_by == 'reporter':
+        totals = Counter()
+        for _start, series in buckets:
+            totals.update(series)
+        names = sorted(totals, key=lambda name: (-totals[name], name is None, name or 0))[:top]
+    else:
+        names = ['total']
+
+    if group_by == 'reporter':
+        usernames = dict(User.objects.filter(pk__in=[pk for pk in names if pk]).values_list('pk', 'username'))
+        labels = {pk: usernames.get(pk, 'anonymous') if pk else 'anonymous' for pk in names}
+    else:
+        labels = {name: name for name in names}
+
+    series = {labels[name]: [counts.get(name, 0) for _start, counts in buckets] for name in names}
+    if group_by == 'reporter':
+        kept = set(names)
+        other = [sum(n for name, n in counts.items() if name not in kept) for _start, counts in buckets]
+        if any(other):
+            series[OTHER_REPORTERS] = other
+
+    return {
+        'period': period,
+        'group_by': group_by or None,
+        'buckets': [start.isoformat() for start, _series in buckets],
+        'series': series,
+    }
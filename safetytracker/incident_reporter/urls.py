@@ -10,7 +10,11 @@ urlpatterns = [
     path('notifications/', views.notifications_list, name='notifications'),
     path('notifications/<int:notification_id>/read/', views.mark_notification_read, name='mark-notification-read'),
     path('notifications/mark-all-read/', views.mark_all_notifications_read, name='mark-all-read'),
+    path('notifications/stream/', views.notification_stream, name='notification-stream'),
+    path('notifications/api/', views.notifications_api, name='notifications-api'),
     path('manager-dashboard/', views.manager_dashboard, name='manager-dashboard'),
+    path('trends/', views.incident_trends, name='trends'),
+    path('export/', views.incident_export, name='export'),
     path('<slug:slug>/', views.incident_page, name='page'),
     path('<slug:slug>/update-status/', views.incident_update_status, name='update-status'),
 ]
\ No newline at end of file
@@ -1,50 +1,210 @@
-from .models import Notification
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from .jobs import enqueue, job
+from .live import publish_notifications, publish_read
+from .models import Incident, Notification
 from users.models import Profile
 
+def adjust_unread_count(user_ids, delta):
+    """
+    Add `delta` to the unread notification counter on each user's Profile.
+    Done as a single UPDATE ... SET count = count + delta, so concurrent
+    requests can't lose each other's changes. Never goes below zero.
+    """
+    if not user_ids or not delta:
+        return
+    Profile.objects.filter(user_id__in=user_ids).update(
+        unread_notification_count=Greatest(F('unread_notification_count') + delta, 0)
+    )
+
 def create_notification(user, incident, message, notification_type):
     """
     Create a notification for a user.
     """
-    Notification.objects.create(
-        user = user,
-        incident = incident,
-        message = message,
-        notification_type = notification_type
-    )
+    with transaction.atomic():
+        notification = Notification.objects.create(
+            user = user,
+            incident = incident,
+            message = message,
+            notification_type = notification_type
+        )
+        adjust_unread_count([user.pk], 1)
+        publish_notifications([notification])
+
+def mark_notifications_read(user, notifications):
+    """
+    Mark the unread notifications in `notifications` (a queryset belonging to
+    `user`) as read and take them off the user's unread counter.
+    Returns how many were marked.
+    """
+    with transaction.atomic():
+        marked = notifications.filter(is_read=False).update(is_read=True)
+        adjust_unread_count([user.pk], -marked)
+        publish_read(user.pk, marked)
+    return marked
+
+def get_unread_count(user):
+    """
+    Unread notifications for a user, read from the counter on their Profile.
+    """
+    return user.profile.unread_notification_count
+
+def stored_unread_count(user_id):
+    """
+    A user's unread notifications straight from the database, for when the
+    Profile on the user may have been loaded before the last change.
+    """
+    return Profile.objects.filter(user_id=user_id).values_list('unread_notification_count', flat=True).first() or 0
+
+def bulk_create_notifications(notifications):
+    """
+    Save a list of unsaved Notification objects with a few INSERTs instead of
+    one per row. Rows are written in chunks of NOTIFICATION_BATCH_SIZE inside
+    a single transaction, and the unread counters are bumped with one UPDATE
+    per distinct increment rather than one per recipient.
+    """
+    batch_size = settings.NOTIFICATION_BATCH_SIZE
+    per_user = Counter(n.user_id for n in notifications)
+
+    # group recipients by how many notifications they are getting
+    by_delta = defaultdict(list)
+    for user_id, delta in per_user.items():
+        by_delta[delta].append(user_id)
+
+    with transaction.atomic():
+        for start in range(0, len(notifications), batch_size):
+            Notification.objects.bulk_create(notifications[start:start + batch_size])
+        for delta, user_ids in by_delta.items():
+            for start in range(0, len(user_ids), batch_size):
+                adjust_unread_count(user_ids[start:start + batch_size], delta)
+        # pushed to open notification streams after the commit (see live.py)
+        publish_notifications(notifications)
+    return notifications
+
+def create_notifications(user_ids, incident, message, notification_type):
+    """
+    Create the same notification for many users at once.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    return bulk_create_notifications([
+        Notification(
+            user_id = user_id,
+            incident = incident,
+            message = message,
+            notification_type = notification_type
+        )
+        for user_id in user_ids
+    ])
 
 def notify_managers_new_incident(incident):
     """
     Notify all managers when a new incident is created.
     """
-    managers = Profile.objects.filter(role='manager').select_related('user')
-    
-    for manager_profile in managers:
-        create_notification(
-            user = manager_profile.user,
+    manager_ids = Profile.objects.filter(role='manager').values_list('user_id', flat=True)
+
+    create_notifications(
+        user_ids = manager_ids,
+        incident = incident,
+        message = f"New incident reported: {incident.title}",
+        notification_type = 'new_incident'
+    )
+
+def status_change_message(incident, old_status, new_status):
+    statuses = dict(incident.STATUS_CHOICES)
+    return f"Your incident '{incident.title}' status changed from {statuses[old_status]} to {statuses[new_status]}"
+
+def notify_reporters_status_change(changes):
+    """
+    Notify reporters about many status changes at once.
+    `changes` is a list of (incident, old_status, new_status).
+    """
+    bulk_create_notifications([
+        Notification(
+            user_id = incident.reporter_id,
             incident = incident,
-            message = f"New incident reported: {incident.title}",
-            notification_type = 'new_incident'
+            message = status_change_message(incident, old_status, new_status),
+            notification_type = 'status_change'
         )
+        for incident, old_status, new_status in changes
+        if incident.reporter_id
+    ])
 
 def notify_reporter_status_change(incident, old_status, new_status):
     """
     Notify the reporter when incident status changes.
     """
-    if incident.reporter:
-        create_notification(
-            user = incident.reporter,
+    notify_reporters_status_change([(incident, old_status, new_status)])
+
+def notify_managers_assignment(incidents):
+    """
+    Notify each incident's assigned manager, for many incidents at once.
+    """
+    bulk_create_notifications([
+        Notification(
+            user_id = incident.assigned_to_id,
             incident = incident,
-            message = f"Your incident '{incident.title}' status changed from {incident.get_status_display()} to {dict(incident.STATUS_CHOICES)[new_status]}",
-            notification_type = 'status_change'
+            message = f"You have been assigned to incident: {incident.title}",
+            notification_type = 'assigned'
         )
+        for incident in incidents
+        if incident.assigned_to_id
+    ])
 
 def notify_manager_assignment(incident, manager):
     """
     Notify a manager when they are assigned to an incident.
     """
-    create_notification(
-        user = manager,
+    create_notifications(
+        user_ids = [manager.pk],
         incident = incident,
         message = f"You have been assigned to incident: {incident.title}",
         notification_type = 'assigned'
-    )
\ No newline at end of file
+    )
+
+
+# Background jobs
+# The views queue these instead of writing notifications during the request;
+# `manage.py run_worker` runs them (see jobs.py).
+
+@job('notify_new_incident')
+def notify_new_incident_job(incident_id):
+    incident = Incident.objects.filter(pk=incident_id).first()
+    # the incident may have been deleted before the worker got to it
+    if incident:
+        notify_managers_new_incident(incident)
+
+@job('notify_status_change')
+def notify_status_change_job(incident_id, old_status, new_status):
+    incident = Incident.objects.filter(pk=incident_id).first()
+    if incident:
+        notify_reporter_status_change(incident, old_status, new_status)
+
+@job('notify_assignment')
+def notify_assignment_job(incident_id, manager_id):
+    incident = Incident.objects.filter(pk=incident_id).first()
+    manager = User.objects.filter(pk=manager_id).first()
+    if incident and manager:
+        notify_manager_assignment(incident, manager)
+
+def queue_new_incident_notifications(incident):
+    """
+    Queue the "new incident" notifications for all managers.
+    """
+    enqueue('notify_new_incident', {'incident_id': incident.pk}, idempotency_key=f'new_incident:{incident.pk}')
+
+def queue_status_change_notification(incident, old_status, new_status):
+    # one notification per saved version, however often the request is retried
+    enqueue(
+        'notify_status_change', {'incident_id': incident.pk, 'old_status': old_status, 'new_status': new_status},
+        idempotency_key=f'status:{incident.pk}:{incident.version}',
+    )
+
+def queue_assignment_notification(incident, manager):
+    enqueue(
+        'notify_assignment', {'incident_id': incident.pk, 'manager_id': manager.pk},
+        idempotency_key=f'assignment:{incident.pk}:{incident.version}',
+    )
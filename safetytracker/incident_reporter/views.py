@@ -1,67 +1,114 @@
+import hashlib
+from datetime import date, timedelta
+
 from django.shortcuts import render, redirect, get_object_or_404
-from django.db.models import Q, Count
-from .models import Incident, Notification
+from django.db import transaction
+from django.db.models import Count, Max
+from .models import Incident, IncidentConflict, Notification
 from django.contrib.auth.decorators import login_required
 from users.decorators import manager_required
-from . import forms
-from .utils import notify_managers_new_incident, notify_reporter_status_change, notify_manager_assignment
-from datetime import datetime, timedelta
-from django.utils import timezone
+from . import exports, forms, history, live, rollups, trends
+from .utils import (
+    queue_new_incident_notifications, queue_status_change_notification, queue_assignment_notification,
+    mark_notifications_read, get_unread_count, stored_unread_count,
+)
+from .images import queue_banner_processing
+from .pagination import KeysetPaginator, RankedPaginator, get_page_size
+from .search import get_search_backend
 from django.contrib import messages
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+from asgiref.sync import sync_to_async
+from django.utils import timezone
 
 def incident_list(request):
     """
     Display a list of all incidents with optional filtering and search.
+
+    Results are paged with a (date, id) cursor so the cost of a page does
+    not grow with the size of the incident table. Search results come best
+    match first instead.
     """
-    incidents = Incident.objects.all().order_by('-date')
     filter_form = forms.IncidentFilterForm(request.GET)
-    
-    # Apply filters if form is valid
-    if filter_form.is_valid():
-        search = filter_form.cleaned_data.get('search')
-        status = filter_form.cleaned_data.get('status')
-        reporter = filter_form.cleaned_data.get('reporter')
-        assigned_to = filter_form.cleaned_data.get('assigned_to')
-        date_from = filter_form.cleaned_data.get('date_from')
-        date_to = filter_form.cleaned_data.get('date_to')
-        
-        if search:
-            incidents = incidents.filter(
-                # find all incidents where the title ** OR ** the body cotains the search term
-                Q(title__icontains=search) | Q(body__icontains=search)
-            )
-        
-        if status:
-            incidents = incidents.filter(status=status)
-        
-        if reporter:
-            incidents = incidents.filter(reporter=reporter)
-        
-        if assigned_to:
-            incidents = incidents.filter(assigned_to=assigned_to)
-        
-        if date_from:
-            incidents = incidents.filter(date__gte=date_from)
-        
-        if date_to:
-            # Add one day to include the entire end date
-            date_to_end = datetime.combine(date_to, datetime.max.time())
-            incidents = incidents.filter(date__lte=date_to_end)
+    incidents = filter_form.filter_queryset(
+        Incident.objects.select_related('reporter', 'assigned_to'), ranked=True,
+    )
+
+    search = filter_form.cleaned_data.get('search') if filter_form.is_valid() else None
+    paginator_class = RankedPaginator if search else KeysetPaginator
+    paginator = paginator_class(incidents, page_size=get_page_size(request))
+    page = paginator.get_page(request.GET.get('cursor'))
+
+    # highlighted matches for the cards on this page only
+    if search:
+        snippets = get_search_backend().snippets([i.id for i in page], search)
+        for i in page:
+            i.search_snippet = snippets.get(i.id)
     
     context = {
-        'incident': incidents,
+        'incident': page,
+        'page': page,
         'filter_form': filter_form,
-        'total_count': incidents.count(),
+        'total_count': page.count,
     }
     
     return render(request, 'incident_reporter/incident_list.html', context)
 
+@manager_required(redirect_url='/incident_reporter/')
+def incident_export(request):
+    """
+    Download every incident matching the incident_list filters as CSV
+    (?format=csv, the default) or JSON Lines (?format=jsonl).
+
+    The file is streamed while it is read from the database, so large
+    exports start straight away and don't pile up in memory.
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in exports.EXPORT_FORMATS:
+        export_format = 'csv'
+    content_type, extension = exports.EXPORT_FORMATS[export_format]
+
+    filter_form = forms.IncidentFilterForm(request.GET)
+    incidents = filter_form.filter_queryset(Incident.objects.all())
+    rows = exports.export_rows(incidents, chunk_size=settings.INCIDENT_EXPORT_CHUNK_SIZE)
+
+    response = StreamingHttpResponse(exports.export_lines(rows, export_format), content_type=content_type)
+    filename = f'incidents-{timezone.now():%Y-%m-%d}.{extension}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+def incident_etag(request, slug):
+    """
+    ETag for incident_page: the incident's version plus what the navbar
+    shows about the viewer (who they are, their role and unread count, and
+    the CSRF token in the logout form, which changes when they log in again
+    along with the session key).
+    """
+    version = Incident.objects.filter(slug=slug).values_list('version', flat=True).first()
+    if version is None:
+        return None
+    viewer = ''
+    if request.user.is_authenticated:
+        viewer = f'{request.user.pk}-{request.role}-{get_unread_count(request.user)}-{request.session.session_key}'
+    # hashed so the session key doesn't end up in a response header
+    return f'{version}-' + hashlib.md5(viewer.encode(), usedforsecurity=False).hexdigest()
+
+@condition(etag_func=incident_etag)
 def incident_page(request, slug):
     """
     Display the details of a single incident identified by its slug.
+
+    Browsers revalidate with If-None-Match and get an empty 304 as long as
+    the incident hasn't been saved since (see incident_etag).
     """
-    incident = get_object_or_404(Incident, slug=slug)
-    return render(request, 'incident_reporter/incident_page.html', {'incident':incident})
+    incident = get_object_or_404(Incident.objects.select_related('reporter', 'assigned_to'), slug=slug)
+    response = render(request, 'incident_reporter/incident_page.html', {'incident':incident})
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 @login_required(login_url='/users/login/')
 def incident_new(request):
@@ -80,8 +127,9 @@ def incident_new(request):
             newincident.reporter = request.user
             newincident.save()
             
-            # Notify all managers about the new incident
-            notify_managers_new_incident(newincident)
+            # Queue the notifications for all managers and the photo resizing (done by the background worker)
+            queue_new_incident_notifications(newincident)
+            queue_banner_processing(newincident)
             
             # Show success message
             messages.success(request, f'Incident "{newincident.title}" has been reported successfully. A manager will review it soon.')
@@ -97,22 +145,35 @@ def incident_update_status(request, slug):
     """
     Allow managers to update the status of an incident.
     """
-    incident = get_object_or_404(Incident, slug=slug)
+    incident = get_object_or_404(Incident.objects.select_related('reporter', 'assigned_to'), slug=slug)
     old_status = incident.status
     old_assigned_to = incident.assigned_to
     
     if request.method == 'POST':
         form = forms.UpdateIncidentStatus(request.POST, instance=incident)
         if form.is_valid():
-            updated_incident = form.save()
+            try:
+                with transaction.atomic():
+                    updated_incident = form.save()
+                    old_assigned_to_id = old_assigned_to.pk if old_assigned_to else None
+                    history.record_changes([(updated_incident, old_status, old_assigned_to_id)], actor=request.user)
+            except IncidentConflict:
+                # somebody else saved it first: show them what it looks like
+                # now, with a form for the current version
+                incident = get_object_or_404(Incident.objects.select_related('reporter', 'assigned_to'), slug=slug)
+                return render(request, 'incident_reporter/incident_update_status.html', {
+                    'form': forms.UpdateIncidentStatus(instance=incident),
+                    'incident': incident,
+                    'conflict': True,
+                }, status=409)
             
             # Notify reporter if status changed
             if old_status != updated_incident.status:
-                notify_reporter_status_change(updated_incident, old_status, updated_incident.status)
+                queue_status_change_notification(updated_incident, old_status, updated_incident.status)
             
             # Notify manager if they were newly assigned
             if updated_incident.assigned_to and updated_incident.assigned_to != old_assigned_to:
-                notify_manager_assignment(updated_incident, updated_incident.assigned_to)
+                queue_assignment_notification(updated_incident, updated_incident.assigned_to)
             
             messages.success(request, f'Incident status updated successfully.')
             return redirect('incident:page', slug=slug)
@@ -131,54 +192,91 @@ def manager_dashboard(request):
     """
     incidents = Incident.objects.all()
     
-    # Basic stats
-    stats = {
-        'total': incidents.count(),
-        'new': incidents.filter(status='new').count(),
-        'in_progress': incidents.filter(status='in_progress').count(),
-        'resolved': incidents.filter(status='resolved').count(),
-        'closed': incidents.filter(status='closed').count(),
-    }
+    # Basic stats (status counts + last 7 days), read from the pre-computed
+    # rollups, or counted live with one conditional aggregate query
+    if settings.INCIDENT_DASHBOARD_ROLLUPS:
+        stats = rollups.dashboard_stats(days=7)
+    else:
+        stats = rollups.live_dashboard_stats(incidents, days=7)
     
     # Get incidents by priority
-    new_incidents = incidents.filter(status='new').order_by('-date')[:5]
-    in_progress_incidents = incidents.filter(status='in_progress').order_by('-date')[:5]
+    cards = incidents.select_related('reporter', 'assigned_to')
+    new_incidents = cards.filter(status='new').order_by('-date')[:5]
+    in_progress_incidents = cards.filter(status='in_progress').order_by('-date')[:5]
     
     # Get incidents assigned to current manager
-    my_assigned = incidents.filter(assigned_to=request.user).exclude(status='closed')
-    
-    # Recent activity (last 7 days)
-    seven_days_ago = timezone.now() - timedelta(days=7)
-    recent_incidents = incidents.filter(date__gte=seven_days_ago).count()
+    # (evaluated here so the template's length check doesn't run a second COUNT query)
+    my_assigned = list(cards.filter(assigned_to=request.user).exclude(status='closed'))
     
     # Incidents by reporter (top 5)
-    top_reporters = (
-        incidents.values('reporter__username')
-        .annotate(count=Count('id'))
-        .order_by('-count')[:5]
-    )
+    if settings.INCIDENT_DASHBOARD_ROLLUPS:
+        top_reporters = rollups.top_reporters(limit=5)
+    else:
+        top_reporters = (
+            incidents.values('reporter__username')
+            .annotate(count=Count('id'))
+            .order_by('-count')[:5]
+        )
     
     context = {
         'stats': stats,
         'new_incidents': new_incidents,
         'in_progress_incidents': in_progress_incidents,
         'my_assigned': my_assigned,
-        'recent_incidents': recent_incidents,
+        'recent_incidents': stats['recent'],
         'top_reporters': top_reporters,
     }
     
     return render(request, 'incident_reporter/manager_dashboard.html', context)
 
+def incident_trends(request):
+    """
+    Incidents reported per ?period=day|week|month (default week), as JSON
+    series for the trend charts: one 'total' series, or one per status or
+    reporter with ?group_by=status|reporter (the ?top=10 busiest reporters,
+    the rest summed up as 'other'). ?since=YYYY-MM-DD picks the first bucket,
+    by default the last 90 days, 52 weeks or 24 months are returned.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Login required.'}, status=401)
+    if request.role != 'manager':
+        return JsonResponse({'error': 'Managers only.'}, status=403)
+
+    period = request.GET.get('period', 'week')
+    group_by = request.GET.get('group_by', '')
+    if period not in trends.PERIODS:
+        return JsonResponse({'error': 'period must be day, week or month.'}, status=400)
+    if group_by not in trends.GROUPS:
+        return JsonResponse({'error': 'group_by must be status or reporter.'}, status=400)
+    try:
+        top = min(max(int(request.GET.get('top', 10)), 1), 50)
+        since = date.fromisoformat(request.GET['since']) if request.GET.get('since') else None
+    except ValueError:
+        return JsonResponse({'error': 'since must be a YYYY-MM-DD date and top a number.'}, status=400)
+
+    today = timezone.now().date()
+    if since is not None and not today - timedelta(days=trends.MAX_BUCKETS) < since <= today:
+        return JsonResponse({'error': f'since must be in the last {trends.MAX_BUCKETS} days.'}, status=400)
+
+    response = JsonResponse(trends.trend_series(period, group_by, since, today=today, top=top))
+    # the open bucket changes as incidents come in, the browser may keep it for a minute
+    patch_cache_control(response, private=True, max_age=60)
+    return response
+
 @login_required(login_url='/users/login/')
 def my_incidents(request):
     """
     Display incidents reported by the current user.
     """
-    incidents = Incident.objects.filter(reporter=request.user).order_by('-date')
+    incidents = Incident.objects.filter(reporter=request.user).select_related('assigned_to')
+
+    paginator = KeysetPaginator(incidents, page_size=get_page_size(request))
+    page = paginator.get_page(request.GET.get('cursor'))
     
     context = {
-        'incident': incidents,
-        'total_count': incidents.count(),
+        'incident': page,
+        'page': page,
+        'total_count': page.count,
     }
     
     return render(request, 'incident_reporter/my_incidents.html', context)
@@ -189,7 +287,7 @@ def notifications_list(request):
     Display all notifications for the current user.
     """
     notifications = Notification.objects.filter(user=request.user)
-    unread_count = notifications.filter(is_read=False).count()
+    unread_count = get_unread_count(request.user)
     
     context = {
         'notifications': notifications,
@@ -203,9 +301,10 @@ def mark_notification_read(request, notification_id):
     """
     Mark a notification as read and redirect to the incident page.
     """
-    notification = get_object_or_404(Notification, id=notification_id, user=request.user)
-    notification.is_read = True
-    notification.save()
+    notification = get_object_or_404(
+        Notification.objects.select_related('incident'), id=notification_id, user=request.user
+    )
+    mark_notifications_read(request.user, Notification.objects.filter(pk=notification.pk))
     
     return redirect('incident:page', slug=notification.incident.slug)
 
@@ -215,6 +314,92 @@ def mark_all_notifications_read(request):
     Mark all notifications for the current user as read.
     """
     if request.method == 'POST':
-        Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+        mark_notifications_read(request.user, Notification.objects.filter(user=request.user))
     
-    return redirect('incident:notifications')
\ No newline at end of file
+    return redirect('incident:notifications')
+
+def notifications_etag(request):
+    """
+    ETag for notifications_api: it changes when the user gets a new
+    notification or their unread count changes (something was read), and
+    differs per ?after= cursor and page size, as each is a different page.
+    """
+    if not request.user.is_authenticated:
+        return None
+    try:
+        after = max(int(request.GET.get('after', 0)), 0)
+    except ValueError:
+        # the view answers with a 400
+        return None
+    latest = Notification.objects.filter(user=request.user).aggregate(latest=Max('id'))['latest'] or 0
+    return f'{after}-{settings.NOTIFICATION_API_PAGE_SIZE}-{latest}-{get_unread_count(request.user)}'
+
+@condition(etag_func=notifications_etag)
+def notifications_api(request):
+    """
+    JSON list of the current user's notifications newer than ?after=<id>
+    (all of them, oldest first, without it), plus the unread count.
+
+    Clients poll it with the returned cursor as ?after= and If-None-Match;
+    while nothing has changed the answer is an empty 304.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Login required.'}, status=401)
+
+    try:
+        after = max(int(request.GET.get('after', 0)), 0)
+    except ValueError:
+        return JsonResponse({'error': 'after must be a notification id.'}, status=400)
+
+    limit = settings.NOTIFICATION_API_PAGE_SIZE
+    rows = list(
+        Notification.objects.filter(user=request.user, id__gt=after)
+        .order_by('id')
+        .values('id', 'message', 'notification_type', 'is_read', 'created_at', 'incident__slug')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    notifications = [
+        {
+            'id': row['id'],
+            'message': row['message'],
+            'type': row['notification_type'],
+            'is_read': row['is_read'],
+            'created_at': row['created_at'],
+            'incident': row['incident__slug'],
+            'url': reverse('incident:mark-notification-read', args=[row['id']]),
+        }
+        for row in rows
+    ]
+    response = JsonResponse({
+        'notifications': notifications,
+        'unread_count': get_unread_count(request.user),
+        'cursor': rows[-1]['id'] if rows else after,
+        'has_more': has_more,
+    })
+    # the browser/tablet may keep it, but has to check back with the ETag every time
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@login_required(login_url='/users/login/')
+async def notification_stream(request):
+    """
+    Server-Sent Events stream of the current user's new notifications and
+    unread count (see live.py). Only served through ASGI.
+    """
+    # the stream keeps its connection open as long as the page is, under WSGI
+    # that would tie up a whole worker per open tab
+    if not settings.LIVE_NOTIFICATIONS or not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    response = StreamingHttpResponse(
+        # the profile loaded with the user is older than the subscription, ask the database
+        live.event_stream(user.pk, lambda: sync_to_async(stored_unread_count)(user.pk)),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/5.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,11 +42,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # does nothing unless INSTRUMENTATION_ENABLED, see the end of this file
+    'incident_reporter.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.RoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -54,7 +58,8 @@ ROOT_URLCONF = 'safetytracker.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render timing for InstrumentationMiddleware
+        'BACKEND': 'incident_reporter.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -63,6 +68,8 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'incident_reporter.context_processors.unread_notifications',
+                'incident_reporter.context_processors.fragment_cache',
+                'incident_reporter.context_processors.static_assets',
             ],
         },
     },
@@ -73,18 +80,75 @@ WSGI_APPLICATION = 'safetytracker.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# Configured from the environment, compare the profiles with `manage.py bench_writes`:
+#   SAFETYTRACKER_DB_ENGINE         sqlite (default) or postgres
+#   SAFETYTRACKER_DB_NAME           SQLite file or Postgres database
+#   SAFETYTRACKER_DB_USER, _PASSWORD, _HOST, _PORT     Postgres only
+#   SAFETYTRACKER_DB_CONN_MAX_AGE   seconds to keep a Postgres connection for the next request (default 60)
+#   SAFETYTRACKER_DB_POOL           max size of a psycopg connection pool (needs psycopg[pool]), use this
+#                                   instead of CONN_MAX_AGE when serving through ASGI, which doesn't reuse
+#                                   persistent connections
+#   SAFETYTRACKER_SQLITE_TUNING     0 for SQLite's defaults (rollback journal, full sync, deferred transactions)
+#
+# SQLite is tuned for concurrent writers: WAL lets readers carry on while
+# somebody writes, synchronous=NORMAL only syncs at checkpoints (safe in WAL
+# mode, a power cut can lose the last commits but never corrupt the file),
+# busy_timeout waits up to 5s for the write lock instead of failing with
+# "database is locked", and IMMEDIATE transactions take the write lock up front so two
+# transactions can't deadlock upgrading from a read lock.
+# The journal mode is stored in the database file itself, so WAL (and with it
+# synchronous=NORMAL) is only switched on for a database named with
+# SAFETYTRACKER_DB_NAME, never for the db.sqlite3 checked into git.
+
+DB_ENGINE = os.environ.get('SAFETYTRACKER_DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('SAFETYTRACKER_DB_NAME', 'safetytracker'),
+            'USER': os.environ.get('SAFETYTRACKER_DB_USER', ''),
+            'PASSWORD': os.environ.get('SAFETYTRACKER_DB_PASSWORD', ''),
+            'HOST': os.environ.get('SAFETYTRACKER_DB_HOST', ''),
+            'PORT': os.environ.get('SAFETYTRACKER_DB_PORT', ''),
+            'CONN_MAX_AGE': int(os.environ.get('SAFETYTRACKER_DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
     }
-}
+    if os.environ.get('SAFETYTRACKER_DB_POOL'):
+        # the pool keeps the connections, Django has to close (= return) them after each request
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': 2,
+            'max_size': int(os.environ['SAFETYTRACKER_DB_POOL']),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SAFETYTRACKER_DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('SAFETYTRACKER_SQLITE_TUNING', '1') != '0':
+        pragmas = 'PRAGMA busy_timeout=5000;'
+        if os.environ.get('SAFETYTRACKER_DB_NAME'):
+            pragmas = 'PRAGMA journal_mode=WAL;PRAGMA synchronous=NORMAL;' + pragmas
+        DATABASES['default']['OPTIONS'] = {
+            # run on every new connection
+            'init_command': pragmas,
+            'transaction_mode': 'IMMEDIATE',
+        }
 
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
+# loads the user's Profile along with the user, see users/backends.py
+AUTHENTICATION_BACKENDS = ['users.backends.ProfileBackend']
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -123,8 +187,194 @@ STATIC_ROOT = str(BASE_DIR / 'assets')
 MEDIA_ROOT = str(BASE_DIR / 'media')
 STATICFILES_DIRS = [str(BASE_DIR / 'static')]
 
+# collectstatic saves content-hashed copies, purges the vendored Bootstrap CSS
+# and writes .gz/.br copies, see safetytracker/static_build.py
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'safetytracker.static_build.StaticBuildStorage',
+    },
+}
+
+# stylesheets cut down to the classes the project uses, and classes to keep
+# that no file mentions (Bootstrap's JavaScript and message tags add them)
+STATIC_PURGE_CSS = ['vendor/bootstrap/bootstrap.min.css', 'vendor/bootstrap-icons/bootstrap-icons.min.css']
+STATIC_PURGE_SAFELIST = [
+    'show', 'showing', 'hiding', 'collapse', 'collapsing', 'collapsed', 'fade', 'active', 'disabled',
+    'alert-debug', 'alert-info', 'alert-success', 'alert-warning', 'alert-error', 'alert-danger',
+]
+
+# resized copies of static images for srcsets, made by `manage.py build_image_variants`
+STATIC_IMAGE_VARIANTS = {
+    'images/safety-workers.jpg': [640, 1280, 1920],
+}
+
+# Serve the collected static files from Django (safetytracker.static_build.serve_static),
+# with far-future caching for hashed names, where no web server does it.
+SERVE_STATIC = os.environ.get('SAFETYTRACKER_SERVE_STATIC') == '1'
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Incident list pagination
+# Lists are paged with a (date, id) cursor. INCIDENT_COUNT_MODE can be 'exact',
+# 'approximate' (count stops at INCIDENT_APPROXIMATE_COUNT_LIMIT) or 'none'.
+
+INCIDENT_PAGE_SIZE = 25
+INCIDENT_MAX_PAGE_SIZE = 100
+INCIDENT_COUNT_MODE = 'exact'
+INCIDENT_APPROXIMATE_COUNT_LIMIT = 1000
+
+
+# Incident search
+# Dotted path to a backend in incident_reporter.search. None picks one from the
+# database: SQLite FTS5, Postgres tsvector, or plain LIKE scans as a fallback.
+
+INCIDENT_SEARCH_BACKEND = None
+
+
+# Manager dashboard
+# Read the dashboard counts from the IncidentRollup table (kept up to date as
+# incidents change) instead of counting the incident table on every load.
+
+INCIDENT_DASHBOARD_ROLLUPS = True
+# past buckets of the trends JSON (incident_reporter/trends.py) stay cached this
+# long; they are dropped as soon as one of their incidents changes anyway
+INCIDENT_TREND_CACHE_TIMEOUT = 24 * 3600     # seconds
+
+
+# Notifications
+# Fan-out to many recipients is written with bulk INSERTs of this many rows.
+
+NOTIFICATION_BATCH_SIZE = 500
+
+
+# Background jobs (incident_reporter/jobs.py)
+# Notifications are queued and sent by `python manage.py run_worker`.
+# JOBS_RUN_EAGERLY runs them inside the request instead (no worker needed).
+
+JOBS_RUN_EAGERLY = False
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 10        # seconds before the first retry, doubled each time
+JOB_LOCK_TIMEOUT = 300      # seconds before a 'running' job is assumed lost and retried
+
+
+# Incident banner photos (incident_reporter/images.py)
+# The worker strips EXIF data from uploads, fixes their orientation and saves
+# WebP/JPEG copies at these widths for srcset.
+
+INCIDENT_BANNER_WIDTHS = [320, 640, 1024]
+INCIDENT_BANNER_QUALITY = 80
+
+
+# Incident export (incident_reporter/exports.py)
+# Rows fetched from the database per round trip while streaming an export.
+
+INCIDENT_EXPORT_CHUNK_SIZE = 2000
+
+
+# Live notifications (incident_reporter/live.py)
+# Pushes new notifications to open pages over Server-Sent Events. Needs the site
+# served through ASGI (e.g. `uvicorn safetytracker.asgi:application`), so it is
+# off by default. InProcessBroker only reaches pages served by the process that
+# created the notification; with a separate worker or several processes use
+# 'incident_reporter.live.RedisBroker' (pip install redis).
+
+LIVE_NOTIFICATIONS = False
+NOTIFICATION_BROKER = 'incident_reporter.live.InProcessBroker'
+NOTIFICATION_REDIS_URL = 'redis://localhost:6379/0'
+NOTIFICATION_STREAM_HEARTBEAT = 15     # seconds between keep-alive comments
+
+
+# Notifications JSON API (notifications/api/)
+# Most notifications returned by one poll.
+
+NOTIFICATION_API_PAGE_SIZE = 100
+
+
+# Notification retention (incident_reporter/retention.py, `manage.py purge_notifications`)
+# Read notifications are deleted after NOTIFICATION_READ_TTL_DAYS; unread ones
+# are kept forever unless NOTIFICATION_UNREAD_TTL_DAYS is set.
+
+NOTIFICATION_READ_TTL_DAYS = 90
+NOTIFICATION_UNREAD_TTL_DAYS = None
+NOTIFICATION_PURGE_BATCH_SIZE = 500
+
+
+# Caching
+# Rendered incident cards and incident pages are cached per incident and keyed
+# by Incident.updated: saving an incident makes its old copies unreachable, so
+# nothing has to be deleted and each process can keep its own local memory
+# cache. Set SAFETYTRACKER_CACHE_DIR to share a file based cache between
+# processes instead.
+
+# Django's default of 300 entries is less than a year of daily trend buckets
+CACHE_MAX_ENTRIES = 20000
+
+if os.environ.get('SAFETYTRACKER_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['SAFETYTRACKER_CACHE_DIR'],
+            'OPTIONS': {'MAX_ENTRIES': CACHE_MAX_ENTRIES},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'safetytracker',
+            'OPTIONS': {'MAX_ENTRIES': CACHE_MAX_ENTRIES},
+        }
+    }
+
+INCIDENT_FRAGMENT_CACHE_TIMEOUT = 600     # seconds
+# the list of managers behind the assign / filter dropdowns, see users/directory.py
+USER_DIRECTORY_CACHE_TIMEOUT = 300        # seconds
+# usernames per page of the reporter autocomplete
+USER_AUTOCOMPLETE_PAGE_SIZE = 20
+
+
+# Request instrumentation (incident_reporter/instrumentation.py)
+# Set SAFETYTRACKER_INSTRUMENTATION=1 to time every request (totals per view at
+# /metrics) and profile INSTRUMENTATION_SAMPLE_RATE of them in detail: database
+# time, query count, the slowest statements and template render time, one JSON
+# line each in SAFETYTRACKER_REQUEST_LOG. /metrics is open to staff users and to
+# scrapers sending "Authorization: Bearer $SAFETYTRACKER_METRICS_TOKEN".
+
+INSTRUMENTATION_ENABLED = os.environ.get('SAFETYTRACKER_INSTRUMENTATION') == '1'
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('SAFETYTRACKER_INSTRUMENTATION_SAMPLE_RATE', 0.01))
+INSTRUMENTATION_SLOWEST_QUERIES = 5     # statements kept per profiled request
+INSTRUMENTATION_METRICS_TOKEN = os.environ.get('SAFETYTRACKER_METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'request_log': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.environ.get('SAFETYTRACKER_REQUEST_LOG', str(BASE_DIR / 'requests.log')),
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            # no empty file unless something is logged
+            'delay': True,
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'safetytracker.requests': {
+            'handlers': ['request_log'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,274 @@
+import gzip
+import mimetypes
+import os
+import re
+from functools import cache
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:     # optional, pip install brotli
+    brotli = None
+
+# The collectstatic build stage.
+#
+# StaticBuildStorage is Django's ManifestStaticFilesStorage (every file also
+# saved under a name with a hash of its contents, {% static %} pointing at
+# those) with two steps around the hashing:
+#
+#   - before: the vendored Bootstrap stylesheets (STATIC_PURGE_CSS) lose every
+#     rule whose selectors need a class that no template, form or script in
+#     the project mentions
+#   - after: text files get .gz (and .br, with brotli installed) copies next
+#     to them, for web servers that serve precompressed files and for
+#     serve_static() below
+#
+# Until collectstatic has been run (development, the tests) {% static %}
+# gives plain, unhashed URLs.
+
+COMPRESSED_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.map', '.xml', '.html', '.ttf', '.eot')
+# smaller files hardly shrink, and the headers cost more than that
+COMPRESS_MIN_SIZE = 512
+
+# a class name somewhere in a template, .py or .js file
+CLASS_TOKEN = re.compile(r'[A-Za-z][\w-]*')
+SELECTOR_CLASS = re.compile(r'\.(-?[_a-zA-Z][\w-]*)')
+# block at-rules whose contents are rules of their own
+NESTED_AT_RULES = ('@media', '@supports', '@layer', '@container')
+
+VENDORED_BOOTSTRAP = 'vendor/bootstrap/bootstrap.min.css'
+
+
+@cache
+def vendored_static():
+    """
+    Whether Bootstrap has been vendored (`manage.py vendor_static`), so the
+    layout can load it from our static files rather than the CDN.
+    """
+    return finders.find(VENDORED_BOOTSTRAP) is not None
+
+
+def used_class_names(root=None):
+    """
+    Every word in the project's templates, Python and JavaScript that could
+    be a class name. Far more than are really used, which only means a rule
+    is kept that could have gone.
+    """
+    root = root or settings.BASE_DIR
+    skip = {settings.STATIC_ROOT, os.path.join(root, 'static', 'vendor'), os.path.join(root, 'media')}
+    names = set(settings.STATIC_PURGE_SAFELIST)
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = [d for d in subdirectories if os.path.join(directory, d) not in skip and not d.startswith('.')]
+        for filename in files:
+            # the tests don't render anything
+            if filename.endswith(('.html', '.py', '.js')) and not filename.startswith('test'):
+                with open(os.path.join(directory, filename), encoding='utf-8', errors='ignore') as file:
+                    names.update(CLASS_TOKEN.findall(file.read()))
+    return names
+
+
+def split_top_level(text, separator):
+    """
+    Split on `separator` outside of (), [] and quotes.
+    """
+    parts, depth, quote, start = [], 0, None, 0
+    for position, char in enumerate(text):
+        if quote:
+            if char == quote and text[position - 1] != '\\':
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == separator and not depth:
+            parts.append(text[start:position])
+            start = position + 1
+    parts.append(text[start:])
+    return parts
+
+
+def block_end(css, start):
+    """
+    Index of the } closing the block whose { is at `start`.
+    """
+    depth, quote, position = 0, None, start
+    while position < len(css):
+        char = css[position]
+        if quote:
+            if char == '\\':
+                position += 1
+            elif char == quote:
+                quote = None
+        elif css.startswith('/*', position):
+            position = css.index('*/', position) + 1
+        elif char in '"\'':
+            quote = char
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if not depth:
+                return position
+        position += 1
+    raise ValueError('Unbalanced braces in stylesheet')
+
+
+def purge_css(css, keep):
+    """
+    `css` without the style rules that only apply to elements with a class
+    that isn't in `keep`. Selectors without classes, @font-face, @keyframes
+    and the like are left alone.
+    """
+    output, position = [], 0
+    while position < len(css):
+        if css.startswith('/*', position):
+            position = css.index('*/', position) + 2
+            continue
+        brace = css.find('{', position)
+        semicolon = css.find(';', position)
+        if brace == -1:
+            output.append(css[position:])
+            break
+        if css[position:].lstrip().startswith('@') and -1 < semicolon < brace:
+            # @charset, @import, ...
+            output.append(css[position:semicolon + 1])
+            position = semicolon + 1
+            continue
+
+        end = block_end(css, brace)
+        prelude, body = css[position:brace].strip(), css[brace + 1:end]
+        position = end + 1
+        if not prelude:
+            continue
+        if prelude.startswith(NESTED_AT_RULES):
+            inner = purge_css(body, keep)
+            if inner.strip():
+                output.append(f'{prelude}{{{inner}}}')
+        elif prelude.startswith('@'):
+            output.append(f'{prelude}{{{body}}}')
+        else:
+            selectors = [
+                selector for selector in split_top_level(prelude, ',')
+                if all(name in keep for name in SELECTOR_CLASS.findall(selector))
+            ]
+            if selectors:
+                output.append(f"{','.join(s.strip() for s in selectors)}{{{body}}}")
+    return ''.join(output)
+
+
+def compressors():
+    yield '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield '.br', lambda data: brotli.compress(data, quality=11)
+
+
+class StaticBuildStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that also purges the vendored CSS and writes
+    precompressed copies. Falls back to plain names before collectstatic.
+    """
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        # hashing reads from `paths`, the purged copies have to be what it reads
+        paths = dict(paths)
+        yield from self.purge(paths)
+        names = set(paths)
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if isinstance(hashed_name, str):
+                names.add(hashed_name)
+            yield name, hashed_name, processed
+        yield from self.compress(sorted(names))
+
+    def write(self, name, content):
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(content))
+
+    def purge(self, paths):
+        targets = [name for name in settings.STATIC_PURGE_CSS if name in paths]
+        if not targets:
+            return
+        keep = used_class_names()
+        for name in targets:
+            # always from the source, the collected copy may be purged already
+            storage, path = paths[name]
+            with storage.open(path) as file:
+                css = file.read().decode('utf-8')
+            purged = purge_css(css, keep)
+            self.write(name, purged.encode('utf-8'))
+            paths[name] = (self, name)
+            yield name, f'{name} (purged to {len(purged) * 100 // max(len(css), 1)}%)', True
+
+    def compress(self, names):
+        for name in names:
+            if not name.endswith(COMPRESSED_EXTENSIONS) or not self.exists(name):
+                continue
+            with self.open(name) as file:
+                data = file.read()
+            if len(data) < COMPRESS_MIN_SIZE:
+                continue
+            for extension, compress in compressors():
+                packed = compress(data)
+                if len(packed) < len(data) * 0.9:
+                    self.write(name + extension, packed)
+                    yield name, name + extension, True
+
+
+def serve_static(request, path):
+    """
+    Serve a collected static file, for sites without a web server in front
+    (SERVE_STATIC). Hashed names are cached by browsers for a year without
+    asking again, other names are revalidated. Serves the .br or .gz copy
+    when the browser accepts it.
+    """
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except ValueError:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    stat = os.stat(full_path)
+    immutable = path in set(staticfiles_storage.hashed_files.values())
+    if not immutable and not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime):
+        return HttpResponseNotModified()
+
+    accepted = request.headers.get('Accept-Encoding', '')
+    served, encoding = full_path, None
+    for name, extension in (('br', '.br'), ('gzip', '.gz')):
+        if name in accepted and os.path.isfile(full_path + extension):
+            served, encoding = full_path + extension, name
+            break
+
+    content_type, _ = mimetypes.guess_type(full_path)
+    response = FileResponse(
+        open(served, 'rb'), content_type=content_type or 'application/octet-stream',
+        filename=os.path.basename(full_path),
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    patch_vary_headers(response, ['Accept-Encoding'])
+    if immutable:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'public, no-cache'
+        response.headers['Last-Modified'] = http_date(stat.st_mtime)
+    return response
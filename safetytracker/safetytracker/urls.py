@@ -14,11 +14,15 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 from . import views
+from incident_reporter.instrumentation import metrics_view
+from .static_build import serve_static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -26,8 +30,15 @@ urlpatterns = [
     path('welcome', views.homepage, name='homepage'),
     path('incident_reporter/', include('incident_reporter.urls')),
     path('users/', include('users.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
+# Collected static files with far-future caching, where no web server serves them
+if settings.SERVE_STATIC:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')), serve_static),
+    ]
+
 # Serve media and static files in development only
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -14,7 +14,7 @@ def home_view(request):
         return render(request, 'homepage.html')
     
     #if user is a manager, show them the dashboard
-    if request.user.profile.is_manager():
+    if request.role == 'manager':
         return redirect('incident:manager-dashboard')
     
     #if user is an employee, redirect to report incident page
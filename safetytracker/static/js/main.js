@@ -1 +1,73 @@
-console.log("Testing the js")
\ No newline at end of file
+// Live notification badge.
+// layout.html sets data-notification-stream on <body> when live notifications
+// are on; the server then pushes the unread count and every new notification.
+(function () {
+    const url = document.body.dataset.notificationStream;
+    if (!url || !window.EventSource) {
+        return;
+    }
+
+    const badges = document.querySelectorAll('[data-unread-badge]');
+    let unread = 0;
+
+    function showUnread(count) {
+        unread = Math.max(0, count);
+        badges.forEach(function (badge) {
+            badge.textContent = unread;
+            badge.classList.toggle('d-none', unread === 0);
+        });
+    }
+
+    const stream = new EventSource(url);
+
+    // sent first on every (re)connect, so the badge is always back in step
+    stream.addEventListener('unread', function (event) {
+        showUnread(JSON.parse(event.data).count);
+    });
+
+    stream.addEventListener('notification', function () {
+        showUnread(unread + 1);
+    });
+
+    stream.addEventListener('read', function (event) {
+        showUnread(unread - JSON.parse(event.data).marked);
+    });
+})();
+
+// Username suggestions.
+// Inputs with data-autocomplete (the reporter filter on the incident list)
+// fill their <datalist> with the first page of matching usernames as you type.
+(function () {
+    document.querySelectorAll('input[data-autocomplete][list]').forEach(function (input) {
+        const options = document.getElementById(input.getAttribute('list'));
+        let timer = null;
+        let controller = null;
+
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(function () {
+                const query = input.value.trim();
+                if (controller) {
+                    controller.abort();
+                }
+                if (!query) {
+                    options.replaceChildren();
+                    return;
+                }
+                controller = new AbortController();
+                fetch(input.dataset.autocomplete + '?q=' + encodeURIComponent(query), {signal: controller.signal})
+                    .then(function (response) {
+                        return response.ok ? response.json() : {results: []};
+                    })
+                    .then(function (data) {
+                        options.replaceChildren.apply(options, data.results.map(function (user) {
+                            const option = document.createElement('option');
+                            option.value = user.username;
+                            return option;
+                        }));
+                    })
+                    .catch(function () {});
+            }, 200);
+        });
+    });
+})();
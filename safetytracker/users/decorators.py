@@ -1,4 +1,5 @@
 from django.contrib.auth.decorators import user_passes_test, login_required
+from .middleware import get_role
 
 def manager_required(function=None, redirect_url='/'):
     """
@@ -6,9 +7,8 @@ def manager_required(function=None, redirect_url='/'):
     Redirects to the specified URL if the user is not a manager.
     """
     def check_manager(user):
-        if not user.is_authenticated:
-            return False
-        return hasattr(user, 'profile') and user.profile.is_manager()
+        # the profile comes with the user (users.backends.ProfileBackend), no extra query
+        return get_role(user) == 'manager'
     
     actual_decorator = user_passes_test(check_manager, login_url=redirect_url)
 
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+# The user directory behind the incident forms' people pickers.
+#
+# The list of managers (assigned_to on the filter and status forms) is
+# needed on nearly every page but hardly ever changes, so it is kept in the
+# cache and dropped whenever a User or Profile is saved or deleted (see the
+# receivers in models.py). With the default per-process memory cache other
+# processes only notice after USER_DIRECTORY_CACHE_TIMEOUT; set
+# SAFETYTRACKER_CACHE_DIR to share the cache and the invalidation.
+#
+# Reporters can be anybody, far too many for a <select>, so they are looked
+# up by username prefix a page at a time (the user_autocomplete view).
+
+MANAGERS_CACHE_KEY = 'users:directory:managers'
+
+
+def manager_choices():
+    """
+    (id, username) of every manager, ordered by username.
+    """
+    choices = cache.get(MANAGERS_CACHE_KEY)
+    if choices is None:
+        choices = list(
+            User.objects.filter(profile__role='manager').order_by('username').values_list('id', 'username')
+        )
+        cache.set(MANAGERS_CACHE_KEY, choices, settings.USER_DIRECTORY_CACHE_TIMEOUT)
+    return choices
+
+
+def invalidate_directory():
+    cache.delete(MANAGERS_CACHE_KEY)
+
+
+def search_usernames(prefix, after=None, limit=20):
+    """
+    Up to `limit` (id, username) pairs of users whose username starts with
+    `prefix` (case sensitive), in username order, after the username `after`.
+    Returns (rows, has_more).
+    """
+    # a range over the username index rather than LIKE, which neither
+    # SQLite nor Postgres can answer from a plain index
+    users = User.objects.filter(username__gte=prefix, username__lt=prefix + '\U0010ffff')
+    if after:
+        users = users.filter(username__gt=after)
+    rows = list(users.order_by('username').values_list('id', 'username')[:limit + 1])
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,32 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils.functional import SimpleLazyObject
+
+
+def get_role(user):
+    """
+    The user's role ('manager' or 'employee'), or None for anonymous users
+    and users without a Profile.
+    """
+    if not user.is_authenticated:
+        return None
+    try:
+        return user.profile.role
+    except ObjectDoesNotExist:
+        return None
+
+
+class RoleMiddleware:
+    """
+    Sets request.role for views and templates ({% if request.role == 'manager' %}).
+
+    Goes after AuthenticationMiddleware. The Profile is loaded together with
+    the user by users.backends.ProfileBackend, so checking the role doesn't
+    run a query of its own, and it's only looked up when something asks.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.role = SimpleLazyObject(lambda: get_role(request.user))
+        return self.get_response(request)
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:13
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_unread(apps, schema_editor):
+    """
+    Fill the new counter from the notifications that already exist.
+    """
+    Profile = apps.get_model('users', 'Profile')
+    Notification = apps.get_model('incident_reporter', 'Notification')
+    unread = (
+        Notification.objects.filter(user_id=OuterRef('user_id'), is_read=False)
+        .order_by().values('user_id').annotate(n=Count('id')).values('n')
+    )
+    Profile.objects.update(unread_notification_count=Coalesce(Subquery(unread), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('incident_reporter', '0007_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='unread_notification_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_unread, migrations.RunPython.noop),
+    ]
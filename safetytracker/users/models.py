@@ -1,7 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User  # this is not the same as users,  The User class is a django built-in user model
                                             # it is used to handle username, password in my case.
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 class Profile(models.Model):
@@ -12,6 +12,19 @@ class Profile(models.Model):
             # the OnetoOneField creates a 1 to 1 relatioinship between Profile and User.  Each User is assigned to one profile.
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='employee')
+    # denormalized count of unread notifications, kept in step by incident_reporter.utils
+    # so the navbar badge doesn't need a COUNT(*) on every page
+    unread_notification_count = models.PositiveIntegerField(default=0)
+
+    def save(self, *args, **kwargs):
+        # unread_notification_count only changes through F() updates, a full save
+        # of a Profile loaded before the last one would write an old count back
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'unread_notification_count'
+            ]
+        super().save(*args, **kwargs)
 
     def __str__(self):
         # get_role_display() is a django included method that works off the choices attribute seen in role
@@ -39,4 +52,23 @@ def save_user_profile(sender, instance, **kwargs):
     """
     Save the Profile whenever the User is saved.
     """
-    instance.profile.save()
\ No newline at end of file
+    # skip brand new users (the Profile was just created above) and partial saves
+    # like the last_login update Django does on every login, which never touch the Profile
+    if kwargs.get('created') or kwargs.get('update_fields'):
+        return
+    instance.profile.save(update_fields=['role'])
+
+
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=Profile)
+def user_directory_changed(sender, **kwargs):
+    """
+    Drop the cached list of managers (see directory.py) when somebody's
+    username or role may have changed.
+    """
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not {'username', 'role'} & set(update_fields):
+        # e.g. the last_login update on every login
+        return
+    from .directory import invalidate_directory
+    invalidate_directory()
@@ -1,3 +1,121 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from incident_reporter.query_budget import QueryBudgetMixin
+
+from .backends import ProfileBackend
+from .directory import manager_choices
+from .middleware import get_role
+from .models import Profile
+
+
+class AuthViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('boss', password='a-long-password-1')
+        cls.manager.profile.role = 'manager'
+        cls.manager.profile.save()
+
+    def test_login_redirects_by_role(self):
+        response = self.assertViewWithinBudget(
+            'users:login', reverse('users:login'), method='post',
+            data={'username': 'boss', 'password': 'a-long-password-1'},
+        )
+        self.assertRedirects(response, reverse('incident:manager-dashboard'), fetch_redirect_response=False)
+
+    def test_register_logs_in_new_employee(self):
+        response = self.assertViewWithinBudget(
+            'users:register', reverse('users:register'), method='post',
+            data={'username': 'newbie', 'password1': 'a-long-password-1', 'password2': 'a-long-password-1'},
+        )
+        self.assertRedirects(response, reverse('incident:new-incident'), fetch_redirect_response=False)
+        self.assertTrue(User.objects.get(username='newbie').profile.is_employee())
+
+
+class RoleTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('worker', password='a-long-password-1')
+
+    def test_profile_is_loaded_with_the_user(self):
+        backend = ProfileBackend()
+        with self.assertNumQueries(1):
+            user = backend.get_user(self.user.pk)
+            self.assertEqual(get_role(user), 'employee')
+        with self.assertNumQueries(1):
+            user = backend.authenticate(None, username='worker', password='a-long-password-1')
+            self.assertEqual(get_role(user), 'employee')
+
+    def test_role_change_applies_on_next_request(self):
+        self.client.force_login(self.user)
+        self.assertRedirects(self.client.get('/'), reverse('incident:new-incident'), fetch_redirect_response=False)
+        self.assertEqual(self.client.get(reverse('incident:manager-dashboard')).status_code, 302)
+
+        Profile.objects.filter(user=self.user).update(role='manager')
+        self.assertRedirects(self.client.get('/'), reverse('incident:manager-dashboard'), fetch_redirect_response=False)
+        response = self.client.get(reverse('incident:manager-dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.role, 'manager')
+
+    def test_anonymous_user_has_no_role(self):
+        response = self.client.get('/')
+        self.assertIsNone(get_role(response.wsgi_request.user))
+        self.assertFalse(response.wsgi_request.role)
+
+
+class DirectoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('boss', password='pw')
+        cls.manager.profile.role = 'manager'
+        cls.manager.profile.save()
+        for name in ('alice', 'alfred', 'albert', 'bob'):
+            User.objects.create_user(name, password='pw')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_managers_are_cached_until_a_profile_changes(self):
+        self.assertEqual(manager_choices(), [(self.manager.pk, 'boss')])
+        with self.assertNumQueries(0):
+            manager_choices()
+
+        alice = Profile.objects.get(user__username='alice')
+        alice.role = 'manager'
+        alice.save()
+        self.assertEqual([name for _id, name in manager_choices()], ['alice', 'boss'])
+
+    def test_last_login_doesnt_invalidate(self):
+        manager_choices()
+        self.client.login(username='bob', password='pw')
+        with self.assertNumQueries(0):
+            manager_choices()
+
+    def test_autocomplete_pages(self):
+        self.client.force_login(self.manager)
+        url = reverse('users:autocomplete')
+        with self.settings(USER_AUTOCOMPLETE_PAGE_SIZE=2):
+            first = self.client.get(url, {'q': 'al'}).json()
+            self.assertEqual([user['username'] for user in first['results']], ['albert', 'alfred'])
+            second = self.client.get(url, {'q': 'al', 'after': first['next']}).json()
+        self.assertEqual([user['username'] for user in second['results']], ['alice'])
+        self.assertIsNone(second['next'])
+
+    def test_autocomplete_needs_login(self):
+        self.assertEqual(self.client.get(reverse('users:autocomplete'), {'q': 'al'}).status_code, 401)
+
+    def test_incident_list_filters_by_reporter_username(self):
+        from incident_reporter.models import Incident
+        alice = User.objects.get(username='alice')
+        Incident.objects.create(title='Spill', body='Aisle 3', reporter=alice)
+        Incident.objects.create(title='Trip', body='Cable', reporter=self.manager)
+        response = self.client.get(reverse('incident:list'), {'reporter': 'alice'})
+        self.assertContains(response, 'Spill')
+        self.assertNotContains(response, 'Trip')
+        # nobody's username is listed in the page any more, only the managers
+        self.assertNotContains(response, 'albert')
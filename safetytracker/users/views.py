@@ -1,5 +1,8 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, logout
+from django.conf import settings
+from django.http import JsonResponse
+from .directory import search_usernames
 from .forms import StyledUserCreationForm, StyledAuthenticationForm
 
 def register(request):
@@ -61,4 +64,23 @@ def logout_view(request):
     """
     if request.method == 'POST':
         logout(request)
-        return redirect('users:login')
\ No newline at end of file
+        return redirect('users:login')
+
+
+def user_autocomplete(request):
+    """
+    JSON list of users whose username starts with ?q=, for the reporter
+    picker on the incident list: {"results": [{"id", "username"}], "next"}.
+    Pass "next" back as ?after= for the following page (null on the last).
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    prefix = request.GET.get('q', '').strip()
+    if not prefix:
+        return JsonResponse({'results': [], 'next': None})
+    rows, has_more = search_usernames(prefix, after=request.GET.get('after'), limit=settings.USER_AUTOCOMPLETE_PAGE_SIZE)
+    return JsonResponse({
+        'results': [{'id': user_id, 'username': username} for user_id, username in rows],
+        'next': rows[-1][1] if has_more else None,
+    })